@@ -0,0 +1,183 @@
+'''
+Benchmarks chunnel end to end, through a Socket.
+
+Runs against the stand-in server in benchmarks.server, started in this
+process unless --url is given.  Note that an in-process server shares the
+event loop (& CPU) with the client, so absolute numbers are pessimistic -
+run `python -m benchmarks.server` separately & pass its URL for numbers
+closer to the real thing.
+
+Measures:
+
+- push throughput: pushes made with push_nowait, timed until every reply
+  has arrived.
+- push latency: the time from push to reply, for pushes made one at a time.
+- broadcast throughput: broadcasts from the server received on a channel.
+- memory per channel: memory allocated for each joined channel.
+- joins: channels joined one at a time, and with join_many.
+
+With --compression-level, permessage-deflate is used & the compression
+ratios are reported too.
+
+Run with `python -m benchmarks.end_to_end`.
+'''
+import argparse
+import asyncio
+import time
+import tracemalloc
+
+from chunnel.socket import Socket
+from chunnel.transports import (
+    V1JSONSerializer, V2JSONSerializer, DeflateCompression
+)
+
+from .server import PhoenixServer
+
+SERIALIZERS = {
+    'v1': V1JSONSerializer,
+    'v2': V2JSONSerializer
+}
+
+
+def percentile(values, percent):
+    '''
+    Returns a percentile of some sorted values.
+    '''
+    index = min(len(values) - 1, int(len(values) * percent / 100))
+    return values[index]
+
+
+async def push_throughput(socket, count):
+    channel = socket.channel('bench:push', {})
+    await channel.join()
+    start = time.perf_counter()
+    pushes = [
+        channel.push_nowait('echo', {'n': n}, timeout=None)
+        for n in range(count)
+    ]
+    await asyncio.gather(*[push.response() for push in pushes])
+    elapsed = time.perf_counter() - start
+    await channel.leave()
+    print('push throughput:      {:>10.0f} msgs/sec'.format(count / elapsed))
+
+
+async def push_latency(socket, count):
+    channel = socket.channel('bench:latency', {})
+    await channel.join()
+    latencies = []
+    for n in range(count):
+        start = time.perf_counter()
+        push = await channel.push('echo', {'n': n})
+        await push.response()
+        latencies.append(time.perf_counter() - start)
+    await channel.leave()
+
+    latencies.sort()
+    print('push latency:         {}'.format(' '.join(
+        'p{}={:.0f}us'.format(p, percentile(latencies, p) * 1e6)
+        for p in (50, 90, 99)
+    )))
+
+
+async def broadcast_throughput(socket, count):
+    channel = socket.channel('bench:broadcast', {'broadcast_count': count})
+    start = time.perf_counter()
+    await channel.join()
+    received = 0
+    while received < count:
+        received += len(await channel.receive_many(count - received))
+    elapsed = time.perf_counter() - start
+    await channel.leave()
+    print('broadcast throughput: {:>10.0f} msgs/sec'.format(count / elapsed))
+
+
+async def memory_per_channel(socket, count):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    channels = [
+        socket.channel('bench:memory:{}'.format(n), {}) for n in range(count)
+    ]
+    await asyncio.gather(*[channel.join() for channel in channels])
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    allocated = sum(
+        stat.size_diff for stat in after.compare_to(before, 'filename')
+    )
+    print('memory per channel:   {:>10.0f} bytes'.format(allocated / count))
+    await asyncio.gather(*[channel.leave() for channel in channels])
+
+
+async def join_throughput(socket, count):
+    start = time.perf_counter()
+    for n in range(count):
+        await socket.channel('bench:join:{}'.format(n), {}).join()
+    serial = count / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    results = await socket.join_many(
+        ('bench:join_many:{}'.format(n), {}) for n in range(count)
+    )
+    assert not results.failures
+    pipelined = count / (time.perf_counter() - start)
+    print('joins:                {:>10.0f}/sec serial, {:.0f}/sec '
+          'join_many'.format(serial, pipelined))
+
+
+async def run(url, args):
+    compression = None
+    if args.compression_level:
+        compression = DeflateCompression(level=args.compression_level)
+    socket = Socket(
+        url, {},
+        transport_options={
+            'serializer': SERIALIZERS[args.serializer](),
+            'send_batch_size': args.batch_size,
+            'compression': compression
+        },
+        heartbeat_interval=None
+    )
+    async with socket:
+        await push_throughput(socket, args.messages)
+        await push_latency(socket, args.latency_messages)
+        await broadcast_throughput(socket, args.messages)
+        await memory_per_channel(socket, args.channels)
+        await join_throughput(socket, args.channels)
+
+    if compression:
+        print('compression ratio:    sent {:.2f} received {:.2f}'.format(
+            compression.stats.sent_ratio, compression.stats.received_ratio
+        ))
+
+
+async def main(args):
+    if args.url:
+        await run(args.url, args)
+        return
+
+    async with PhoenixServer(reply_delay=args.reply_delay) as server:
+        await run(server.url + '/socket/websocket', args)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument('--url', help='The URL of a server to benchmark')
+    parser.add_argument(
+        '--reply-delay', type=float, default=None,
+        help='Delays replies from the in-process server by this many seconds'
+    )
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--latency-messages', type=int, default=2000)
+    parser.add_argument('--channels', type=int, default=1000)
+    parser.add_argument(
+        '--serializer', choices=sorted(SERIALIZERS), default='v2'
+    )
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument(
+        '--compression-level', type=int, default=0,
+        help='Enables compression at this zlib level'
+    )
+    args = parser.parse_args()
+    asyncio.get_event_loop().run_until_complete(main(args))
@@ -0,0 +1,76 @@
+'''
+Measures the throughput of the websocket transport send loop.
+
+Starts a local websocket server that discards everything it receives, fills
+the outgoing queue with a burst of messages and times how long the transport
+takes to send them all, for a few different batch sizes.
+
+Run with `python -m benchmarks.send_loop`.
+'''
+import argparse
+import asyncio
+import time
+
+import websockets
+
+from chunnel.transports import (
+    WebsocketTransport, TransportMessage, OutgoingTransportMessage
+)
+
+
+async def discard(websocket, *args):
+    async for _ in websocket:
+        pass
+
+
+async def time_burst(url, message_count, batch_size):
+    transport = WebsocketTransport(
+        url, {}, asyncio.Queue(), asyncio.Queue(),
+        send_batch_size=batch_size
+    )
+    transport_task = asyncio.ensure_future(transport.run())
+    await transport.ready
+
+    messages = [
+        OutgoingTransportMessage(
+            TransportMessage('event', 'room:lobby', {'n': n}, n),
+            asyncio.Future()
+        )
+        for n in range(message_count)
+    ]
+    start = time.perf_counter()
+    for message in messages:
+        transport.outgoing.put_nowait(message)
+    await asyncio.gather(*[message.sent for message in messages])
+    elapsed = time.perf_counter() - start
+
+    await transport.stop()
+    await transport_task
+    return elapsed
+
+
+async def main(message_count, batch_sizes, port):
+    server = await websockets.serve(discard, 'localhost', port)
+    url = 'ws://localhost:{}'.format(port)
+    try:
+        for batch_size in batch_sizes:
+            elapsed = await time_burst(url, message_count, batch_size)
+            print('batch_size={:<5} {:>10.0f} msgs/sec'.format(
+                batch_size, message_count / elapsed
+            ))
+    finally:
+        server.close()
+        await server.wait_closed()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--messages', type=int, default=50000)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument(
+        '--batch-sizes', type=int, nargs='+', default=[1, 16, 64, 256]
+    )
+    args = parser.parse_args()
+    asyncio.get_event_loop().run_until_complete(
+        main(args.messages, args.batch_sizes, args.port)
+    )
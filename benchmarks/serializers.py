@@ -0,0 +1,74 @@
+'''
+Compares the encode & decode cost of the available serializers.
+
+Each serializer is timed with the standard library json module, and with any
+faster JSON codecs that happen to be installed (orjson, ujson).  The lazy
+V2 serializer is timed without ever touching the payload, as happens when a
+message is dropped without being read.
+
+Run with `python -m benchmarks.serializers`.
+'''
+import argparse
+import json
+import timeit
+
+from chunnel.transports import (
+    TransportMessage, V1JSONSerializer, V2JSONSerializer
+)
+
+
+def make_payload(size):
+    return {
+        'user': 'someone',
+        'body': 'a message of some sort, that is reasonably long ' * size,
+        'tags': ['one', 'two', 'three'],
+        'count': 12345
+    }
+
+
+def codecs():
+    yield 'json', json
+    for name in ('ujson', 'orjson'):
+        try:
+            yield name, __import__(name)
+        except ImportError:
+            pass
+
+
+def main(number, payload_size):
+    message = TransportMessage(
+        'new_msg', 'room:lobby', make_payload(payload_size), '123', '1'
+    )
+    print('{:<18} {:<7} {:>6} {:>12} {:>12}'.format(
+        'serializer', 'codec', 'bytes', 'encode us', 'decode us'
+    ))
+    serializers = [
+        ('V1JSONSerializer', V1JSONSerializer),
+        ('V2JSONSerializer', V2JSONSerializer),
+        ('V2 lazy', lambda json_codec: V2JSONSerializer(json_codec, True))
+    ]
+    for serializer_name, serializer_class in serializers:
+        for codec_name, codec in codecs():
+            serializer = serializer_class(json_codec=codec)
+            data = serializer.encode(message)
+            encode = timeit.timeit(
+                lambda: serializer.encode(message), number=number
+            )
+            decode = timeit.timeit(
+                lambda: serializer.decode(data), number=number
+            )
+            print('{:<18} {:<7} {:>6} {:>12.2f} {:>12.2f}'.format(
+                serializer_name, codec_name, len(data),
+                encode / number * 1e6, decode / number * 1e6
+            ))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--number', type=int, default=100000)
+    parser.add_argument(
+        '--payload-size', type=int, default=3,
+        help='Roughly how many 50 byte chunks to put in the payload'
+    )
+    args = parser.parse_args()
+    main(args.number, args.payload_size)
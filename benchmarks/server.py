@@ -0,0 +1,209 @@
+'''
+A local stand-in for a phoenix server, for benchmarks & tests.
+
+Speaks enough of the phoenix channel protocol over websockets to exercise
+chunnel end to end, using either the 1.0.0 or 2.0.0 serializer depending on
+the `vsn` the client asks for:
+
+- Joins & leaves are always accepted, and a join is replied to with its
+  params.
+- Heartbeats are replied to.
+- A `shout` is broadcast to every socket that has joined its topic, as in
+  the phoenix test app used by test_against_phoenix.
+- Any other push is replied to with its payload.
+
+Joining with a `broadcast_count` param makes the server broadcast that many
+`broadcast` events to the joining socket, at `broadcast_rate` messages a
+second (from the join params, or the server's default).  A rate of None
+broadcasts as fast as possible.
+
+Binary frames are not supported.
+
+Run with `python -m benchmarks.server`.
+'''
+from urllib.parse import parse_qs, urlsplit
+import argparse
+import asyncio
+import json
+import time
+
+import websockets
+
+__all__ = ['PhoenixServer']
+
+
+class PhoenixServer:
+    '''
+    A websocket server that speaks the phoenix channel protocol.
+
+    :param host:           The host to listen on.
+    :param port:           The port to listen on.  0 picks a free port.
+    :param broadcast_rate: The default number of broadcasts a second for
+                           joins with a broadcast_count.  None means as fast
+                           as possible.
+    :param reply_delay:    Optional number of seconds to delay replies by, to
+                           simulate network latency.
+    '''
+    # The number of unthrottled broadcasts sent between yielding to the
+    # event loop.
+    BROADCAST_CHUNK = 100
+
+    def __init__(self, host='localhost', port=0, broadcast_rate=None,
+                 reply_delay=None):
+        self.host = host
+        self.port = port
+        self.broadcast_rate = broadcast_rate
+        self.reply_delay = reply_delay
+        # topic -> set of connections that have joined it.
+        self.subscribers = {}
+        self._server = None
+
+    @property
+    def url(self):
+        return 'ws://{}:{}'.format(self.host, self.port)
+
+    async def start(self):
+        self._server = await websockets.serve(
+            self._handle, self.host, self.port
+        )
+        if not self.port:
+            self.port = next(iter(self._server.sockets)).getsockname()[1]
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.stop()
+
+    async def _handle(self, websocket, path=None):
+        if path is None:
+            path = websocket.request.path
+        vsn = parse_qs(urlsplit(path).query).get('vsn', ['1.0.0'])[0]
+        connection = _Connection(self, websocket, vsn.startswith('2.'))
+        try:
+            await connection.run()
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            connection.close()
+
+
+class _Connection:
+    '''
+    The server side of a single client connection.
+    '''
+    def __init__(self, server, websocket, v2):
+        self.server = server
+        self.websocket = websocket
+        self.v2 = v2
+        # topic -> join_ref for the channels this connection has joined.
+        self.join_refs = {}
+        self.broadcast_tasks = {}
+
+    async def run(self):
+        async for data in self.websocket:
+            join_ref, ref, topic, event, payload = self.decode(data)
+            if event == 'phx_join':
+                self.join(topic, join_ref or ref, payload)
+                await self.reply(topic, ref, payload)
+            elif event == 'phx_leave':
+                self.leave(topic)
+                await self.reply(topic, ref, {})
+            elif event == 'shout':
+                await self.reply(topic, ref, {})
+                for connection in list(self.server.subscribers.get(topic, ())):
+                    await connection.send(None, None, topic, event, payload)
+            else:
+                await self.reply(topic, ref, payload)
+
+    def close(self):
+        for topic in list(self.join_refs):
+            self.leave(topic)
+
+    def join(self, topic, join_ref, params):
+        self.leave(topic)
+        self.join_refs[topic] = join_ref
+        self.server.subscribers.setdefault(topic, set()).add(self)
+        count = params.get('broadcast_count') if params else None
+        if count:
+            rate = params.get('broadcast_rate', self.server.broadcast_rate)
+            self.broadcast_tasks[topic] = asyncio.ensure_future(
+                self.broadcast(topic, count, rate)
+            )
+
+    def leave(self, topic):
+        self.join_refs.pop(topic, None)
+        self.server.subscribers.get(topic, set()).discard(self)
+        task = self.broadcast_tasks.pop(topic, None)
+        if task:
+            task.cancel()
+
+    async def broadcast(self, topic, count, rate):
+        start = time.perf_counter()
+        for n in range(count):
+            await self.send(None, None, topic, 'broadcast', {'n': n})
+            if rate:
+                # Sleep until the next message is due, so messages are
+                # spread out rather than sent in bursts.
+                delay = start + (n + 1) / rate - time.perf_counter()
+                await asyncio.sleep(max(delay, 0))
+            elif not n % self.server.BROADCAST_CHUNK:
+                await asyncio.sleep(0)
+
+    async def reply(self, topic, ref, response):
+        reply = self.send(
+            self.join_refs.get(topic), ref, topic, 'phx_reply',
+            {'status': 'ok', 'response': response}
+        )
+        if self.server.reply_delay:
+            # Carry on handling messages while this reply is delayed.
+            asyncio.get_event_loop().call_later(
+                self.server.reply_delay, asyncio.ensure_future, reply
+            )
+        else:
+            await reply
+
+    def decode(self, data):
+        if self.v2:
+            return json.loads(data)
+        message = json.loads(data)
+        return (
+            None, message['ref'], message['topic'], message['event'],
+            message['payload']
+        )
+
+    async def send(self, join_ref, ref, topic, event, payload):
+        if self.v2:
+            message = [join_ref, ref, topic, event, payload]
+        else:
+            message = {
+                'topic': topic, 'event': event, 'payload': payload,
+                'ref': ref
+            }
+        await self.websocket.send(json.dumps(message, separators=(',', ':')))
+
+
+async def main(host, port, broadcast_rate, reply_delay):
+    server = PhoenixServer(host, port, broadcast_rate, reply_delay)
+    async with server:
+        print('Listening on {}'.format(server.url))
+        await asyncio.Future()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=4000)
+    parser.add_argument('--broadcast-rate', type=float, default=None)
+    parser.add_argument('--reply-delay', type=float, default=None)
+    args = parser.parse_args()
+    asyncio.get_event_loop().run_until_complete(
+        main(args.host, args.port, args.broadcast_rate, args.reply_delay)
+    )
@@ -0,0 +1,102 @@
+'''
+Measures the per-message cost of the receive/send loop stop mechanism.
+
+Compares wrapping every `queue.get()` in `get_unless_done` (the old way the
+loops checked whether they should stop) with a plain `queue.get()` in a loop
+that is stopped by cancellation.
+
+Run with `python -m benchmarks.stop_mechanism`.
+'''
+import argparse
+import asyncio
+import time
+
+
+class DONE:
+    pass
+
+
+async def get_unless_done(getter_coro, done_future):
+    '''
+    The old chunnel.utils.get_unless_done: runs a get alongside a future
+    that signals we should stop, returning DONE if that happens first.
+    '''
+    getter_future = asyncio.ensure_future(getter_coro)
+    done, pending = await asyncio.wait(
+        (getter_future, done_future), return_when=asyncio.FIRST_COMPLETED
+    )
+    if done_future in done:
+        if not getter_future.done():
+            getter_future.cancel()
+        return DONE
+
+    return await getter_future
+
+
+async def get_unless_done_loop(queue, done):
+    count = 0
+    while True:
+        item = await get_unless_done(queue.get(), done)
+        if item is DONE:
+            return count
+        count += 1
+
+
+async def cancellable_loop(queue, counter):
+    while True:
+        await queue.get()
+        counter[0] += 1
+
+
+async def producer(queue, message_count, chunk_size):
+    for start in range(0, message_count, chunk_size):
+        for n in range(chunk_size):
+            queue.put_nowait(n)
+        # Give the consumer a chance to run, as a transport would.
+        await asyncio.sleep(0)
+    while not queue.empty():
+        await asyncio.sleep(0)
+
+
+async def time_get_unless_done(message_count, chunk_size):
+    queue = asyncio.Queue()
+    done = asyncio.Future()
+    start = time.perf_counter()
+    consumer = asyncio.ensure_future(get_unless_done_loop(queue, done))
+    await producer(queue, message_count, chunk_size)
+    done.set_result(True)
+    await consumer
+    return time.perf_counter() - start
+
+
+async def time_cancellation(message_count, chunk_size):
+    queue = asyncio.Queue()
+    counter = [0]
+    start = time.perf_counter()
+    consumer = asyncio.ensure_future(cancellable_loop(queue, counter))
+    await producer(queue, message_count, chunk_size)
+    consumer.cancel()
+    try:
+        await consumer
+    except asyncio.CancelledError:
+        pass
+    return time.perf_counter() - start
+
+
+async def main(message_count, chunk_size):
+    for name, func in [('get_unless_done', time_get_unless_done),
+                       ('cancellation', time_cancellation)]:
+        elapsed = await func(message_count, chunk_size)
+        print('{:<16} {:>8.2f} us/msg'.format(
+            name, elapsed / message_count * 1e6
+        ))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--messages', type=int, default=200000)
+    parser.add_argument('--chunk-size', type=int, default=100)
+    args = parser.parse_args()
+    asyncio.get_event_loop().run_until_complete(
+        main(args.messages, args.chunk_size)
+    )
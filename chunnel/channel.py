@@ -1,6 +1,11 @@
 import asyncio
+import inspect
+import logging
 
 from .messages import ChannelEvents
+from .utils import OverflowPolicy
+
+logger = logging.getLogger(__name__)
 
 
 class ChannelJoinFailure(Exception):
@@ -10,6 +15,14 @@ class ChannelJoinFailure(Exception):
 class ChannelLeaveFailure(Exception):
     pass
 
+
+class ChannelOverflow(Exception):
+    '''
+    Raised from receive when incoming messages were dropped because the
+    channel's incoming queue was full.
+    '''
+    pass
+
 # TODO: Random thought, but _might_ be nice to ditch the
 # mutable-ness of these classes.
 # Like a Channel can be joined or not.
@@ -19,25 +32,201 @@ class ChannelLeaveFailure(Exception):
 # Not sure if it'd make a good API, but worth thinking about...
 
 
-class Channel:
+class Receiver:
+    '''
+    The base class for things that receive incoming messages from a socket,
+    such as channels & subscriptions.
+
+    :param max_incoming:      The maximum number of received messages to
+                              buffer.  0 means unlimited.
+    :param incoming_overflow: An OverflowPolicy that determines what happens
+                              to messages that arrive when the incoming queue
+                              is full.  block will hold up routing of all
+                              messages on the socket until there is space.
+                              The other policies drop a message & count it in
+                              `dropped`.  error additionally raises
+                              ChannelOverflow from the next receive.
+    '''
+    def __init__(self, max_incoming=0,
+                 incoming_overflow=OverflowPolicy.block):
+        self.incoming_overflow = incoming_overflow
+        # The number of incoming messages that have been dropped.
+        self.dropped = 0
+        self._incoming_messages = asyncio.Queue(max_incoming)
+        self._overflowed = False
+        # A mapping of event -> list of handlers.  See `on`.
+        self._handlers = {}
+        # A mapping of event -> handler for events that chunnel handles
+        # itself, such as presence.  Unlike handlers registered with `on`,
+        # these don't cause other events to be dropped.
+        self._hooks = {}
+
+    # TODO: Should maybe be called pull (to go with push)
+    async def receive(self):
+        '''
+        Receives the next incoming message.
+
+        Can also be iterated over with `async for`, which calls receive for
+        each message.
+
+        :raises ChannelOverflow: If messages have been dropped since the last
+                                 receive & incoming_overflow is error.
+        '''
+        self._check_overflow()
+        msg = await self._incoming_messages.get()
+        return msg
+
+    async def receive_many(self, max_n, timeout=None):
+        '''
+        Receives a batch of incoming messages.
+
+        Waits for a message to arrive, then returns it along with any others
+        that are already buffered, up to max_n in total.
+
+        :param max_n:   The maximum number of messages to return.
+        :param timeout: Optional number of seconds to wait for a message.
+        :returns:       A list of IncomingMessages.  This is empty if the
+                        timeout expired before any messages arrived.
+        :raises ChannelOverflow: See receive.
+        '''
+        self._check_overflow()
+        queue = self._incoming_messages
+        messages = []
+        if queue.empty():
+            try:
+                messages.append(await asyncio.wait_for(queue.get(), timeout))
+            except asyncio.TimeoutError:
+                return messages
+
+        while len(messages) < max_n and not queue.empty():
+            messages.append(queue.get_nowait())
+        return messages
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.receive()
+
+    def on(self, event, handler):
+        '''
+        Registers a handler for an incoming event.
+
+        The handler is called with the IncomingMessage directly from the
+        socket's receive loop, rather than the message being put on the
+        incoming queue.  If the handler returns an awaitable, it's run as a
+        separate task.
+
+        Once any handlers are registered, incoming messages for
+        events that have no handler are dropped, rather than put on the
+        incoming queue.
+
+        :param event:   The event to handle.
+        :param handler: A callable that takes an IncomingMessage.
+        :returns:       The handler.
+        '''
+        self._handlers.setdefault(event, []).append(handler)
+        return handler
+
+    def off(self, event, handler=None):
+        '''
+        Removes handlers for an incoming event.
+
+        :param event:   The event.
+        :param handler: The handler to remove.  If not provided, all handlers
+                        for the event are removed.
+        '''
+        handlers = self._handlers.get(event, [])
+        if handler is None:
+            handlers.clear()
+        elif handler in handlers:
+            handlers.remove(handler)
+        if not handlers:
+            self._handlers.pop(event, None)
+
+    def _call_handlers(self, handlers, message):
+        for handler in handlers:
+            try:
+                result = handler(message)
+            except Exception:
+                logger.exception(
+                    "Error in handler for %s on %s", message.event, self.topic
+                )
+                continue
+            if inspect.isawaitable(result):
+                asyncio.ensure_future(result).add_done_callback(
+                    self._handler_done
+                )
+
+    def _handler_done(self, future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.error(
+                "Error in handler on %s", self.topic,
+                exc_info=future.exception()
+            )
+
+    def _check_overflow(self):
+        if self._overflowed:
+            self._overflowed = False
+            raise ChannelOverflow(
+                "{} messages dropped on {}".format(self.dropped, self.topic)
+            )
+
+    def _put_incoming_nowait(self, message):
+        '''
+        Puts a message on the incoming queue, applying the overflow policy if
+        it's full.
+
+        Only used for policies other than block - those are handled by the
+        socket awaiting a put on the queue.
+        '''
+        queue = self._incoming_messages
+        if queue.full():
+            self.dropped += 1
+            if self.incoming_overflow is OverflowPolicy.drop_oldest:
+                queue.get_nowait()
+            else:
+                if self.incoming_overflow is OverflowPolicy.error:
+                    self._overflowed = True
+                return
+        queue.put_nowait(message)
+
+
+class Channel(Receiver):
     '''
     A channel on a phoenix server.
 
     Should not be instantiated directly, but through a socket.
+
+    See Receiver for max_incoming & incoming_overflow.
+
+    :param lane: The lane of the socket's outgoing queue that pushes on this
+                 channel are sent through.  Defaults to the topic, so each
+                 channel gets a fair share of the socket.  Channels can
+                 share a lane by using the same name.  See
+                 Socket(lane_weights=...).
     '''
-    def __init__(self, socket, topic, params):
+    def __init__(self, socket, topic, params, max_incoming=0,
+                 incoming_overflow=OverflowPolicy.block, lane=None):
+        super().__init__(max_incoming, incoming_overflow)
         self.socket = socket
         self.topic = topic
         self.params = params
-        self._incoming_messages = asyncio.Queue()
+        self.lane = topic if lane is None else lane
+        self._join_ref = None
+        # Whether we've joined the channel, and should rejoin on reconnect.
+        self.joined = False
         # TODO: Consider something like channel_states in js lib?
 
     async def join(self):
         '''
         Joins the channel.
         '''
+        ref = self.socket._make_ref()
+        self._join_ref = ref
         join = await self.socket._send_message(
-            self.topic, ChannelEvents.join.value, self.params
+            self.topic, ChannelEvents.join.value, self.params,
+            ref=ref, join_ref=ref
         )
         try:
             response = await join.response()
@@ -45,14 +234,17 @@ class Channel:
             # TODO: this needs some work.
             raise ChannelJoinFailure() from e
 
+        self.joined = True
         return response
 
     async def leave(self):
         '''
         Leaves the channel.
         '''
+        self.joined = False
         leave = await self.socket._send_message(
-            self.topic, ChannelEvents.leave.value, self.params
+            self.topic, ChannelEvents.leave.value, self.params,
+            join_ref=self._join_ref
         )
         try:
             response = await leave.response()
@@ -60,22 +252,41 @@ class Channel:
             # TODO: this needs some work.
             raise ChannelLeaveFailure() from e
 
-    async def push(self, event, payload):
+    async def push(self, event, payload, timeout=None):
         '''
         Pushes a message to a channel.
 
+        The payload can be bytes or a memoryview when using a serializer that
+        supports binary messages, such as V2JSONSerializer.
+
         :param event:    The event to push.
         :param payload:  The payload for the event.
+        :param timeout:  Optional number of seconds to wait for a reply.
+                         Defaults to the sockets reply_timeout.
         '''
-        msg = await self.socket._send_message(self.topic, event, payload)
+        msg = await self.socket._send_message(
+            self.topic, event, payload, timeout=timeout,
+            join_ref=self._join_ref
+        )
         return msg
 
-    # TODO: could be nice to just expose a "read only queue" under .incoming
-    # With get, get_nowait & an async iterator interface?
-    # TODO: Otherwise should maybe be called pull (to go with push)
-    async def receive(self):
-        msg = await self._incoming_messages.get()
-        return msg
+    def push_nowait(self, event, payload, timeout=None):
+        '''
+        Pushes a message to a channel without waiting for it to be sent.
+
+        The message is put on the sockets outgoing queue and this returns
+        immediately.  `SentMessage.sent` is a future that will be resolved
+        once the message has actually been sent.
+
+        :param event:    The event to push.
+        :param payload:  The payload for the event.
+        :param timeout:  Optional number of seconds to wait for a reply.
+        :raises OutgoingQueueFull: If the outgoing queue is full.
+        '''
+        return self.socket._send_message_nowait(
+            self.topic, event, payload, timeout=timeout,
+            join_ref=self._join_ref
+        )
 
     async def __aenter__(self):
         resp = await self.join()
@@ -83,3 +294,31 @@ class Channel:
 
     async def __aexit__(self, exc_type, exc_value, tb):
         await self.leave()
+
+
+class Subscription(Receiver):
+    '''
+    Receives messages for every topic matching a pattern.
+
+    Should not be instantiated directly, but through Socket.subscribe.
+
+    Subscriptions don't join anything on the server - they receive messages
+    for any matching topic the socket receives, such as those for channels
+    that have been joined.  Messages are delivered to matching subscriptions
+    as well as to the channel for their topic.
+
+    See Receiver for max_incoming & incoming_overflow.
+    '''
+    def __init__(self, socket, pattern, max_incoming=0,
+                 incoming_overflow=OverflowPolicy.block):
+        super().__init__(max_incoming, incoming_overflow)
+        self.socket = socket
+        self.pattern = pattern
+        # Used in log messages.
+        self.topic = pattern
+
+    def unsubscribe(self):
+        '''
+        Stops the subscription receiving any more messages.
+        '''
+        self.socket._subscriptions.remove(self.pattern, self)
@@ -0,0 +1,94 @@
+import asyncio
+import os
+
+__all__ = ['ExecutorDispatcher']
+
+
+class ExecutorDispatcher:
+    '''
+    Runs message handlers in an executor, such as a ProcessPoolExecutor or
+    ThreadPoolExecutor, so CPU heavy handlers don't block the event loop.
+
+    Messages for each topic are handled one at a time, in the order they
+    were received.  Messages for different topics are handled concurrently,
+    up to max_concurrency at a time.
+
+    Handlers are called in the executor with the event & payload of the
+    message.  When using a ProcessPoolExecutor these need to be picklable:
+    handlers should be module level functions, and binary payloads are
+    converted to bytes.  If a handler returns anything other than None it is
+    sent back to the server as an ok reply to the message.
+
+    Example:
+
+        dispatcher = ExecutorDispatcher(ProcessPoolExecutor(), 4)
+        channel.on('score', dispatcher.handler(score_message))
+
+    :param executor:        The executor to run handlers in.
+    :param max_concurrency: The maximum number of handlers to run at once.
+                            Defaults to the number of CPUs.
+    '''
+    def __init__(self, executor, max_concurrency=None):
+        self.executor = executor
+        self.max_concurrency = max_concurrency or os.cpu_count() or 1
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        # A mapping of topic -> the most recently dispatched task for that
+        # topic.  Each task waits on the one before it.
+        self._tails = {}
+
+    def handler(self, func):
+        '''
+        Wraps a function as a handler that can be passed to Channel.on.
+
+        :param func:    A function that takes an event & payload.
+        '''
+        def handle(message):
+            return self.dispatch(func, message)
+        return handle
+
+    def dispatch(self, func, message):
+        '''
+        Schedules func to be run in the executor for an IncomingMessage.
+
+        :param func:    A function that takes an event & payload.
+        :param message: The IncomingMessage to handle.
+        :returns:       A task that resolves to the result of func.
+        '''
+        topic = message.topic
+        task = asyncio.ensure_future(
+            self._run(func, message, self._tails.get(topic))
+        )
+        self._tails[topic] = task
+        task.add_done_callback(lambda _: self._task_done(topic, task))
+        return task
+
+    async def drain(self):
+        '''
+        Waits for all the currently dispatched messages to be handled.
+        '''
+        if self._tails:
+            await asyncio.wait(list(self._tails.values()))
+
+    async def _run(self, func, message, previous):
+        if previous is not None:
+            # We only care that the previous message has been handled, not
+            # whether it succeeded.
+            await asyncio.wait([previous])
+
+        payload = message.payload
+        if isinstance(payload, memoryview):
+            payload = bytes(payload)
+
+        loop = asyncio.get_event_loop()
+        async with self._semaphore:
+            result = await loop.run_in_executor(
+                self.executor, func, message.event, payload
+            )
+
+        if result is not None:
+            await message.reply('ok', result)
+        return result
+
+    def _task_done(self, topic, task):
+        if self._tails.get(topic) is task:
+            del self._tails[topic]
@@ -0,0 +1,329 @@
+'''
+A load generator for phoenix servers, built on chunnel.
+
+Simulates a number of clients, each with their own socket.  Each client joins
+some topics and then pushes to them in turn at a fixed rate, without waiting
+for replies.  Throughput, reply latency percentiles, errors & timeouts are
+reported as it runs, and for the whole run at the end.
+
+Run `python -m chunnel --help` for the options.
+'''
+from itertools import cycle
+import argparse
+import asyncio
+import json
+import random
+import signal
+import sys
+import time
+
+from .channel import ChannelJoinFailure
+from .messages import ReplyTimeout
+from .metrics import Histogram
+from .socket import Socket, OutgoingQueueFull
+from .transports import V1JSONSerializer, V2JSONSerializer
+from .utils import OverflowPolicy, cancel_task
+
+SERIALIZERS = {
+    'v1': V1JSONSerializer,
+    'v2': V2JSONSerializer
+}
+
+# Latency buckets from 100us to ~80s, each 10% larger than the last, so the
+# reported percentiles are accurate to within 10%.
+LATENCY_BUCKETS = tuple(0.0001 * 1.1 ** n for n in range(144))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m chunnel', description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        'url', help='The URL of the socket, e.g. ws://localhost:4000/socket'
+    )
+    parser.add_argument(
+        '-c', '--clients', type=int, default=100,
+        help='The number of clients to simulate.'
+    )
+    parser.add_argument(
+        '-t', '--topic', dest='topics', action='append',
+        help='A topic for each client to join.  Can be given more than once. '
+             '{client} is replaced with the number of the client.  '
+             'Defaults to room:lobby.'
+    )
+    parser.add_argument(
+        '-r', '--rate', type=float, default=1,
+        help='The number of pushes a second made by each client.  0 only '
+             'joins the topics.'
+    )
+    parser.add_argument(
+        '-d', '--duration', type=float, default=None,
+        help='The number of seconds to run for.  Runs until interrupted by '
+             'default.'
+    )
+    parser.add_argument(
+        '--ramp-up', type=float, default=0,
+        help='The number of seconds over which to spread client connections.'
+    )
+    parser.add_argument(
+        '-e', '--event', default='ping', help='The event to push.'
+    )
+    parser.add_argument(
+        '--payload', type=json.loads, default={},
+        help='The payload to push, as JSON.'
+    )
+    parser.add_argument(
+        '--payload-size', type=int, default=0,
+        help='Pads the payload with a string of this many characters.'
+    )
+    parser.add_argument(
+        '--params', type=json.loads, default={},
+        help='The params to connect with, as JSON.'
+    )
+    parser.add_argument(
+        '--join-params', type=json.loads, default={},
+        help='The params to join topics with, as JSON.'
+    )
+    parser.add_argument(
+        '--timeout', type=float, default=10,
+        help='The number of seconds to wait for a reply.'
+    )
+    parser.add_argument(
+        '--max-outgoing', type=int, default=0,
+        help='Limits the outgoing queue of each client.  Pushes to a full '
+             'queue are counted as errors.'
+    )
+    parser.add_argument(
+        '--serializer', choices=sorted(SERIALIZERS), default='v2'
+    )
+    parser.add_argument(
+        '--batch-size', type=int, default=1,
+        help='The send_batch_size for the websocket transport.'
+    )
+    parser.add_argument(
+        '--report-interval', type=float, default=5,
+        help='The number of seconds between reports.'
+    )
+    options = parser.parse_args(argv)
+    if not options.topics:
+        options.topics = ['room:lobby']
+    if options.payload_size:
+        options.payload = dict(
+            options.payload, data='x' * options.payload_size
+        )
+    return options
+
+
+class LoadCounts:
+    '''
+    Counts of what happened to pushes over some period.
+    '''
+    def __init__(self):
+        self.pushes = 0
+        self.replies = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.latency = Histogram(LATENCY_BUCKETS)
+
+    def describe(self, elapsed):
+        def ms(percent):
+            value = self.latency.percentile(percent)
+            if value is None:
+                return '-'
+            return '{:.1f}ms'.format(value * 1000)
+
+        return (
+            'push {:.0f}/s  reply {:.0f}/s  p50 {} p90 {} p99 {}  '
+            'errors {}  timeouts {}'.format(
+                self.pushes / elapsed, self.replies / elapsed,
+                ms(50), ms(90), ms(99), self.errors, self.timeouts
+            )
+        )
+
+
+class LoadStats:
+    '''
+    Collects the results of a load test.
+
+    `interval` holds the counts since the last report, and `total` the counts
+    for the whole run.
+    '''
+    def __init__(self, clients):
+        self.clients = clients
+        self.connected = 0
+        self.connect_failures = 0
+        self.join_failures = 0
+        self.reconnects = 0
+        self.interval = LoadCounts()
+        self.total = LoadCounts()
+
+    def push(self, channel, event, payload):
+        '''
+        Pushes a message & records what happens to it.
+        '''
+        try:
+            message = channel.push_nowait(event, payload)
+        except OutgoingQueueFull:
+            self.interval.errors += 1
+            self.total.errors += 1
+            return
+
+        self.interval.pushes += 1
+        self.total.pushes += 1
+        started = time.perf_counter()
+        message.response_future.add_done_callback(
+            lambda future: self._replied(future, started)
+        )
+
+    def _replied(self, future, started):
+        if future.cancelled():
+            # The client is shutting down.
+            return
+        exception = future.exception()
+        for counts in (self.interval, self.total):
+            if exception is None:
+                counts.replies += 1
+                counts.latency.observe(time.perf_counter() - started)
+            elif isinstance(exception, ReplyTimeout):
+                counts.timeouts += 1
+            else:
+                counts.errors += 1
+
+    def report(self, elapsed, interval):
+        print('{:>7.1f}s  clients {}/{}  {}'.format(
+            elapsed, self.connected, self.clients,
+            self.interval.describe(interval)
+        ))
+        self.interval = LoadCounts()
+
+    def summary(self, elapsed):
+        print('Total over {:.1f}s:  {}'.format(
+            elapsed, self.total.describe(elapsed)
+        ))
+        print('Connect failures {}  join failures {}  reconnects {}'.format(
+            self.connect_failures, self.join_failures, self.reconnects
+        ))
+
+
+async def run_client(number, options, stats):
+    '''
+    Runs a single client until it's cancelled.
+    '''
+    socket = Socket(
+        options.url, options.params,
+        transport_options={
+            'serializer': SERIALIZERS[options.serializer](),
+            'send_batch_size': options.batch_size
+        },
+        max_outgoing=options.max_outgoing,
+        outgoing_overflow=OverflowPolicy.error,
+        reply_timeout=options.timeout
+    )
+    try:
+        await socket.connect()
+    except Exception:
+        stats.connect_failures += 1
+        return
+
+    stats.connected += 1
+    try:
+        channels = []
+        for topic in options.topics:
+            channel = socket.channel(
+                topic.format(client=number), options.join_params
+            )
+            try:
+                await channel.join()
+            except ChannelJoinFailure:
+                stats.join_failures += 1
+            else:
+                channels.append(channel)
+
+        if not channels or not options.rate:
+            await asyncio.Future()
+
+        loop = asyncio.get_event_loop()
+        interval = 1 / options.rate
+        # Start at a random offset so clients don't all push at once.
+        next_push = loop.time() + random.uniform(0, interval)
+        for channel in cycle(channels):
+            # Always yield, even when behind schedule, so a client catching
+            # up doesn't starve the rest of the event loop.
+            await asyncio.sleep(max(next_push - loop.time(), 0))
+            # Pushes are scheduled independently of how long the last one
+            # took, so a slow server doesn't slow down the load.
+            next_push += interval
+            stats.push(channel, options.event, options.payload)
+    finally:
+        stats.connected -= 1
+        stats.reconnects += socket.reconnects
+        await socket.disconnect()
+
+
+async def run_load(options, stopping=None):
+    '''
+    Runs a load test.
+
+    :param options:  The options from parse_args.
+    :param stopping: An optional future that stops the test when resolved.
+    :returns:        The LoadStats for the test.
+    '''
+    loop = asyncio.get_event_loop()
+    if stopping is None:
+        stopping = asyncio.Future()
+    if options.duration is not None:
+        loop.call_later(
+            options.duration,
+            lambda: stopping.done() or stopping.set_result(True)
+        )
+
+    stats = LoadStats(options.clients)
+    started = loop.time()
+
+    async def start_client(number):
+        await asyncio.sleep(options.ramp_up * number / options.clients)
+        await run_client(number, options, stats)
+
+    async def report():
+        last = started
+        while True:
+            await asyncio.sleep(options.report_interval)
+            now = loop.time()
+            stats.report(now - started, now - last)
+            last = now
+
+    clients = [
+        asyncio.ensure_future(start_client(number))
+        for number in range(options.clients)
+    ]
+    reporter = asyncio.ensure_future(report())
+    try:
+        await stopping
+    finally:
+        await cancel_task(reporter)
+        for client in clients:
+            client.cancel()
+        await asyncio.wait(clients)
+
+    stats.summary(loop.time() - started)
+    return stats
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    loop = asyncio.get_event_loop()
+    stopping = asyncio.Future()
+    try:
+        loop.add_signal_handler(
+            signal.SIGINT,
+            lambda: stopping.done() or stopping.set_result(True)
+        )
+    except NotImplementedError:
+        # Not supported on windows, where ctrl-c will just exit.
+        pass
+    loop.run_until_complete(run_load(options, stopping))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
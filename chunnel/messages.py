@@ -1,5 +1,8 @@
 from collections import namedtuple
 from enum import Enum
+import asyncio
+
+from .transports.base import LazyPayload
 
 
 class MessageStatus(Enum):
@@ -12,13 +15,30 @@ class IncomingMessage:
         self._transport_message = transport_message
         self._socket = socket
 
+    @property
+    def topic(self):
+        return self._transport_message.topic
+
     @property
     def event(self):
         return self._transport_message.event
 
     @property
     def payload(self):
-        return self._transport_message.payload
+        '''
+        The payload of the message.
+
+        For binary messages this will be a memoryview over the received data.
+        If the serializer decodes lazily, the payload is decoded the first
+        time this is accessed.
+        '''
+        payload = self._transport_message.payload
+        if isinstance(payload, LazyPayload):
+            payload = payload.load()
+            self._transport_message = self._transport_message._replace(
+                payload=payload
+            )
+        return payload
 
     async def reply(self, status, response):
         await self._socket._send_message(
@@ -38,14 +58,43 @@ class ChannelEvents(Enum):
     leave = "phx_leave"
 
 
+# Events that are sent on the control lane of the outgoing queue: these are
+# never blocked by the outgoing queue being full or by rate limits, and are
+# sent before any other messages.
+CONTROL_EVENTS = frozenset([
+    ChannelEvents.join.value,
+    ChannelEvents.leave.value,
+    ChannelEvents.reply.value,
+    'heartbeat'
+])
+
+
+class ReplyTimeout(asyncio.TimeoutError):
+    '''
+    Raised when a reply to a pushed message is not received in time.
+    '''
+    pass
+
+
 # TODO: PushedMessage?
 class SentMessage:
-    def __init__(self, response_future):
+    def __init__(self, response_future, sent_future):
         self._response_future = response_future
+        self.sent = sent_future
+
+    @property
+    def response_future(self):
+        '''
+        The future for the response to the message, for callers that want
+        to add a callback rather than await `response()`.
+        '''
+        return self._response_future
 
     async def response(self):
-        # TODO: Definitely need to think more about timeouts...
-        # Currently the self._future is wrapped in a timeout, but is that what
-        # I want?
+        '''
+        Waits for the response to the message.
+
+        :raises ReplyTimeout: If no reply arrives within the push's timeout.
+        '''
         resp = await self._response_future
         return resp
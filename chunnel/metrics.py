@@ -0,0 +1,170 @@
+from bisect import bisect_left
+from collections import defaultdict
+
+__all__ = ['Metrics', 'InMemoryMetrics', 'Histogram']
+
+
+class Metrics:
+    '''
+    The interface that chunnel reports metrics through.
+
+    All of the methods do nothing, so this can be used when metrics aren't
+    wanted.  Subclass it & override the methods to collect metrics.
+
+    Message sizes are the length of the encoded message - for text frames
+    this is the number of characters.
+    '''
+    def message_sent(self, topic, event, size):
+        '''
+        Called when a message is about to be sent by a transport.
+        '''
+        pass
+
+    def message_received(self, topic, event, size):
+        '''
+        Called when a message has been received by a transport.
+        '''
+        pass
+
+    def reply_received(self, topic, event, latency):
+        '''
+        Called when a reply to a push is received.
+
+        :param latency: The number of seconds between the push being made &
+                        the reply being received.
+        '''
+        pass
+
+    def reconnected(self):
+        '''
+        Called when a socket has reconnected.
+        '''
+        pass
+
+    def register_gauge(self, name, func):
+        '''
+        Registers a gauge, such as the depth of a queue.
+
+        :param name:    The name of the gauge.
+        :param func:    A function that returns the current value.
+        '''
+        pass
+
+
+def reports_replies(metrics):
+    '''
+    Checks whether some metrics want to know about replies.
+
+    Timing replies has some cost, so we avoid it for metrics that would
+    ignore the result.
+    '''
+    return type(metrics).reply_received is not Metrics.reply_received
+
+
+class Histogram:
+    '''
+    A histogram with fixed buckets.
+
+    :param buckets: The upper bounds of the buckets, in ascending order.
+    '''
+    DEFAULT_BUCKETS = (
+        0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10
+    )
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        # The last count is for values larger than any bucket.
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def percentile(self, percent):
+        '''
+        Estimates a percentile, as the upper bound of the bucket it falls in.
+
+        :param percent: The percentile to estimate, from 0 to 100.
+        :returns:       The estimate, or None if there are no values.  Values
+                        larger than the largest bucket are returned as inf.
+        '''
+        if not self.count:
+            return None
+        target = self.count * percent / 100
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return float('inf')
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'buckets': list(zip(self.buckets + (float('inf'),), self.counts))
+        }
+
+
+class InMemoryMetrics(Metrics):
+    '''
+    Collects metrics in memory.
+
+    Call snapshot to get the current values.  A single instance can be
+    shared between sockets, in which case gauges with the same name are
+    summed.
+
+    :param latency_buckets: The buckets to use for reply latency histograms.
+    '''
+    def __init__(self, latency_buckets=Histogram.DEFAULT_BUCKETS):
+        self.messages_sent = defaultdict(int)
+        self.bytes_sent = defaultdict(int)
+        self.messages_received = defaultdict(int)
+        self.bytes_received = defaultdict(int)
+        self.reply_latency = defaultdict(lambda: Histogram(latency_buckets))
+        self.reconnects = 0
+        self.gauges = defaultdict(list)
+
+    def message_sent(self, topic, event, size):
+        key = (topic, event)
+        self.messages_sent[key] += 1
+        self.bytes_sent[key] += size
+
+    def message_received(self, topic, event, size):
+        key = (topic, event)
+        self.messages_received[key] += 1
+        self.bytes_received[key] += size
+
+    def reply_received(self, topic, event, latency):
+        self.reply_latency[(topic, event)].observe(latency)
+
+    def reconnected(self):
+        self.reconnects += 1
+
+    def register_gauge(self, name, func):
+        self.gauges[name].append(func)
+
+    def snapshot(self):
+        '''
+        Returns the current values of all the metrics.
+
+        Counters & histograms are keyed by (topic, event).
+        '''
+        return {
+            'messages_sent': dict(self.messages_sent),
+            'bytes_sent': dict(self.bytes_sent),
+            'messages_received': dict(self.messages_received),
+            'bytes_received': dict(self.bytes_received),
+            'reply_latency': {
+                key: histogram.snapshot()
+                for key, histogram in self.reply_latency.items()
+            },
+            'reconnects': self.reconnects,
+            'gauges': {
+                name: sum(func() for func in funcs)
+                for name, funcs in self.gauges.items()
+            }
+        }
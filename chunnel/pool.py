@@ -0,0 +1,150 @@
+from bisect import bisect
+import asyncio
+import hashlib
+
+from .socket import Socket
+
+__all__ = ['SocketPool', 'HashRing']
+
+
+class HashRing:
+    '''
+    A consistent hash ring.
+
+    Maps keys to nodes such that adding or removing a node only moves the keys
+    that were on (or now belong on) that node.
+
+    :param nodes:    The nodes to put on the ring.
+    :param replicas: The number of points each node gets on the ring.  More
+                     points spread keys more evenly.
+    '''
+    def __init__(self, nodes, replicas=64):
+        self.replicas = replicas
+        self._points = []
+        self._nodes = []
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node):
+        '''
+        Adds a node to the ring.
+        '''
+        points = dict(zip(self._points, self._nodes))
+        for replica in range(self.replicas):
+            points[_hash('{}:{}'.format(node, replica))] = node
+        self._points = sorted(points)
+        self._nodes = [points[point] for point in self._points]
+
+    def remove(self, node):
+        '''
+        Removes a node from the ring.
+        '''
+        points = [
+            (point, other) for point, other in zip(self._points, self._nodes)
+            if other != node
+        ]
+        self._points = [point for point, _ in points]
+        self._nodes = [other for _, other in points]
+
+    def lookup(self, key):
+        '''
+        Returns the node that a key belongs to.
+        '''
+        if not self._points:
+            raise LookupError("No nodes in ring")
+        index = bisect(self._points, _hash(key)) % len(self._points)
+        return self._nodes[index]
+
+
+def _hash(key):
+    digest = hashlib.md5(key.encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big')
+
+
+class SocketPool:
+    '''
+    A pool of sockets connected to the same phoenix server.
+
+    Channels are spread across the sockets by consistent hashing of their
+    topic, so each socket only carries a share of the traffic, and losing
+    one connection only affects the channels on it.  A topic is always
+    assigned to the same socket.
+
+    Provides the same `channel` API as a Socket.
+
+    :param url:      The URL of the phoenix server to connect to.
+    :param params:   Optional parameters to use when connecting.
+    :param size:     The number of sockets in the pool.
+    :param replicas: The number of points each socket gets on the hash ring.
+    :param kwargs:   Any other arguments are passed to each Socket.
+    '''
+    def __init__(self, url, params, size=4, replicas=64, **kwargs):
+        if size < 1:
+            raise ValueError("size must be at least 1")
+        self.url = url
+        self.params = params
+        self.sockets = [Socket(url, params, **kwargs) for _ in range(size)]
+        self._ring = HashRing(range(size), replicas)
+
+    @property
+    def connected(self):
+        return all(socket.connected for socket in self.sockets)
+
+    @property
+    def channels(self):
+        '''
+        A mapping of topic -> channel for all the sockets in the pool.
+        '''
+        channels = {}
+        for socket in self.sockets:
+            channels.update(socket.channels)
+        return channels
+
+    def socket_for(self, topic):
+        '''
+        Returns the socket that a topic is assigned to.
+        '''
+        return self.sockets[self._ring.lookup(topic)]
+
+    def channel(self, topic, params, **kwargs):
+        '''
+        Creates a channel on the socket its topic is assigned to.
+
+        Takes the same parameters as Socket.channel.
+        '''
+        return self.socket_for(topic).channel(topic, params, **kwargs)
+
+    async def connect(self):
+        '''
+        Connects all the sockets in the pool.
+
+        If any of them fail to connect, the others are disconnected.
+        '''
+        results = await asyncio.gather(
+            *[socket.connect() for socket in self.sockets],
+            return_exceptions=True
+        )
+        failures = [
+            result for result in results if isinstance(result, Exception)
+        ]
+        if failures:
+            await asyncio.gather(*[
+                socket.disconnect() for socket in self.sockets
+                if socket.connected
+            ])
+            raise failures[0]
+
+    async def disconnect(self):
+        '''
+        Disconnects all the sockets in the pool.
+        '''
+        await asyncio.gather(
+            *[socket.disconnect() for socket in self.sockets]
+        )
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.disconnect()
@@ -0,0 +1,222 @@
+import logging
+
+__all__ = ['Presence']
+
+logger = logging.getLogger(__name__)
+
+
+class Presence:
+    '''
+    Tracks phoenix presence on a channel.
+
+    Should be created before joining the channel, so that the initial
+    `presence_state` isn't missed.  The state is then kept up to date from
+    `presence_diff` messages, updating only the keys in each diff.  Diffs that
+    arrive before the state for the current join are held back until it
+    arrives.
+
+    The state is available as `state`, a dict of key -> presence (a dict with
+    a list of `metas`, each with a unique `phx_ref`, and any other fields the
+    server adds).  It should not be modified.
+
+    Example:
+
+        presence = Presence(channel)
+
+        @presence.on_join
+        def joined(key, current, joined):
+            print(key, "joined")
+
+        await channel.join()
+        print(len(presence), "online")
+
+    :param channel: The channel to track presence on.
+    :param events:  Optional (state_event, diff_event) tuple, if the server
+                    uses different event names.
+    '''
+    def __init__(self, channel, events=('presence_state', 'presence_diff')):
+        self.channel = channel
+        self.state = {}
+        # The join_ref of the join we last received a state for.
+        self._join_ref = None
+        self._pending_diffs = []
+        self._join_callbacks = []
+        self._leave_callbacks = []
+        self._sync_callbacks = []
+
+        state_event, diff_event = events
+        channel._hooks[state_event] = self._handle_state
+        channel._hooks[diff_event] = self._handle_diff
+
+    def on_join(self, callback):
+        '''
+        Registers a callback for presences joining.
+
+        Called as `callback(key, current, joined)`, where current is the
+        presence for key before the join (or None) and joined is the presence
+        that joined.
+
+        :returns:   The callback.
+        '''
+        self._join_callbacks.append(callback)
+        return callback
+
+    def on_leave(self, callback):
+        '''
+        Registers a callback for presences leaving.
+
+        Called as `callback(key, current, left)`, where current is the
+        presence for key after the leave and left is the presence that left.
+        If current has no metas left, the key is removed from the state.
+
+        :returns:   The callback.
+        '''
+        self._leave_callbacks.append(callback)
+        return callback
+
+    def on_sync(self, callback):
+        '''
+        Registers a callback that's called with no arguments after each state
+        or diff has been applied.
+
+        :returns:   The callback.
+        '''
+        self._sync_callbacks.append(callback)
+        return callback
+
+    def __len__(self):
+        '''
+        The number of keys that are present.
+        '''
+        return len(self.state)
+
+    def __contains__(self, key):
+        return key in self.state
+
+    def __iter__(self):
+        return iter(self.state)
+
+    def get(self, key, default=None):
+        '''
+        Returns the presence for a key.
+        '''
+        return self.state.get(key, default)
+
+    def metas(self, key):
+        '''
+        Returns a list of the metas for a key, or an empty list if the key is
+        not present.
+        '''
+        presence = self.state.get(key)
+        if presence is None:
+            return []
+        return list(presence['metas'])
+
+    def list(self, chooser=None):
+        '''
+        Lists the presences.
+
+        Unlike the other queries, this goes through the whole state.
+
+        :param chooser: Optional function called with (key, presence) for
+                        each presence, whose results are returned instead of
+                        the presences.
+        '''
+        if chooser is None:
+            return list(self.state.values())
+        return [
+            chooser(key, presence) for key, presence in self.state.items()
+        ]
+
+    def _handle_state(self, message):
+        self._join_ref = self.channel._join_ref
+        self._sync_state(message.payload)
+        pending_diffs = self._pending_diffs
+        self._pending_diffs = []
+        for diff in pending_diffs:
+            self._sync_diff(diff)
+        self._call(self._sync_callbacks)
+
+    def _handle_diff(self, message):
+        if self._join_ref is None or self._join_ref != self.channel._join_ref:
+            # We've not had the state for this join yet.
+            self._pending_diffs.append(message.payload)
+            return
+        self._sync_diff(message.payload)
+        self._call(self._sync_callbacks)
+
+    def _sync_state(self, new_state):
+        '''
+        Applies a full state, by working out the diff from the current state.
+        '''
+        joins = {}
+        # Copied, as applying the leaves updates the current presences.
+        leaves = {
+            key: dict(presence, metas=list(presence['metas']))
+            for key, presence in self.state.items()
+            if key not in new_state
+        }
+        for key, new_presence in new_state.items():
+            current = self.state.get(key)
+            if current is None:
+                joins[key] = new_presence
+                continue
+
+            new_refs = _refs(new_presence)
+            current_refs = _refs(current)
+            joined = [
+                meta for meta in new_presence['metas']
+                if meta['phx_ref'] not in current_refs
+            ]
+            left = [
+                meta for meta in current['metas']
+                if meta['phx_ref'] not in new_refs
+            ]
+            if joined:
+                joins[key] = dict(new_presence, metas=joined)
+            if left:
+                leaves[key] = dict(current, metas=left)
+
+        self._sync_diff({'joins': joins, 'leaves': leaves})
+
+    def _sync_diff(self, diff):
+        state = self.state
+        for key, joined in diff.get('joins', {}).items():
+            current = state.get(key)
+            presence = dict(joined)
+            if current is None:
+                presence['metas'] = list(joined['metas'])
+            else:
+                joined_refs = _refs(joined)
+                presence['metas'] = [
+                    meta for meta in current['metas']
+                    if meta['phx_ref'] not in joined_refs
+                ] + joined['metas']
+            state[key] = presence
+            self._call(self._join_callbacks, key, current, joined)
+
+        for key, left in diff.get('leaves', {}).items():
+            current = state.get(key)
+            if current is None:
+                continue
+            left_refs = _refs(left)
+            current['metas'] = [
+                meta for meta in current['metas']
+                if meta['phx_ref'] not in left_refs
+            ]
+            self._call(self._leave_callbacks, key, current, left)
+            if not current['metas']:
+                del state[key]
+
+    def _call(self, callbacks, *args):
+        for callback in callbacks:
+            try:
+                callback(*args)
+            except Exception:
+                logger.exception(
+                    "Error in presence callback on %s", self.channel.topic
+                )
+
+
+def _refs(presence):
+    return {meta['phx_ref'] for meta in presence['metas']}
@@ -0,0 +1,254 @@
+import asyncio
+import time
+
+from .messages import CONTROL_EVENTS
+from .metrics import Histogram
+
+__all__ = ['TokenBucket', 'RateLimit', 'RateLimiter', 'RateLimitStats']
+
+
+class TokenBucket:
+    '''
+    A token bucket, for limiting the rate of something.
+
+    Tokens are added at `rate` a second, up to `capacity`.  Taking tokens
+    always succeeds, but can leave the bucket in debt, in which case the
+    caller should wait until the debt has been paid off.  This means that
+    callers are delayed in the order they took their tokens, & that an
+    amount larger than the capacity can still be taken.
+
+    :param rate:     The number of tokens added a second.
+    :param capacity: The maximum number of tokens in the bucket, which is
+                     the largest burst allowed without waiting.  The bucket
+                     starts full.
+    :param clock:    A function returning the current time in seconds.
+    '''
+    def __init__(self, rate, capacity, clock=time.monotonic):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self._clock = clock
+        self._updated = clock()
+
+    def take(self, amount=1):
+        '''
+        Takes tokens from the bucket.
+
+        :returns:   The number of seconds to wait before going ahead.
+        '''
+        self._refill()
+        self.tokens -= amount
+        if self.tokens >= 0:
+            return 0
+        return -self.tokens / self.rate
+
+    def delay(self):
+        '''
+        Returns the number of seconds until the bucket is out of debt.
+        '''
+        self._refill()
+        if self.tokens >= 0:
+            return 0
+        return -self.tokens / self.rate
+
+    def full(self):
+        '''
+        Checks whether the bucket has refilled to capacity.
+        '''
+        self._refill()
+        return self.tokens >= self.capacity
+
+    def _refill(self):
+        now = self._clock()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+
+class RateLimit:
+    '''
+    A limit on the rate messages are sent at.
+
+    :param messages_per_second: Optional limit on the number of messages sent
+                                a second.
+    :param bytes_per_second:    Optional limit on the number of bytes sent a
+                                second, measured as for Metrics.
+    :param burst:               The number of seconds worth of messages or
+                                bytes that can be sent at once after a pause.
+    '''
+    def __init__(self, messages_per_second=None, bytes_per_second=None,
+                 burst=1):
+        self.messages_per_second = messages_per_second
+        self.bytes_per_second = bytes_per_second
+        self.burst = burst
+
+    def _buckets(self, clock):
+        '''
+        Creates a (messages, bytes) tuple of TokenBuckets for this limit.
+
+        Either is None if that rate isn't limited.
+        '''
+        return (
+            _bucket(self.messages_per_second, self.burst, clock),
+            _bucket(self.bytes_per_second, self.burst, clock)
+        )
+
+
+def _bucket(rate, burst, clock):
+    if rate is None:
+        return None
+    # Always allow at least one message through without waiting.
+    return TokenBucket(rate, max(rate * burst, 1), clock)
+
+
+class RateLimitStats:
+    '''
+    Records how long messages were delayed by a RateLimiter.
+
+    :ivar messages:     The number of messages that have been sent through
+                        the limiter.
+    :ivar delayed:      The number of times a message was delayed.
+    :ivar wait_time:    The total number of seconds messages were delayed.
+    :ivar max_wait:     The longest a message was delayed, in seconds.
+    :ivar waits:        A Histogram of delays.
+    '''
+    def __init__(self):
+        self.messages = 0
+        self.delayed = 0
+        self.wait_time = 0
+        self.max_wait = 0
+        self.waits = Histogram()
+
+    def record_wait(self, delay):
+        self.delayed += 1
+        self.wait_time += delay
+        self.max_wait = max(self.max_wait, delay)
+        self.waits.observe(delay)
+
+
+class RateLimiter:
+    '''
+    Paces the messages sent by a socket.
+
+    The socket wide limit is applied by the transport as it sends each
+    message, so a message waits at the head of the outgoing queue until it
+    can be sent.  The topic limit gives each topic its own buckets, which
+    are applied by the socket before pushes are queued, so a busy topic
+    can't hold up the others.
+
+    Messages are delayed rather than dropped.
+
+    Buckets for topics that have gone idle are removed from time to time, so
+    pushing to many short lived topics doesn't use more & more memory.
+
+    :param limit:       Optional RateLimit for the socket as a whole.
+    :param topic_limit: Optional RateLimit that's applied to each topic.
+    :param clock:       A function returning the current time in seconds.
+    '''
+    # The number of topics with buckets before idle ones are first removed.
+    MIN_TOPICS_BEFORE_SWEEP = 64
+
+    def __init__(self, limit=None, topic_limit=None, clock=time.monotonic):
+        self.limit = limit
+        self.topic_limit = topic_limit
+        self.stats = RateLimitStats()
+        self._clock = clock
+        if limit is None:
+            self._message_bucket = self._byte_bucket = None
+        else:
+            self._message_bucket, self._byte_bucket = limit._buckets(clock)
+        # topic -> (messages, bytes) buckets.
+        self._topic_buckets = {}
+        self._sweep_at = self.MIN_TOPICS_BEFORE_SWEEP
+
+    def topic_delay(self, topic):
+        '''
+        Takes a message from a topic's buckets.
+
+        :returns:   The number of seconds to wait before queueing the
+                    message.
+        '''
+        message_bucket, byte_bucket = self._buckets_for(topic)
+        delay = 0
+        if message_bucket is not None:
+            delay = message_bucket.take()
+        if byte_bucket is not None:
+            # The size of the message isn't known until it's encoded, so
+            # bytes are taken in send_delay, & here we just wait for any
+            # debt to be paid off.
+            delay = max(delay, byte_bucket.delay())
+        return delay
+
+    def send_delay(self, topic, event, size):
+        '''
+        Takes a message that's about to be sent from the socket wide
+        buckets.  Called by transports for every message they send.
+
+        Control messages (joins, leaves, replies & heartbeats) are never
+        delayed, as holding up a heartbeat could make the socket think the
+        connection is dead.  They still count towards the limits though, so
+        they delay the messages after them instead.
+
+        :param topic:   The topic of the message.
+        :param event:   The event of the message.
+        :param size:    The size of the encoded message.
+        :returns:       The number of seconds to wait before sending the
+                        message.
+        '''
+        self.stats.messages += 1
+        if self.topic_limit is not None:
+            byte_bucket = self._buckets_for(topic)[1]
+            if byte_bucket is not None:
+                byte_bucket.take(size)
+
+        delay = 0
+        if self._message_bucket is not None:
+            delay = self._message_bucket.take()
+        if self._byte_bucket is not None:
+            delay = max(delay, self._byte_bucket.take(size))
+        if self.exempt(event):
+            return 0
+        return delay
+
+    def exempt(self, event):
+        '''
+        Checks whether messages with an event are exempt from waiting.
+        '''
+        return event in CONTROL_EVENTS
+
+    async def wait(self, delay):
+        '''
+        Waits for a delay returned by topic_delay or send_delay, recording
+        it in the stats.
+        '''
+        self.stats.record_wait(delay)
+        await asyncio.sleep(delay)
+
+    def _buckets_for(self, topic):
+        buckets = self._topic_buckets.get(topic)
+        if buckets is None:
+            if len(self._topic_buckets) >= self._sweep_at:
+                self._sweep_topics()
+            buckets = self.topic_limit._buckets(self._clock)
+            self._topic_buckets[topic] = buckets
+        return buckets
+
+    def _sweep_topics(self):
+        '''
+        Removes the buckets of topics that have refilled to capacity.
+
+        A full bucket behaves just like a new one, so this doesn't change
+        what gets delayed.  Sweeps happen each time the number of topics
+        doubles, so their cost is spread across the topics added.
+        '''
+        self._topic_buckets = {
+            topic: buckets
+            for topic, buckets in self._topic_buckets.items()
+            if not all(bucket is None or bucket.full() for bucket in buckets)
+        }
+        self._sweep_at = max(
+            2 * len(self._topic_buckets), self.MIN_TOPICS_BEFORE_SWEEP
+        )
@@ -1,20 +1,51 @@
-from concurrent.futures import FIRST_COMPLETED
+from collections import deque, namedtuple
 from urllib.parse import urlsplit
 import asyncio
+import heapq
 import logging
+import random
 
 from .transports import (
-    WebsocketTransport, TransportMessage, OutgoingTransportMessage
+    WebsocketTransport, LongPollTransport, TransportMessage,
+    OutgoingTransportMessage
 )
-from .channel import Channel
-from .messages import SentMessage, ChannelEvents, IncomingMessage
-from .utils import get_unless_done, DONE
+from .transports.base import ConnectionLost, load_payload
+from .channel import Channel, Subscription
+from .messages import (
+    SentMessage, ChannelEvents, IncomingMessage, ReplyTimeout, CONTROL_EVENTS
+)
+from .metrics import Metrics, reports_replies
+from .ratelimit import RateLimiter
+from .topics import TopicTrie
+from .utils import OverflowPolicy, OutgoingQueue, cancel_task
 
-__all__ = ['Socket']
+__all__ = [
+    'Socket', 'OutgoingQueueFull', 'HeartbeatTimeout', 'ConnectionLost',
+    'JoinResults'
+]
 
 logger = logging.getLogger(__name__)
 
 
+class OutgoingQueueFull(Exception):
+    '''
+    Raised when a message can't be queued as the outgoing queue is full.
+    '''
+    pass
+
+
+class HeartbeatTimeout(ConnectionLost):
+    '''
+    Raised when the server doesn't reply to a heartbeat in time, and the
+    connection is presumed dead.
+    '''
+    pass
+
+
+# The result of Socket.join_many.
+JoinResults = namedtuple('JoinResults', ['channels', 'responses', 'failures'])
+
+
 # TODO: Should this be called Socket? Dunno if it matches up with phoenix too
 # well..
 class Socket:
@@ -24,63 +55,265 @@ class Socket:
     A transport will automatically be selected based on the URL provided.
     See the TRANSPORTS dict for more details.
 
-    :param url:    The URL of the phoenix server to connect to.
-    :param params: Optional parameters to use when connecting.
+    :param url:               The URL of the phoenix server to connect to.
+    :param params:            Optional parameters to use when connecting.
+    :param transport_options: Optional dict of extra keyword arguments to
+                              pass to the transport.  See the individual
+                              transport classes for details.
+    :param max_outgoing:      The maximum number of messages that can be
+                              waiting to be sent.  0 means unlimited.
+    :param outgoing_overflow: An OverflowPolicy that determines what `push`
+                              does when the outgoing queue is full.  Either
+                              waits for space (block) or raises
+                              OutgoingQueueFull (error).
+    :param reply_timeout:     The default number of seconds to wait for a
+                              reply to a push.  None waits forever.
+    :param heartbeat_interval: The number of seconds between heartbeats.  If
+                               a heartbeat isn't replied to within this time
+                               the connection is presumed dead.  None
+                               disables heartbeats.
+    :param reconnect:         If True, the socket will automatically
+                              reconnect if the connection is lost, and rejoin
+                              any channels that were joined.  Pushes made
+                              while disconnected are buffered on the outgoing
+                              queue (see max_outgoing) until the channels
+                              have been rejoined.
+    :param reconnect_delay:   The base delay before reconnecting, in seconds.
+                              This is doubled on each failed attempt, and
+                              jittered.
+    :param max_reconnect_delay: The maximum delay before reconnecting.
+    :param metrics:           A Metrics instance to report metrics to, such
+                              as an InMemoryMetrics.  By default no metrics
+                              are collected.
+    :param rate_limit:        Optional RateLimit on the messages sent by the
+                              socket as a whole.  Messages over the limit are
+                              delayed, not dropped.
+    :param topic_rate_limit:  Optional RateLimit that's applied to each topic
+                              separately.  Pushes wait before being queued,
+                              except for push_nowait & replies, which aren't
+                              delayed but still count towards the limit.
+                              See `rate_limiter.stats` for how long messages
+                              waited.
+    :param lane_weights:      Optional dict of lane -> weight for the
+                              outgoing queue.  Joins, leaves, replies &
+                              heartbeats are always sent first.  Other
+                              messages are queued in lanes, one per channel
+                              by default (see Channel's lane), which take
+                              turns to send `weight` messages.  Lanes that
+                              aren't listed have a weight of 1.
     '''
 
+    # The number of heartbeat round trip times to keep in heartbeat_rtts.
+    HEARTBEAT_RTT_HISTORY = 100
+
     # A mapping of url scheme -> transport.
     TRANSPORTS = {
         'ws': WebsocketTransport,
-        'wss': WebsocketTransport
+        'wss': WebsocketTransport,
+        'http': LongPollTransport,
+        'https': LongPollTransport
     }
 
     # TODO: Should these parameters be passed to connect?  Maybe not..
-    def __init__(self, url, params):
+    def __init__(self, url, params, transport_options=None, max_outgoing=0,
+                 outgoing_overflow=OverflowPolicy.block, reply_timeout=10,
+                 heartbeat_interval=30, reconnect=True, reconnect_delay=1,
+                 max_reconnect_delay=30, metrics=None, rate_limit=None,
+                 topic_rate_limit=None, lane_weights=None):
+        if outgoing_overflow not in (OverflowPolicy.block,
+                                     OverflowPolicy.error):
+            raise ValueError(
+                "Unsupported outgoing_overflow: {}".format(outgoing_overflow)
+            )
         self.url = url
         self.params = params
+        self.transport_options = transport_options or {}
+        self.outgoing_overflow = outgoing_overflow
+        self.reply_timeout = reply_timeout
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_rtts = deque(maxlen=self.HEARTBEAT_RTT_HISTORY)
+        self.reconnect = reconnect
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.reconnects = 0
         self.connected = False
         self.channels = {}
+        self._subscriptions = TopicTrie()
         self._incoming = asyncio.Queue()
-        self._outgoing = asyncio.Queue()
+        self._outgoing = OutgoingQueue(
+            max_outgoing, lane_key=self._lane_of, lane_weights=lane_weights
+        )
         self._ref = 1
         self._response_futures = {}
+        # ref -> sent future, for pushes that are waiting on a reply but
+        # haven't been sent yet.
+        self._unsent = {}
+        # A heap of (deadline, ref) for replies we're waiting on, and a timer
+        # that fires at the earliest deadline.  Entries for replies that
+        # have already arrived are left in the heap & skipped when popped.
+        self._reply_deadlines = []
+        self._reply_timer = None
+        self._transport_task = None
+        self._transport_failure = None
+        self._heartbeat_task = None
+        self.rate_limiter = None
+        if rate_limit is not None or topic_rate_limit is not None:
+            self.rate_limiter = RateLimiter(rate_limit, topic_rate_limit)
+
+        self.metrics = metrics or Metrics()
+        self._time_replies = reports_replies(self.metrics)
+        self.metrics.register_gauge(
+            'outgoing_queue_depth', self._outgoing.qsize
+        )
+        self.metrics.register_gauge(
+            'incoming_queue_depth', self._incoming_depth
+        )
+        self.metrics.register_gauge(
+            'outstanding_replies', lambda: self.outstanding_replies
+        )
 
     async def connect(self):
         if self.connected:
             raise Exception("Already connected!")
 
-        transport_class = self.TRANSPORTS[urlsplit(self.url).scheme]
-        self.transport = transport_class(
-            self.url, self.params, self._incoming, self._outgoing
-        )
-        transport_task = asyncio.ensure_future(self.transport.run())
-
-        await self.transport.ready
+        await self._open_transport()
 
-        self._transport_task = transport_task
-        self._done_recv = asyncio.Future()
         self._recv_task = asyncio.ensure_future(self._recv_loop())
-        # TODO: Ok, so this is cool - but how to tell if our transport_task has
-        # failed.
+        self._supervisor_task = asyncio.ensure_future(
+            self._supervise_transport()
+        )
         self.connected = True
 
     async def disconnect(self):
         if not self.connected:
             raise Exception("Not connected!")
 
-        self._done_recv.set_result(True)
-        await self.transport.stop()
+        await cancel_task(self._supervisor_task)
+        await self._close_transport()
+        await cancel_task(self._recv_task)
 
-        await asyncio.gather(self._recv_task, self._transport_task)
+        # Nothing is going to reply to any outstanding pushes now.
+        self._fail_outstanding_replies()
 
         self.connected = False
 
-    def channel(self, topic, params):
+    @property
+    def heartbeat_rtt(self):
+        '''
+        The round trip time of the last heartbeat, in seconds.
+
+        None if no heartbeat has been replied to yet.  heartbeat_rtts contains
+        the times for the most recent heartbeats.
+        '''
+        if not self.heartbeat_rtts:
+            return None
+        return self.heartbeat_rtts[-1]
+
+    @property
+    def outstanding_replies(self):
+        '''
+        The number of pushes that are currently waiting on a reply.
+        '''
+        return len(self._response_futures)
+
+    def _incoming_depth(self):
+        '''
+        The number of received messages waiting to be routed or received
+        from a channel.
+        '''
+        return self._incoming.qsize() + sum(
+            receiver._incoming_messages.qsize()
+            for receivers in (self.channels.values(), self._subscriptions)
+            for receiver in receivers
+        )
+
+    def channel(self, topic, params, **kwargs):
+        '''
+        Creates a channel.
+
+        :param topic:   The topic of the channel.
+        :param params:  The params to send when joining the channel.
+        :param kwargs:  Any extra options for the channel, such as
+                        max_incoming.  See Channel for details.
+        '''
         # TODO: What to do if we already have this channel?
-        channel = Channel(self, topic, params)
+        channel = Channel(self, topic, params, **kwargs)
         self.channels[topic] = channel
         return channel
 
+    async def join_many(self, topics, max_in_flight=100, **kwargs):
+        '''
+        Creates & joins many channels.
+
+        Joins are pipelined: up to max_in_flight are sent without waiting
+        for replies, and another is sent as each reply arrives.  This avoids
+        both paying a round trip per channel and flooding the server with
+        joins.
+
+        :param topics:        A dict of topic -> params, or an iterable of
+                              (topic, params) tuples.
+        :param max_in_flight: The maximum number of joins waiting on a reply
+                              at once.
+        :param kwargs:        Any extra options for the channels.  See
+                              Channel for details.
+        :returns:             A JoinResults.  `channels` & `responses` are
+                              dicts of topic -> channel & topic -> join
+                              response for the successful joins, and
+                              `failures` is a dict of topic -> exception for
+                              the rest.
+        '''
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight must be at least 1")
+        if isinstance(topics, dict):
+            topics = topics.items()
+
+        results = JoinResults({}, {}, {})
+        in_flight = {}
+
+        async def wait_for_joins(return_when):
+            done, _ = await asyncio.wait(in_flight, return_when=return_when)
+            for join in done:
+                channel = in_flight.pop(join)
+                if join.exception() is not None:
+                    results.failures[channel.topic] = join.exception()
+                else:
+                    results.channels[channel.topic] = channel
+                    results.responses[channel.topic] = join.result()
+
+        try:
+            for topic, params in topics:
+                if len(in_flight) >= max_in_flight:
+                    await wait_for_joins(asyncio.FIRST_COMPLETED)
+                channel = self.channel(topic, params, **kwargs)
+                in_flight[asyncio.ensure_future(channel.join())] = channel
+            if in_flight:
+                await wait_for_joins(asyncio.ALL_COMPLETED)
+        except asyncio.CancelledError:
+            for join in in_flight:
+                join.cancel()
+            raise
+
+        return results
+
+    def subscribe(self, pattern, **kwargs):
+        '''
+        Subscribes to all messages for topics that match a pattern.
+
+        A '*' segment matches any single segment of a topic, or any number of
+        segments at the end of a pattern.  For example 'room:*' matches
+        'room:lobby' & 'room:eu:lobby', and 'room:*:lobby' matches
+        'room:eu:lobby'.
+
+        :param pattern: The topic pattern.
+        :param kwargs:  Any extra options for the subscription, such as
+                        max_incoming.  See Subscription for details.
+        :returns:       A Subscription, which can be received from like a
+                        channel.
+        '''
+        subscription = Subscription(self, pattern, **kwargs)
+        self._subscriptions.add(pattern, subscription)
+        return subscription
+
     async def __aenter__(self):
         await self.connect()
         return self
@@ -92,13 +325,16 @@ class Socket:
         # TODO: More thought around this function...
         if not self.connected:
             raise Exception("Not connected!")
+        if self._transport_failure is not None:
+            raise self._transport_failure
         if self._transport_task.done():
             # We've probably excepted.
             # TODO: Do something more thorough here...
             self._transport_task.result()
 
     # TODO: _push_message?
-    async def _send_message(self, topic, event, payload, ref=None):
+    async def _send_message(self, topic, event, payload, ref=None,
+                            timeout=None, join_ref=None):
         '''
         Sends a message to the remote.
 
@@ -106,25 +342,428 @@ class Socket:
         :param event:   The name of the event to send.
         :param payload: The payload of the event.
         :param ref:     Optional ref to use for sending.
+        :param timeout: Optional number of seconds to wait for a reply.
+                        Defaults to self.reply_timeout.
+        :param join_ref: The ref of the join for the channel this message is
+                         for, if any.
         :returns:       The ref of the event, which can be used to receive
                         replies.
         '''
+        # Reply latency includes any time spent waiting to be queued, as
+        # that's when the socket is backed up.
+        started = None
+        if self._time_replies:
+            started = asyncio.get_event_loop().time()
+        if self._limits_topics and event not in CONTROL_EVENTS:
+            delay = self.rate_limiter.topic_delay(topic)
+            if delay:
+                await self.rate_limiter.wait(delay)
+
+        message, resp_future = self._make_message(
+            topic, event, payload, ref, join_ref
+        )
+        if (self.outgoing_overflow is OverflowPolicy.error or
+                event in CONTROL_EVENTS):
+            self._put_outgoing_nowait(
+                message, resp_future, timeout, started
+            )
+        else:
+            await self._outgoing.put(message)
+            self._expect_reply(message, resp_future, timeout, started)
+        await message.sent
+        # TODO: Return something slightly different....
+        return SentMessage(resp_future, message.sent)
+
+    def _send_message_nowait(self, topic, event, payload, ref=None,
+                             timeout=None, join_ref=None):
+        '''
+        Queues a message for sending to the remote, without waiting for it to
+        be sent.
+
+        Takes the same parameters as _send_message.
+
+        :raises OutgoingQueueFull: If the outgoing queue is full.
+        '''
+        message, resp_future = self._make_message(
+            topic, event, payload, ref, join_ref
+        )
+        self._put_outgoing_nowait(message, resp_future, timeout)
+        if self._limits_topics and event not in CONTROL_EVENTS:
+            # We can't wait here, but this'll delay the topic's next push.
+            self.rate_limiter.topic_delay(topic)
+        return SentMessage(resp_future, message.sent)
+
+    @property
+    def _limits_topics(self):
+        return (
+            self.rate_limiter is not None and
+            self.rate_limiter.topic_limit is not None
+        )
+
+    def _lane_of(self, message):
+        '''
+        Returns the outgoing lane for a message.
+        '''
+        topic = message.message.topic
+        channel = self.channels.get(topic)
+        if channel is None:
+            return topic
+        return channel.lane
+
+    def _make_ref(self):
+        # Refs are strings, as in phoenix.js, so they match whether they come
+        # back to us in JSON or in a binary frame.
+        ref = str(self._ref)
+        self._ref += 1
+        return ref
+
+    def _make_message(self, topic, event, payload, ref, join_ref):
         if not ref:
-            ref = self._ref
-            self._ref += 1
+            ref = self._make_ref()
 
         message = OutgoingTransportMessage(
-            TransportMessage(event, topic, payload, ref),
+            TransportMessage(event, topic, payload, ref, join_ref),
             asyncio.Future()
         )
-        # TODO: add a done callback to reply_future that deletes it from
-        # self._response_futures after a certain time...
-        resp_future = asyncio.Future()
+        if event == ChannelEvents.reply.value:
+            # Nothing replies to a reply.
+            return message, None
+        return message, asyncio.Future()
+
+    def _put_outgoing_nowait(self, message, resp_future, timeout,
+                             started=None):
+        if message.message.event in CONTROL_EVENTS:
+            self._outgoing.put_control_nowait(message)
+        else:
+            try:
+                self._outgoing.put_nowait(message)
+            except asyncio.QueueFull:
+                raise OutgoingQueueFull() from None
+        self._expect_reply(message, resp_future, timeout, started)
+
+    def _expect_reply(self, message, resp_future, timeout, started=None):
+        '''
+        Registers a future to be resolved when a reply to message arrives.
+
+        The future is removed when the reply arrives, when it's cancelled, or
+        when the timeout expires.  In the last case it'll be failed with a
+        ReplyTimeout.
+
+        :param started: Optional loop time the push was made at, for reply
+                        latency metrics.  Defaults to now.
+        '''
+        if resp_future is None:
+            return
+
+        ref = message.message.ref
         self._response_futures[ref] = resp_future
-        await self._outgoing.put(message)
-        await message.sent
-        # TODO: Return something slightly different....
-        return SentMessage(resp_future)
+        resp_future.add_done_callback(
+            lambda future: self._response_cancelled(ref, future)
+        )
+        if not message.sent.done():
+            self._unsent[ref] = message.sent
+            message.sent.add_done_callback(
+                lambda _: self._unsent.pop(ref, None)
+            )
+        if self._time_replies:
+            self._time_reply(message.message, resp_future, started)
+
+        if timeout is None:
+            timeout = self.reply_timeout
+        if timeout is None:
+            return
+
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + timeout
+        heapq.heappush(self._reply_deadlines, (deadline, ref))
+        if self._reply_deadlines[0][1] == ref:
+            # This is now the earliest deadline, so the timer needs moved.
+            if self._reply_timer:
+                self._reply_timer.cancel()
+            self._reply_timer = loop.call_at(deadline, self._expire_replies)
+        elif len(self._reply_deadlines) > 2 * len(self._response_futures) + 64:
+            self._compact_reply_deadlines()
+
+    def _time_reply(self, message, resp_future, started=None):
+        '''
+        Reports the time it takes for a reply to message to arrive.
+        '''
+        loop = asyncio.get_event_loop()
+        if started is None:
+            started = loop.time()
+
+        def done(future):
+            if future.cancelled():
+                return
+            exception = future.exception()
+            if isinstance(exception, (ReplyTimeout, ConnectionLost)):
+                return
+            self.metrics.reply_received(
+                message.topic, message.event, loop.time() - started
+            )
+
+        resp_future.add_done_callback(done)
+
+    def _response_cancelled(self, ref, future):
+        if future.cancelled() and self._response_futures.get(ref) is future:
+            del self._response_futures[ref]
+
+    def _compact_reply_deadlines(self):
+        '''
+        Drops heap entries for replies that are no longer outstanding.
+        '''
+        self._reply_deadlines = [
+            entry for entry in self._reply_deadlines
+            if entry[1] in self._response_futures
+        ]
+        heapq.heapify(self._reply_deadlines)
+
+    def _expire_replies(self):
+        '''
+        Fails any outstanding replies that have passed their deadline.
+
+        Called by self._reply_timer.
+        '''
+        self._reply_timer = None
+        loop = asyncio.get_event_loop()
+        now = loop.time()
+        deadlines = self._reply_deadlines
+        while deadlines and deadlines[0][0] <= now:
+            _, ref = heapq.heappop(deadlines)
+            future = self._response_futures.pop(ref, None)
+            if future is not None and not future.done():
+                future.set_exception(ReplyTimeout(
+                    "Timed out waiting for reply to {}".format(ref)
+                ))
+
+        if deadlines:
+            self._reply_timer = loop.call_at(
+                deadlines[0][0], self._expire_replies
+            )
+
+    async def _open_transport(self):
+        '''
+        Creates a transport & waits for it to connect.
+
+        Also starts sending heartbeats over the transport.
+        '''
+        transport_class = self.TRANSPORTS[urlsplit(self.url).scheme]
+        transport = transport_class(
+            self.url, self.params, self._incoming, self._outgoing,
+            **self.transport_options
+        )
+        transport.metrics = self.metrics
+        transport.rate_limiter = self.rate_limiter
+        self.transport = transport
+        transport_task = asyncio.ensure_future(transport.run())
+        try:
+            await transport.ready
+        except asyncio.CancelledError:
+            transport_task.cancel()
+            raise
+        except Exception:
+            # The transport task will have failed with the same exception,
+            # which we retrieve so asyncio doesn't log it as unhandled.
+            await asyncio.wait([transport_task])
+            if not transport_task.cancelled():
+                transport_task.exception()
+            raise
+
+        self._transport_task = transport_task
+        self._transport_failure = None
+        if self.heartbeat_interval:
+            self._heartbeat_task = asyncio.ensure_future(
+                self._heartbeat_loop()
+            )
+
+    async def _close_transport(self):
+        '''
+        Stops the current transport (if it's not already stopped) & its
+        heartbeats.
+        '''
+        if self._heartbeat_task:
+            await cancel_task(self._heartbeat_task)
+            self._heartbeat_task = None
+
+        transport_task = self._transport_task
+        self._transport_task = None
+        if transport_task is None or transport_task.done():
+            # Any failure has already been handled by _supervise_transport.
+            return
+
+        await self.transport.stop()
+        try:
+            await transport_task
+        except asyncio.CancelledError:
+            # We cancel the transport ourselves if it stops responding.
+            if self._transport_failure is None:
+                raise
+
+    async def _supervise_transport(self):
+        '''
+        Waits for the transport to fail, and reconnects if configured to.
+        '''
+        while True:
+            await asyncio.wait([self._transport_task])
+            failure = self._transport_failure
+            if failure is None and not self._transport_task.cancelled():
+                failure = self._transport_task.exception()
+            logger.warning("Lost connection to server: %r", failure)
+            self._transport_failure = failure or ConnectionLost()
+
+            # Pause all but control messages, so buffered pushes wait until
+            # we've rejoined channels.
+            self._outgoing.pause()
+            if isinstance(failure, ConnectionLost):
+                lost = failure
+            else:
+                lost = ConnectionLost("Lost connection to server")
+                lost.__cause__ = failure
+            # Pushes that haven't been sent yet will be sent once we've
+            # reconnected, so can still be replied to.
+            self._fail_outstanding_replies(lost, keep_unsent=self.reconnect)
+
+            if self._heartbeat_task:
+                await cancel_task(self._heartbeat_task)
+                self._heartbeat_task = None
+
+            if not self.reconnect:
+                return
+
+            await self._reconnect()
+            await self._rejoin_channels()
+            self._outgoing.resume()
+
+    async def _reconnect(self):
+        '''
+        Reconnects the transport, retrying with a jittered exponential
+        backoff until it succeeds.
+        '''
+        attempt = 0
+        while True:
+            delay = min(
+                self.max_reconnect_delay, self.reconnect_delay * 2 ** attempt
+            )
+            await asyncio.sleep(random.uniform(0, delay))
+            attempt += 1
+            try:
+                await self._open_transport()
+            except Exception as e:
+                logger.warning(
+                    "Reconnect attempt %d failed: %r", attempt, e
+                )
+            else:
+                self.reconnects += 1
+                self.metrics.reconnected()
+                logger.info("Reconnected after %d attempts", attempt)
+                return
+
+    async def _rejoin_channels(self):
+        '''
+        Rejoins any channels that were joined before a reconnect.
+        '''
+        channels = [
+            channel for channel in self.channels.values() if channel.joined
+        ]
+        results = await asyncio.gather(
+            *[channel.join() for channel in channels],
+            return_exceptions=True
+        )
+        join_refs = {}
+        for channel, result in zip(channels, results):
+            if isinstance(result, Exception):
+                logger.warning(
+                    "Failed to rejoin %s: %r", channel.topic, result
+                )
+            else:
+                join_refs[channel.topic] = channel._join_ref
+
+        # Pushes buffered while we were disconnected were made with the
+        # join_ref of the old join, which the server would treat as stale.
+        def update_join_ref(queued):
+            message = queued.message
+            join_ref = join_refs.get(message.topic)
+            if join_ref is None or message.join_ref is None:
+                return queued
+            return queued._replace(
+                message=message._replace(join_ref=join_ref)
+            )
+
+        if join_refs:
+            self._outgoing.rewrite(update_join_ref)
+
+    def _fail_outstanding_replies(self, exception=None, keep_unsent=False):
+        '''
+        Fails the replies we're waiting on.
+
+        :param exception:   The exception to fail them with.  If None they'll
+                            be cancelled.
+        :param keep_unsent: If True, replies to pushes that haven't been sent
+                            yet are left waiting, along with their timeouts.
+        '''
+        response_futures = self._response_futures
+        self._response_futures = {}
+        for ref, future in response_futures.items():
+            sent = self._unsent.get(ref)
+            if keep_unsent and sent is not None and not sent.done():
+                self._response_futures[ref] = future
+                continue
+            if future.done():
+                continue
+            if exception is None:
+                future.cancel()
+            else:
+                future.set_exception(exception)
+
+        if self._reply_timer:
+            self._reply_timer.cancel()
+            self._reply_timer = None
+        self._compact_reply_deadlines()
+        if self._reply_deadlines:
+            self._reply_timer = asyncio.get_event_loop().call_at(
+                self._reply_deadlines[0][0], self._expire_replies
+            )
+
+    async def _heartbeat_loop(self):
+        '''
+        Periodically sends heartbeats to the server & records how long they
+        take to be replied to.
+
+        If a heartbeat isn't replied to in time, the transport is presumed
+        dead and is cancelled.
+        '''
+        loop = asyncio.get_event_loop()
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            heartbeat = self._send_message_nowait(
+                'phoenix', 'heartbeat', {}, timeout=self.heartbeat_interval
+            )
+
+            sent_at = []
+            heartbeat.sent.add_done_callback(
+                lambda _: sent_at.append(loop.time())
+            )
+            try:
+                await heartbeat.response()
+            except ReplyTimeout:
+                self._heartbeat_failed()
+                return
+            except ConnectionLost:
+                # The transport has already failed, & _supervise_transport
+                # will deal with it.
+                return
+
+            if sent_at:
+                self.heartbeat_rtts.append(loop.time() - sent_at[0])
+
+    def _heartbeat_failed(self):
+        logger.warning("Heartbeat timed out, presuming connection is dead")
+        self._transport_failure = HeartbeatTimeout(
+            "No heartbeat reply within {} seconds".format(
+                self.heartbeat_interval
+            )
+        )
+        self._transport_task.cancel()
 
     async def _recv_loop(self):
         '''
@@ -134,25 +773,56 @@ class Socket:
         them to an appropriate place.
         '''
         while True:
-            message = await get_unless_done(
-                self._incoming.get(), self._done_recv
-            )
-            if message is DONE:
-                break
+            message = await self._incoming.get()
             # TODO: Definitely need to handle phx_close...
             if message.event == ChannelEvents.reply.value:
-                if message.payload['status'] == 'ok':
-                    self._response_futures[message.ref].set_result(
-                        message.payload.get('response')
-                    )
+                future = self._response_futures.pop(message.ref, None)
+                if future is None or future.done():
+                    # Most likely timed out or cancelled.
+                    logger.debug("Dropping reply to %s", message.ref)
+                    continue
+
+                payload = load_payload(message.payload)
+                if payload['status'] == 'ok':
+                    future.set_result(payload.get('response'))
                 else:
                     # TODO: we can do better than this...
-                    self._response_futures[message.ref].set_exception(
-                        Exception("Response not ok!")
-                    )
+                    future.set_exception(Exception("Response not ok!"))
             else:
+                # Note that messages for topics we don't know about are
+                # dropped without their payload ever being decoded.
                 channel = self.channels.get(message.topic)
-                if channel:
-                    await channel._incoming_messages.put(
-                        IncomingMessage(message, self)
-                    )
+                if self._subscriptions:
+                    receivers = self._subscriptions.match(message.topic)
+                    if channel is not None:
+                        receivers.insert(0, channel)
+                elif channel is not None:
+                    receivers = (channel,)
+                else:
+                    continue
+
+                incoming = None
+                for receiver in receivers:
+                    hook = receiver._hooks.get(message.event)
+                    if hook is not None:
+                        handlers = [hook] + receiver._handlers.get(
+                            message.event, []
+                        )
+                    elif receiver._handlers:
+                        # The receiver uses handlers, so messages with no
+                        # handler are dropped before we bother creating an
+                        # IncomingMessage.
+                        handlers = receiver._handlers.get(message.event)
+                        if not handlers:
+                            continue
+                    else:
+                        handlers = None
+
+                    if incoming is None:
+                        incoming = IncomingMessage(message, self)
+                    if handlers:
+                        receiver._call_handlers(handlers, incoming)
+                    elif receiver.incoming_overflow is OverflowPolicy.block:
+                        await receiver._incoming_messages.put(incoming)
+                    else:
+                        receiver._put_incoming_nowait(incoming)
@@ -0,0 +1,345 @@
+'''
+A synchronous interface to chunnel, for use from threaded code.
+'''
+from collections import deque
+from concurrent.futures import CancelledError, Future
+import asyncio
+import logging
+import threading
+
+from .channel import ChannelOverflow
+from .messages import ChannelEvents
+from .socket import Socket
+from .utils import cancel_task
+
+__all__ = ['SyncSocket', 'SyncChannel']
+
+logger = logging.getLogger(__name__)
+
+
+class SyncSocket:
+    '''
+    A synchronous wrapper around a Socket.
+
+    The Socket runs on an event loop in a background thread, which is started
+    by `connect`.  All of the methods here & on SyncChannel can be called
+    from any thread, so many threads can share a single connection.
+
+    Pushes are handed off to the loop through a queue, and the loop is only
+    woken up when the queue goes from empty to non-empty, so pushes from
+    many threads don't each pay for a wakeup.
+
+    Example:
+
+        with SyncSocket('ws://example.com/socket', {}) as socket:
+            channel = socket.channel('room:lobby', {})
+            channel.join()
+            response = channel.push('something', {}).result()
+            for message in channel.receive_many(100, timeout=1):
+                print(message.payload)
+
+    :param url:     The URL of the phoenix server to connect to.
+    :param params:  Optional parameters to use when connecting.
+    :param kwargs:  Any other options for the Socket.
+    '''
+    def __init__(self, url, params, **kwargs):
+        self.url = url
+        self.params = params
+        self.socket = None
+        self.channels = {}
+        self._socket_kwargs = kwargs
+        self._loop = None
+        self._thread = None
+        # Functions waiting to be called on the loop.  See _submit.
+        self._pending = deque()
+        self._wakeup_scheduled = False
+
+    @property
+    def connected(self):
+        return self._thread is not None
+
+    def connect(self, timeout=None):
+        '''
+        Starts the background thread & connects the socket.
+
+        :param timeout: Optional number of seconds to wait for the
+                        connection.
+        '''
+        if self._thread is not None:
+            raise Exception("Already connected!")
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._run_loop, name='chunnel', daemon=True
+        )
+        self._thread.start()
+        try:
+            self._call(self._connect(), timeout)
+        except BaseException:
+            self._stop_loop()
+            raise
+
+    def disconnect(self, timeout=None):
+        '''
+        Disconnects the socket & stops the background thread.
+        '''
+        if self._thread is None:
+            raise Exception("Not connected!")
+
+        try:
+            self._call(self._disconnect(), timeout)
+        finally:
+            self._stop_loop()
+
+    def channel(self, topic, params, max_buffered=1000, **kwargs):
+        '''
+        Creates a channel.
+
+        :param topic:        The topic of the channel.
+        :param params:       The params to send when joining the channel.
+        :param max_buffered: The maximum number of incoming messages to
+                             buffer for threads to receive.  Once this many
+                             are buffered, messages wait on the channel's
+                             incoming queue instead.
+        :param kwargs:       Any extra options for the channel.  See Channel.
+        '''
+        return self._call(self._channel(topic, params, max_buffered, kwargs))
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.disconnect()
+
+    async def _connect(self):
+        # The socket is created on the loop's thread so that anything it
+        # creates belongs to the right loop.
+        self.socket = Socket(self.url, self.params, **self._socket_kwargs)
+        await self.socket.connect()
+
+    async def _disconnect(self):
+        for channel in self.channels.values():
+            await cancel_task(channel._pump_task)
+        await self.socket.disconnect()
+
+    async def _channel(self, topic, params, max_buffered, kwargs):
+        channel = self.socket.channel(topic, params, **kwargs)
+        sync_channel = SyncChannel(self, channel, max_buffered)
+        self.channels[topic] = sync_channel
+        return sync_channel
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+
+    def _stop_loop(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._thread = None
+
+    def _call(self, coro, timeout=None):
+        '''
+        Runs a coroutine on the loop & waits for the result.
+        '''
+        future = asyncio.run_coroutine_threadsafe(coro, self._loop)
+        try:
+            return future.result(timeout)
+        except BaseException:
+            future.cancel()
+            raise
+
+    def _submit(self, func, *args):
+        '''
+        Calls func on the loop, without waiting for it.
+
+        Safe to call from any thread.
+        '''
+        if self._thread is None:
+            raise Exception("Not connected!")
+        self._pending.append((func, args))
+        if not self._wakeup_scheduled:
+            # If two threads get here at once, the loop is woken twice, which
+            # is harmless.
+            self._wakeup_scheduled = True
+            self._loop.call_soon_threadsafe(self._run_pending)
+
+    def _run_pending(self):
+        # This is cleared before running anything, so that functions
+        # submitted while we're running will schedule another call if we
+        # miss them.
+        self._wakeup_scheduled = False
+        pending = self._pending
+        while pending:
+            func, args = pending.popleft()
+            try:
+                func(*args)
+            except Exception:
+                logger.exception("Error running %r", func)
+
+
+class SyncChannel:
+    '''
+    A synchronous wrapper around a Channel.
+
+    Should not be instantiated directly, but through a SyncSocket.
+
+    Incoming messages are moved from the channel to a buffer in batches, from
+    which any thread can receive them.
+    '''
+    def __init__(self, socket, channel, max_buffered):
+        self.socket = socket
+        self.channel = channel
+        self.max_buffered = max_buffered
+        self._buffer = deque()
+        self._condition = threading.Condition()
+        self._overflowed = False
+        # Set when the buffer has space again, after being full.
+        self._space = asyncio.Event()
+        self._pump_task = asyncio.ensure_future(self._pump())
+
+    @property
+    def topic(self):
+        return self.channel.topic
+
+    def join(self, timeout=None):
+        '''
+        Joins the channel, waiting for the reply.
+
+        :returns:   The response to the join.
+        '''
+        return self.socket._call(self.channel.join(), timeout)
+
+    def leave(self, timeout=None):
+        '''
+        Leaves the channel.
+        '''
+        return self.socket._call(self.channel.leave(), timeout)
+
+    def push(self, event, payload, timeout=None):
+        '''
+        Pushes a message to the channel, without waiting for it to be sent.
+
+        :param event:   The event to push.
+        :param payload: The payload for the event.
+        :param timeout: Optional number of seconds to wait for a reply.
+                        Defaults to the socket's reply_timeout.
+        :returns:       A concurrent.futures.Future for the response.  This
+                        fails with OutgoingQueueFull if the socket's outgoing
+                        queue was full.
+        '''
+        future = Future()
+        self.socket._submit(self._push, event, payload, timeout, future)
+        return future
+
+    def reply(self, message, status, response):
+        '''
+        Replies to an incoming message, without waiting for it to be sent.
+        '''
+        self.socket._submit(
+            self.socket.socket._send_message_nowait,
+            message.topic, ChannelEvents.reply.value,
+            {'status': status, 'response': response},
+            message._transport_message.ref
+        )
+
+    def receive(self, timeout=None):
+        '''
+        Receives the next incoming message.
+
+        :param timeout: Optional number of seconds to wait.
+        :returns:       The message, or None if the timeout expired.
+        :raises ChannelOverflow: As for Channel.receive.
+        '''
+        messages = self.receive_many(1, timeout)
+        if not messages:
+            return None
+        return messages[0]
+
+    def receive_many(self, max_n, timeout=None):
+        '''
+        Receives a batch of incoming messages.
+
+        Waits for a message to arrive, then returns it along with any others
+        that are already buffered, up to max_n in total.
+
+        :param max_n:   The maximum number of messages to return.
+        :param timeout: Optional number of seconds to wait for a message.
+        :returns:       A list of IncomingMessages.  This is empty if the
+                        timeout expired before any messages arrived.
+        :raises ChannelOverflow: As for Channel.receive.
+        '''
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self._buffer or self._overflowed, timeout
+            )
+            if self._overflowed:
+                self._overflowed = False
+                raise ChannelOverflow(
+                    "{} messages dropped on {}".format(
+                        self.channel.dropped, self.topic
+                    )
+                )
+            was_full = len(self._buffer) >= self.max_buffered
+            messages = [
+                self._buffer.popleft()
+                for _ in range(min(max_n, len(self._buffer)))
+            ]
+
+        if was_full and messages:
+            self.socket._loop.call_soon_threadsafe(self._space.set)
+        return messages
+
+    def __iter__(self):
+        while True:
+            yield self.receive()
+
+    def _push(self, event, payload, timeout, future):
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            message = self.channel.push_nowait(event, payload, timeout)
+        except Exception as e:
+            future.set_exception(e)
+            return
+        message.response_future.add_done_callback(
+            lambda response: _copy_result(response, future)
+        )
+
+    async def _pump(self):
+        '''
+        Moves incoming messages from the channel to the buffer.
+        '''
+        while True:
+            with self._condition:
+                space = self.max_buffered - len(self._buffer)
+                if space <= 0:
+                    self._space.clear()
+            if space <= 0:
+                await self._space.wait()
+                continue
+
+            try:
+                messages = await self.channel.receive_many(space)
+            except ChannelOverflow:
+                with self._condition:
+                    self._overflowed = True
+                    self._condition.notify_all()
+                continue
+
+            with self._condition:
+                self._buffer.extend(messages)
+                self._condition.notify_all()
+
+
+def _copy_result(source, destination):
+    '''
+    Copies the result of an asyncio future to a concurrent.futures one.
+    '''
+    if source.cancelled():
+        destination.set_exception(CancelledError())
+    elif source.exception() is not None:
+        destination.set_exception(source.exception())
+    else:
+        destination.set_result(source.result())
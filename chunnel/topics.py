@@ -0,0 +1,125 @@
+__all__ = ['TopicTrie']
+
+
+class _Node:
+    __slots__ = ('children', 'values', 'rest')
+
+    def __init__(self):
+        # segment -> _Node.  A '*' segment matches any single segment.
+        self.children = {}
+        # Values for patterns that end at this node.
+        self.values = []
+        # Values for patterns that end with a '*' after this node, which
+        # match any number of further segments.
+        self.rest = []
+
+
+class TopicTrie:
+    '''
+    Maps topic patterns to values, for looking up the values for a topic.
+
+    Topics are split into segments on ':'.  A '*' segment in a pattern
+    matches any single segment, except at the end of a pattern, where it
+    matches one or more segments - so 'room:*' matches 'room:lobby' and
+    'room:eu:lobby', as in phoenix.
+
+    Matching a topic takes time proportional to the number of segments in
+    it (and the number of '*' segments in patterns), rather than the number
+    of patterns.
+    '''
+    SEPARATOR = ':'
+    WILDCARD = '*'
+
+    def __init__(self):
+        self._root = _Node()
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def add(self, pattern, value):
+        '''
+        Adds a value for a pattern.
+        '''
+        segments, trailing_wildcard = self._split(pattern)
+        node = self._root
+        for segment in segments:
+            child = node.children.get(segment)
+            if child is None:
+                child = node.children[segment] = _Node()
+            node = child
+        if trailing_wildcard:
+            node.rest.append(value)
+        else:
+            node.values.append(value)
+        self._size += 1
+
+    def remove(self, pattern, value):
+        '''
+        Removes a value for a pattern.
+
+        :raises KeyError: If the value isn't in the trie for the pattern.
+        '''
+        segments, trailing_wildcard = self._split(pattern)
+        path = [self._root]
+        for segment in segments:
+            child = path[-1].children.get(segment)
+            if child is None:
+                raise KeyError(pattern)
+            path.append(child)
+
+        values = path[-1].rest if trailing_wildcard else path[-1].values
+        try:
+            values.remove(value)
+        except ValueError:
+            raise KeyError(pattern) from None
+        self._size -= 1
+
+        # Prune any nodes that are no longer needed.
+        for depth in range(len(segments), 0, -1):
+            node = path[depth]
+            if node.children or node.values or node.rest:
+                break
+            del path[depth - 1].children[segments[depth - 1]]
+
+    def match(self, topic):
+        '''
+        Returns a list of the values for all the patterns matching a topic.
+        '''
+        matches = []
+        nodes = [self._root]
+        for segment in topic.split(self.SEPARATOR):
+            next_nodes = []
+            for node in nodes:
+                if node.rest:
+                    matches.extend(node.rest)
+                child = node.children.get(segment)
+                if child is not None:
+                    next_nodes.append(child)
+                child = node.children.get(self.WILDCARD)
+                if child is not None:
+                    next_nodes.append(child)
+            if not next_nodes:
+                return matches
+            nodes = next_nodes
+
+        for node in nodes:
+            matches.extend(node.values)
+        return matches
+
+    def __iter__(self):
+        '''
+        Iterates over all the values.
+        '''
+        nodes = [self._root]
+        while nodes:
+            node = nodes.pop()
+            yield from node.values
+            yield from node.rest
+            nodes.extend(node.children.values())
+
+    def _split(self, pattern):
+        segments = pattern.split(self.SEPARATOR)
+        if segments[-1] == self.WILDCARD:
+            return segments[:-1], True
+        return segments, False
@@ -1,7 +1,13 @@
 from .websocket import WebsocketTransport
-from .base import TransportMessage, OutgoingTransportMessage
+from .longpoll import LongPollTransport, LongPollError
+from .base import TransportMessage, OutgoingTransportMessage, LazyPayload
+from .serializers import V1JSONSerializer, V2JSONSerializer
+from .compression import DeflateCompression, CompressionStats
 
 
 __all__ = [
-    'WebsocketTransport', 'TransportMessage', 'OutgoingTransportMessage'
+    'WebsocketTransport', 'LongPollTransport', 'LongPollError',
+    'TransportMessage', 'OutgoingTransportMessage',
+    'V1JSONSerializer', 'V2JSONSerializer', 'LazyPayload',
+    'DeflateCompression', 'CompressionStats'
 ]
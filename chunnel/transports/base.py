@@ -1,10 +1,55 @@
 import asyncio
 from collections import namedtuple
 
+from ..metrics import Metrics
+
 
 TransportMessage = namedtuple(
-    'TransportMessage', ['event', 'topic', 'payload', 'ref']
+    'TransportMessage', ['event', 'topic', 'payload', 'ref', 'join_ref']
 )
+# join_ref is only used by some serializers, so is optional.
+TransportMessage.__new__.__defaults__ = (None,)
+
+
+class LazyPayload:
+    '''
+    The payload of a TransportMessage that has not been decoded yet.
+
+    Serializers can use this to put off decoding a payload until it's
+    actually needed, which may be never.
+    '''
+    __slots__ = ('data', '_loads')
+
+    def __init__(self, data, loads):
+        self.data = data
+        self._loads = loads
+
+    def load(self):
+        '''
+        Decodes the payload.
+        '''
+        return self._loads(self.data)
+
+
+def load_payload(payload):
+    '''
+    Returns a decoded payload, decoding it if it's a LazyPayload.
+    '''
+    if isinstance(payload, LazyPayload):
+        return payload.load()
+    return payload
+
+
+class ConnectionLost(Exception):
+    '''
+    Raised for pushes that were waiting on a reply when the connection to the
+    server was lost.
+
+    Also used to fail pushes that a transport had taken off the outgoing
+    queue, but not sent, when it was stopped.
+    '''
+    pass
+
 
 # TODO: Could maybe call this Push to mirror it's name in phoenix js imp.
 OutgoingTransportMessage = namedtuple(
@@ -12,6 +57,25 @@ OutgoingTransportMessage = namedtuple(
 )
 
 
+def resolve_sent(batch, exception=None):
+    '''
+    Resolves the sent futures of a batch of OutgoingTransportMessages.
+
+    Futures that are already done, because the push was cancelled while it
+    was queued, are skipped.
+
+    :param batch:       A list of (message, message_data) tuples.
+    :param exception:   Optional exception to fail the futures with.
+    '''
+    for message, _ in batch:
+        if message.sent.done():
+            continue
+        if exception is None:
+            message.sent.set_result(True)
+        else:
+            message.sent.set_exception(exception)
+
+
 class BaseTransport:
     '''
     The base class for a transport.
@@ -21,6 +85,7 @@ class BaseTransport:
     messages and a queue for outgoing messages.
 
     The incoming message queue should contain TransportMessage namedtuples.
+    Their payload may be a LazyPayload, if the serializer decodes lazily.
 
     The outgoing message queue should contain OutgoingTransportMessage
     namedtuples.
@@ -30,12 +95,24 @@ class BaseTransport:
     queue.
 
     Transports are not responsible for interpreting the messages in any way,
-    they just handle the communication.
+    they just handle the communication.  They should however report the
+    messages they send & receive to `self.metrics`, which the socket will
+    replace with its own Metrics.  The socket may also set `rate_limiter` to
+    a RateLimiter, in which case every message should be checked against it
+    before it's sent.
+
+    Subclasses that encode messages with `_encode` should set
+    `self.serializer`, and can run their loops with `_run_loops` to get the
+    default `stop` behaviour.
     '''
     def __init__(self, incoming_queue, outgoing_queue):
         self.incoming = incoming_queue
         self.outgoing = outgoing_queue
+        self.metrics = Metrics()
+        self.rate_limiter = None
         self.ready = asyncio.Future()
+        self._stopping = False
+        self._loop_tasks = []
 
     async def run(self):
         '''
@@ -48,5 +125,53 @@ class BaseTransport:
     async def stop(self):
         '''
         Signals to the transport that it should stop.
+
+        Cancels the loops started by `_run_loops`, which then returns
+        normally.
         '''
-        raise NotImplementedError
+        self._stopping = True
+        for task in self._loop_tasks:
+            task.cancel()
+
+    async def _run_loops(self, *loops):
+        '''
+        Runs a transport's loops until one of them fails or stop is called.
+
+        The loops are stopped by cancelling them, rather than checking for a
+        stop signal on every message.  If one of them fails the others are
+        cancelled, so they don't keep running without it.
+
+        :param loops:   The coroutines to run.
+        '''
+        self._loop_tasks = [asyncio.ensure_future(loop) for loop in loops]
+        try:
+            await asyncio.gather(*self._loop_tasks)
+        except asyncio.CancelledError:
+            if not self._stopping:
+                raise
+        finally:
+            for task in self._loop_tasks:
+                task.cancel()
+
+    def _encode(self, message):
+        '''
+        Encodes an outgoing message with `self.serializer`.
+
+        :returns:   The encoded message, or None if it shouldn't be sent.  In
+                    that case its sent future has been resolved.
+        '''
+        if message.sent.done():
+            # Whoever pushed the message was cancelled while it was queued.
+            return None
+        try:
+            return self._serialize(message.message)
+        except Exception as e:
+            message.sent.set_exception(e)
+            return None
+
+    def _serialize(self, message):
+        '''
+        Serializes a TransportMessage.  Transports can override this to
+        reject messages they can't send, by raising an exception.
+        '''
+        return self.serializer.encode(message)
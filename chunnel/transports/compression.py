@@ -0,0 +1,161 @@
+from websockets.extensions.permessage_deflate import (
+    ClientPerMessageDeflateFactory, PerMessageDeflate
+)
+from websockets.frames import CTRL_OPCODES, Opcode
+
+__all__ = ['DeflateCompression', 'CompressionStats']
+
+
+class CompressionStats:
+    '''
+    Counts the bytes sent & received with compression.
+
+    Only data messages are counted.  Sizes "before" are of the uncompressed
+    messages, and sizes "after" are what went over the wire.
+    '''
+    def __init__(self):
+        self.messages_sent = 0
+        # Messages that were sent uncompressed as they were under min_size.
+        self.messages_sent_uncompressed = 0
+        self.bytes_sent_before = 0
+        self.bytes_sent_after = 0
+        self.messages_received = 0
+        self.bytes_received_before = 0
+        self.bytes_received_after = 0
+
+    @property
+    def sent_ratio(self):
+        '''
+        The size of the sent data as a fraction of its uncompressed size.
+
+        None if nothing has been sent.
+        '''
+        if not self.bytes_sent_before:
+            return None
+        return self.bytes_sent_after / self.bytes_sent_before
+
+    @property
+    def received_ratio(self):
+        '''
+        The size of the received data as a fraction of its uncompressed size.
+
+        None if nothing has been received.
+        '''
+        if not self.bytes_received_before:
+            return None
+        return self.bytes_received_after / self.bytes_received_before
+
+
+class DeflateCompression:
+    '''
+    Options for permessage-deflate compression in WebsocketTransport.
+
+    Compression is only used if the server agrees to it.  Statistics for
+    every transport that uses these options are collected in `stats`.
+
+    :param level:              The zlib compression level, from 1 (fastest) to
+                               9 (smallest).
+    :param window_bits:        The base two logarithm of the size of the
+                               window used to compress messages we send,
+                               from 9 to 15.  Larger windows compress better,
+                               but use more memory.
+    :param server_window_bits: Optional limit on the window the server uses
+                               for messages it sends us, from 8 to 15.
+    :param memory_level:       The zlib memory level, from 1 to 9.  Higher
+                               levels are faster, but use more memory.
+    :param min_size:           Messages smaller than this many bytes are sent
+                               uncompressed, as they're unlikely to shrink
+                               enough to be worth it.
+    :param context_takeover:   If False, each message is compressed on its
+                               own, rather than with the messages before it.
+                               This saves memory between messages, at the
+                               cost of the compression ratio.
+    '''
+    def __init__(self, level=6, window_bits=12, server_window_bits=None,
+                 memory_level=5, min_size=128, context_takeover=True):
+        self.level = level
+        self.window_bits = window_bits
+        self.server_window_bits = server_window_bits
+        self.memory_level = memory_level
+        self.min_size = min_size
+        self.context_takeover = context_takeover
+        self.stats = CompressionStats()
+
+    def extension_factory(self):
+        '''
+        Returns an extension factory to pass to websockets.connect.
+        '''
+        return _DeflateFactory(
+            self,
+            client_no_context_takeover=not self.context_takeover,
+            server_max_window_bits=self.server_window_bits,
+            client_max_window_bits=self.window_bits,
+            compress_settings={
+                'level': self.level, 'memLevel': self.memory_level
+            }
+        )
+
+
+class _DeflateFactory(ClientPerMessageDeflateFactory):
+    '''
+    Negotiates permessage-deflate, returning a _MeasuredDeflate.
+    '''
+    def __init__(self, compression, **kwargs):
+        super().__init__(**kwargs)
+        self.compression = compression
+
+    def process_response_params(self, params, accepted_extensions):
+        extension = super().process_response_params(
+            params, accepted_extensions
+        )
+        return _MeasuredDeflate(
+            self.compression,
+            extension.remote_no_context_takeover,
+            extension.local_no_context_takeover,
+            extension.remote_max_window_bits,
+            extension.local_max_window_bits,
+            extension.compress_settings
+        )
+
+
+class _MeasuredDeflate(PerMessageDeflate):
+    '''
+    A permessage-deflate extension that skips compressing small messages &
+    records compression stats.
+    '''
+    def __init__(self, compression, *args):
+        super().__init__(*args)
+        self.min_size = compression.min_size
+        self.stats = compression.stats
+
+    def encode(self, frame):
+        if frame.opcode in CTRL_OPCODES:
+            return frame
+
+        size = len(frame.data)
+        first = frame.opcode is not Opcode.CONT
+        if first:
+            self.stats.messages_sent += 1
+            if frame.fin and size < self.min_size:
+                # permessage-deflate allows individual messages to be sent
+                # uncompressed.
+                self.stats.messages_sent_uncompressed += 1
+                self.stats.bytes_sent_before += size
+                self.stats.bytes_sent_after += size
+                return frame
+
+        encoded = super().encode(frame)
+        self.stats.bytes_sent_before += size
+        self.stats.bytes_sent_after += len(encoded.data)
+        return encoded
+
+    def decode(self, frame, **kwargs):
+        if frame.opcode in CTRL_OPCODES:
+            return frame
+
+        decoded = super().decode(frame, **kwargs)
+        if frame.opcode is not Opcode.CONT:
+            self.stats.messages_received += 1
+        self.stats.bytes_received_before += len(decoded.data)
+        self.stats.bytes_received_after += len(frame.data)
+        return decoded
@@ -0,0 +1,230 @@
+from urllib.parse import urlencode
+import asyncio
+import json
+import logging
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from .base import BaseTransport, ConnectionLost, resolve_sent
+from .serializers import V1JSONSerializer
+
+__all__ = ['LongPollTransport', 'LongPollError']
+
+logger = logging.getLogger(__name__)
+
+
+class LongPollError(Exception):
+    '''
+    Raised when the long poll endpoint returns an unexpected status.
+    '''
+    pass
+
+
+class LongPollTransport(BaseTransport):
+    '''
+    Implements phoenix's long polling transport, for when websockets aren't
+    available.
+
+    The URL should be the long poll endpoint of the socket, e.g.
+    `http://localhost:4000/socket/longpoll`.
+
+    Requests are made over a pool of keep-alive connections.  A new poll is
+    started as soon as each poll returns, before the messages it returned are
+    handled.  Outgoing messages that are already waiting are batched into a
+    single POST, using the newline delimited format phoenix 1.7 added.  Set
+    `send_batch_size` to 1 for older servers.
+
+    Long polling only supports text messages, so binary payloads can't be
+    sent.
+
+    Requires aiohttp, which can be installed with `pip install
+    chunnel[longpoll]`.
+
+    :param send_batch_size: The maximum number of messages to send in a
+                            single POST.
+    :param serializer:      The serializer to use for messages.  Defaults to
+                            V1JSONSerializer.
+    :param poll_timeout:    The number of seconds to wait for a poll to
+                            return.  Should be longer than the server's long
+                            poll window.
+    :param max_connections: The maximum number of connections to keep open.
+    '''
+    def __init__(self, url, params, incoming_queue, outgoing_queue,
+                 send_batch_size=100, serializer=None, poll_timeout=20,
+                 max_connections=4):
+        if aiohttp is None:
+            raise ImportError(
+                "LongPollTransport requires aiohttp.  "
+                "Install it with `pip install chunnel[longpoll]`"
+            )
+        super().__init__(
+            incoming_queue=incoming_queue, outgoing_queue=outgoing_queue
+        )
+        if send_batch_size < 1:
+            raise ValueError("send_batch_size must be at least 1")
+
+        self.serializer = serializer or V1JSONSerializer()
+        self.params = {'vsn': self.serializer.vsn, **params}
+        self.url = url
+        self.send_batch_size = send_batch_size
+        self.poll_timeout = poll_timeout
+        self.max_connections = max_connections
+        self.token = None
+
+    async def run(self):
+        try:
+            connector = aiohttp.TCPConnector(limit=self.max_connections)
+            async with aiohttp.ClientSession(connector=connector) as session:
+                # The first poll creates a session on the server, which it
+                # signals with a 410.
+                status, _ = await self._request(session, 'GET')
+                if status != 410:
+                    raise LongPollError(
+                        "Unexpected status opening session: {}".format(status)
+                    )
+                self.ready.set_result(True)
+                if self._stopping:
+                    return
+                await self._run_loops(
+                    self._poll_loop(session), self._send_loop(session)
+                )
+        except Exception as e:
+            if not self.ready.done():
+                self.ready.set_exception(e)
+
+            raise
+
+    async def _request(self, session, method, data=None, headers=None):
+        '''
+        Makes a request to the long poll endpoint.
+
+        :returns:   A tuple of (status, messages).
+        '''
+        params = dict(self.params)
+        if self.token is not None:
+            params['token'] = self.token
+        async with session.request(
+            method, self.url + '?' + urlencode(params), data=data,
+            headers=headers,
+            timeout=aiohttp.ClientTimeout(total=self.poll_timeout)
+        ) as response:
+            if response.status != 200:
+                # Phoenix returns statuses in the body, so this is something
+                # in between us & phoenix failing.
+                raise LongPollError(
+                    "HTTP {} from long poll endpoint".format(response.status)
+                )
+            body = json.loads(await response.text())
+
+        if 'token' in body:
+            self.token = body['token']
+        return body['status'], body.get('messages', ())
+
+    async def _poll_loop(self, session):
+        poll = asyncio.ensure_future(self._request(session, 'GET'))
+        try:
+            while True:
+                status, messages = await poll
+                if status not in (200, 204):
+                    # A 410 means the server has lost our session, & any
+                    # channels we'd joined.
+                    raise LongPollError("Poll failed with {}".format(status))
+
+                # Start the next poll before handling these messages.
+                poll = asyncio.ensure_future(self._request(session, 'GET'))
+                for message_data in messages:
+                    logger.debug("received: %s", message_data)
+                    message = self.serializer.decode(message_data)
+                    self.metrics.message_received(
+                        message.topic, message.event, len(message_data)
+                    )
+                    await self.incoming.put(message)
+        finally:
+            poll.cancel()
+
+    async def _send_loop(self, session):
+        while True:
+            message = await self.outgoing.get()
+            batch = self._fill_batch(message)
+            if not batch:
+                continue
+
+            logger.debug("sending batch of %d", len(batch))
+            if len(batch) == 1:
+                content_type = 'application/json'
+            else:
+                content_type = 'application/x-ndjson'
+            try:
+                if self.rate_limiter is not None:
+                    await self._wait_for_rate_limit(batch)
+                status, _ = await self._request(
+                    session, 'POST',
+                    '\n'.join(message_data for _, message_data in batch),
+                    {'Content-Type': content_type}
+                )
+                if status != 200:
+                    raise LongPollError("Send failed with {}".format(status))
+            except asyncio.CancelledError:
+                # We can't tell whether the server got the POST, & the batch
+                # won't be retried, so fail it rather than cancel it.
+                resolve_sent(batch, ConnectionLost(
+                    "Transport stopped before the batch was sent"
+                ))
+                raise
+            except Exception as e:
+                resolve_sent(batch, e)
+                raise
+
+            for message, message_data in batch:
+                self.metrics.message_sent(
+                    message.message.topic, message.message.event,
+                    len(message_data)
+                )
+            resolve_sent(batch)
+
+    async def _wait_for_rate_limit(self, batch):
+        '''
+        Waits until a batch can be sent without going over the rate limit.
+        '''
+        limiter = self.rate_limiter
+        delay = max(
+            limiter.send_delay(
+                message.message.topic, message.message.event,
+                len(message_data)
+            )
+            for message, message_data in batch
+        )
+        # The whole batch is sent at once, so it waits for its last message,
+        # unless it has a control message in it that shouldn't be held up.
+        if delay and not any(
+            limiter.exempt(message.message.event) for message, _ in batch
+        ):
+            await limiter.wait(delay)
+
+    def _fill_batch(self, message):
+        '''
+        Builds a batch of encoded messages to send.
+
+        :param message: The first message in the batch.
+        :returns:       A list of (message, message_data) tuples.
+        '''
+        batch = []
+        while True:
+            message_data = self._encode(message)
+            if message_data is not None:
+                batch.append((message, message_data))
+
+            if len(batch) >= self.send_batch_size or self.outgoing.empty():
+                break
+            message = self.outgoing.get_nowait()
+
+        return batch
+
+    def _serialize(self, message):
+        message_data = self.serializer.encode(message)
+        if not isinstance(message_data, str):
+            raise ValueError("Long polling can't send binary messages")
+        return message_data
@@ -0,0 +1,254 @@
+from functools import partial
+import json
+import re
+
+from .base import TransportMessage, LazyPayload
+
+__all__ = [
+    'BaseSerializer', 'V1JSONSerializer', 'V2JSONSerializer',
+    'best_json_codec'
+]
+
+
+def best_json_codec():
+    '''
+    Returns the fastest JSON codec that is installed.
+
+    Tries orjson & ujson before falling back to the standard library json
+    module.  The result can be passed as the `json_codec` of a serializer.
+    '''
+    for name in ('orjson', 'ujson'):
+        try:
+            return __import__(name)
+        except ImportError:
+            pass
+    return json
+
+
+class BaseSerializer:
+    '''
+    The base class for a serializer.
+
+    Serializers convert TransportMessages to & from the data that is sent over
+    the wire.
+
+    :param json_codec: The module (or other object) that provides `dumps` &
+                       `loads` functions for JSON.  Defaults to the json
+                       module, but a faster codec can be used if installed.
+                       See best_json_codec.
+    '''
+
+    # The protocol version that should be requested from the server.
+    vsn = None
+
+    def __init__(self, json_codec=json):
+        self.json_codec = json_codec
+        self._loads = json_codec.loads
+        if json_codec is json:
+            # The default separators add whitespace we don't need.
+            self._dumps = partial(json.dumps, separators=(',', ':'))
+        elif isinstance(json_codec.dumps(None), bytes):
+            # Some codecs (e.g. orjson) produce bytes, but phoenix expects
+            # JSON to arrive in text frames.
+            dumps = json_codec.dumps
+            self._dumps = lambda obj: dumps(obj).decode('utf-8')
+        else:
+            self._dumps = json_codec.dumps
+
+    def encode(self, message):
+        '''
+        Encodes a TransportMessage.
+
+        :param message: The TransportMessage to encode.
+        :returns:       The encoded data.
+        '''
+        raise NotImplementedError
+
+    def decode(self, data):
+        '''
+        Decodes some data into a TransportMessage.
+
+        :param data: The data to decode.
+        :returns:    A TransportMessage.
+        '''
+        raise NotImplementedError
+
+
+class V1JSONSerializer(BaseSerializer):
+    '''
+    Implements the phoenix 1.0.0 serializer, which uses JSON objects.
+    '''
+    vsn = '1.0.0'
+
+    def encode(self, message):
+        return self._dumps({
+            'event': message.event,
+            'topic': message.topic,
+            'ref': message.ref,
+            'payload': message.payload
+        })
+
+    def decode(self, data):
+        message_data = self._loads(data)
+        return TransportMessage(
+            message_data['event'],
+            message_data['topic'],
+            message_data['payload'],
+            message_data.get('ref')
+        )
+
+
+# The kinds of binary frame used by the phoenix 2.0.0 serializer.
+BINARY_PUSH = 0
+BINARY_REPLY = 1
+BINARY_BROADCAST = 2
+
+BINARY_TYPES = (bytes, bytearray, memoryview)
+
+
+class V2JSONSerializer(BaseSerializer):
+    '''
+    Implements the phoenix 2.0.0 serializer.
+
+    This sends messages as JSON arrays of
+    `[join_ref, ref, topic, event, payload]`, which are smaller than the
+    objects used by 1.0.0.
+
+    Messages with a bytes-like payload are sent as binary frames, and binary
+    frames from the server are decoded with a memoryview over the received
+    data as their payload, so the payload is never copied.
+
+    :param json_codec: See BaseSerializer.
+    :param lazy:       If True, only the routing fields of incoming JSON
+                       messages are decoded up front.  The payload is left as
+                       a LazyPayload, and decoded when it's first needed.
+    '''
+    vsn = '2.0.0'
+
+    def __init__(self, json_codec=json, lazy=False):
+        super().__init__(json_codec=json_codec)
+        self.lazy = lazy
+
+    def encode(self, message):
+        if isinstance(message.payload, BINARY_TYPES):
+            return self._encode_binary(message)
+
+        return self._dumps([
+            message.join_ref,
+            message.ref,
+            message.topic,
+            message.event,
+            message.payload
+        ])
+
+    def decode(self, data):
+        if isinstance(data, BINARY_TYPES):
+            return self._decode_binary(memoryview(data))
+
+        if self.lazy:
+            return self._decode_lazy(data)
+
+        join_ref, ref, topic, event, payload = self._loads(data)
+        return TransportMessage(event, topic, payload, ref, join_ref)
+
+    def _decode_lazy(self, data):
+        '''
+        Decodes the routing fields of a message, leaving the payload.
+
+        This relies on the payload being the last element of the array: the
+        fields before it are small, so can be matched with a single regex.
+        '''
+        match = _compact_routing_fields(data)
+        if match is not None:
+            join_ref, ref, topic, event = match.groups()
+        else:
+            match = _routing_fields(data)
+            if match is None:
+                raise ValueError("Expected a 5 element JSON array")
+            join_ref, ref, topic, event = [
+                _decode_field(field) for field in match.groups()
+            ]
+        end = data.rindex(']')
+        return TransportMessage(
+            event, topic, LazyPayload(data[match.end():end], self._loads),
+            ref, join_ref
+        )
+
+    def _encode_binary(self, message):
+        fields = [
+            _encode_field(message.join_ref),
+            _encode_field(message.ref),
+            _encode_field(message.topic),
+            _encode_field(message.event)
+        ]
+        header = bytes([BINARY_PUSH] + [len(field) for field in fields])
+        return b''.join([header] + fields + [message.payload])
+
+    def _decode_binary(self, view):
+        kind = view[0]
+        if kind == BINARY_PUSH:
+            join_ref, topic, event, payload = _split_fields(view, 1, 3)
+            return TransportMessage(event, topic, payload, None, join_ref)
+        elif kind == BINARY_REPLY:
+            join_ref, ref, topic, status, payload = _split_fields(view, 1, 4)
+            return TransportMessage(
+                'phx_reply', topic, {'status': status, 'response': payload},
+                ref, join_ref
+            )
+        elif kind == BINARY_BROADCAST:
+            topic, event, payload = _split_fields(view, 1, 2)
+            return TransportMessage(event, topic, payload, None)
+
+        raise ValueError("Unknown binary message kind: {}".format(kind))
+
+
+# Matches the routing fields of a V2 message, as phoenix usually sends them:
+# strings or null, with no whitespace & no escapes.  The groups are the
+# contents of the strings, or None.
+_compact_routing_fields = re.compile(
+    r'\[' + r'(?:"([^"\\]*)"|null),' * 4
+).match
+# Matches the routing fields of any V2 message.  This is quite a bit slower.
+_routing_fields = re.compile(
+    r'\s*\[' + r'\s*(null|"(?:[^"\\]|\\.)*"|-?\d+)\s*,' * 4
+).match
+
+
+def _decode_field(field):
+    if field == 'null':
+        return None
+    elif field[0] != '"':
+        return int(field)
+    elif '\\' in field:
+        return json.loads(field)
+    return field[1:-1]
+
+
+def _encode_field(value):
+    if value is None:
+        return b''
+    field = str(value).encode('utf-8')
+    if len(field) > 255:
+        raise ValueError(
+            "Field too long for a binary message: {}".format(value)
+        )
+    return field
+
+
+def _split_fields(view, start, count):
+    '''
+    Splits the header fields out of a binary message.
+
+    :param view:  A memoryview of the message.
+    :param start: The offset of the first field size.
+    :param count: The number of fields.
+    :returns:     A list of the decoded fields, followed by a memoryview of
+                  the payload.
+    '''
+    offset = start + count
+    fields = []
+    for size in view[start:offset]:
+        fields.append(str(view[offset:offset + size], 'utf-8'))
+        offset += size
+    fields.append(view[offset:])
+    return fields
@@ -1,12 +1,11 @@
 from urllib.parse import urlencode
 import asyncio
-import json
 import logging
 
 import websockets
 
-from .base import BaseTransport, TransportMessage
-from ..utils import get_unless_done, DONE
+from .base import BaseTransport, ConnectionLost, resolve_sent
+from .serializers import V1JSONSerializer
 
 __all__ = ['WebsocketTransport']
 
@@ -16,25 +15,49 @@ logger = logging.getLogger(__name__)
 class WebsocketTransport(BaseTransport):
     '''
     Implements the websocket transport for talking to phoenix servers.
+
+    By default messages are sent one at a time.  If `send_batch_size` is
+    larger than 1 the transport will instead drain any messages that are
+    already waiting on the outgoing queue, write them to the websocket
+    back-to-back, and resolve their `sent` futures together.
+
+    :param send_batch_size:  The maximum number of messages to send in a
+                             single batch.
+    :param send_batch_bytes: Optional limit on the number of encoded bytes in
+                             a single batch.  A batch is closed once it
+                             reaches this size.
+    :param serializer:       The serializer to use for messages.  This also
+                             determines the protocol version requested from
+                             the server.  Defaults to V1JSONSerializer.
+    :param compression:      Optional DeflateCompression options, to
+                             negotiate permessage-deflate compression with
+                             the server.  By default messages are not
+                             compressed.
     '''
-    def __init__(self, url, params, incoming_queue, outgoing_queue):
+    def __init__(self, url, params, incoming_queue, outgoing_queue,
+                 send_batch_size=1, send_batch_bytes=None, serializer=None,
+                 compression=None):
         super().__init__(
             incoming_queue=incoming_queue, outgoing_queue=outgoing_queue
         )
-        qs_params = {'vsn': '1.0.0', **params}
+        if send_batch_size < 1:
+            raise ValueError("send_batch_size must be at least 1")
+
+        self.serializer = serializer or V1JSONSerializer()
+        qs_params = {'vsn': self.serializer.vsn, **params}
         self.url = url + '?' + urlencode(qs_params)
-        print(self.url)
-        self.ready = asyncio.Future()
-        self._done = asyncio.Future()
+        logger.debug("Connecting to %s", self.url)
+        self.send_batch_size = send_batch_size
+        self.send_batch_bytes = send_batch_bytes
+        self.compression = compression
 
     async def run(self):
         try:
-            async with websockets.connect(self.url) as websocket:
+            async with self._connect() as websocket:
                 self.ready.set_result(True)
-                # TODO: Think about error propagation at some point?
-                # If one of these crashes, does it cancel the other?
-                # It should, not sure if it does.
-                await asyncio.gather(
+                if self._stopping:
+                    return
+                await self._run_loops(
                     self._recv_loop(websocket), self._send_loop(websocket)
                 )
         except Exception as e:
@@ -43,53 +66,89 @@ class WebsocketTransport(BaseTransport):
 
             raise
 
-    async def stop(self):
-        self._done.set_result(True)
+    def _connect(self):
+        if self.compression is None:
+            return websockets.connect(self.url, compression=None)
+        return websockets.connect(
+            self.url, compression=None,
+            extensions=[self.compression.extension_factory()]
+        )
 
     async def _recv_loop(self, websocket):
         while True:
-            message_data = await get_unless_done(websocket.recv(), self._done)
-            if message_data is DONE:
-                return
-
+            message_data = await websocket.recv()
             logger.debug("received: %s", message_data)
-            # TODO: This needs updates.
-            message = _load_incoming_message(json.loads(message_data))
+            message = self.serializer.decode(message_data)
+            self.metrics.message_received(
+                message.topic, message.event, len(message_data)
+            )
             await self.incoming.put(message)
             logger.debug("sent")
 
     async def _send_loop(self, websocket):
         while True:
-            message = await get_unless_done(self.outgoing.get(), self._done)
-            if message is DONE:
-                return
+            message = await self.outgoing.get()
+            batch = self._fill_batch(message)
+            if not batch:
+                continue
 
-            logger.debug("sending: %s", message)
+            logger.debug("sending batch of %d", len(batch))
+            sent = 0
             try:
-                # TODO: This needs updates.
-                message_data = json.dumps(
-                    dump_outgoing_message(message.message)
-                )
-                await websocket.send(message_data)
-                message.sent.set_result(True)
+                for message, message_data in batch:
+                    if self.rate_limiter is not None:
+                        delay = self.rate_limiter.send_delay(
+                            message.message.topic, message.message.event,
+                            len(message_data)
+                        )
+                        if delay:
+                            await self.rate_limiter.wait(delay)
+                    await websocket.send(message_data)
+                    sent += 1
+                    self.metrics.message_sent(
+                        message.message.topic, message.message.event,
+                        len(message_data)
+                    )
+            except asyncio.CancelledError:
+                # The rest of the batch is off the queue, so it won't be sent
+                # on a new connection either.  Failing it, rather than
+                # cancelling it, means pushers don't think they were
+                # cancelled themselves.
+                resolve_sent(batch[:sent])
+                resolve_sent(batch[sent:], ConnectionLost(
+                    "Transport stopped before the message was sent"
+                ))
+                raise
             except Exception as e:
-                message.sent.set_exception(e)
+                resolve_sent(batch[sent:], e)
+            resolve_sent(batch[:sent])
             logger.debug("sent")
 
+    def _fill_batch(self, message):
+        '''
+        Builds a batch of encoded messages to send.
 
-def _load_incoming_message(message_data):
-    return TransportMessage(
-        message_data['event'],
-        message_data['topic'],
-        message_data['payload'],
-        message_data.get('ref')
-    )
-
+        Takes any messages that are already waiting on the outgoing queue,
+        up to the configured batch limits.
 
-def dump_outgoing_message(message):
-    return {
-        'event': message.event,
-        'topic': message.topic,
-        'ref': message.ref,
-        'payload': message.payload
-    }
+        :param message: The first message in the batch.
+        :returns:       A list of (message, message_data) tuples.
+        '''
+        batch = []
+        batch_bytes = 0
+        while True:
+            logger.debug("sending: %s", message)
+            message_data = self._encode(message)
+            if message_data is not None:
+                batch.append((message, message_data))
+                batch_bytes += len(message_data)
+
+            if len(batch) >= self.send_batch_size:
+                break
+            if self.send_batch_bytes and batch_bytes >= self.send_batch_bytes:
+                break
+            if self.outgoing.empty():
+                break
+            message = self.outgoing.get_nowait()
+
+        return batch
@@ -1,38 +1,176 @@
-from concurrent.futures import FIRST_COMPLETED
+from collections import deque
+from enum import Enum
 import asyncio
 
-__all__ = ['DONE', 'get_unless_done']
+__all__ = ['OverflowPolicy', 'cancel_task', 'OutgoingQueue']
 
 
-class DONE():
+class OverflowPolicy(Enum):
     '''
-    Singleton that indicates a DONE when returned from get_unless_done.
+    What to do when a bounded queue is full.
     '''
-    pass
+    # Wait until there is space in the queue.
+    block = 'block'
+    # Raise an exception.
+    error = 'error'
+    # Drop the oldest item in the queue to make space.
+    drop_oldest = 'drop_oldest'
+    # Drop the new item.
+    drop_newest = 'drop_newest'
 
 
-# TODO: Tests
-async def get_unless_done(getter_future_or_coro, done_future):
+async def cancel_task(task):
     '''
-    Wraps a get operation & a future that indicates when we should stop
-    getting.
+    Cancels a task & waits for it to finish.
+
+    :params task:   The task to cancel.
+    '''
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
 
-    If the done_future is resolved while waiting for the get, we cancel the get
-    and return DONE.
 
-    :params getter_task_or_coro:   A getter.
-    :params done_future:           A future that indicates we are done.
+class OutgoingQueue(asyncio.Queue):
     '''
-    getter_future = asyncio.ensure_future(getter_future_or_coro)
-    done, pending = await asyncio.wait(
-        (getter_future, done_future),
-        return_when=FIRST_COMPLETED
-    )
-    if done_future in done:
-        if not getter_future.done():
-            getter, = pending
-            getter.cancel()
-
-        return DONE
-
-    return await getter_future
+    A queue of messages waiting to be sent.
+
+    Works like an asyncio.Queue, but has a separate lane for control messages
+    (joins, heartbeats etc.).  Control messages are always got before any
+    other messages, and don't count towards maxsize.
+
+    Other messages can be split into lanes by passing a `lane_key` function,
+    which is called with each message & returns the name of its lane.  Lanes
+    are served in a weighted round robin (deficit round robin), so a backlog
+    in one lane doesn't hold up the others: each time a lane comes round it
+    gets `weight` messages, & fractional weights carry over between rounds.
+    Messages within a lane are got in order.  maxsize applies to the total
+    across all lanes.
+
+    Getting other messages can also be paused, so that only control messages
+    are got until resume is called.
+
+    :param maxsize:      The maximum number of non-control messages.  0
+                         means unlimited.
+    :param lane_key:     Optional function that returns the lane for a
+                         message.  By default every message is in one lane.
+    :param lane_weights: Optional dict of lane -> weight.  Lanes that aren't
+                         in here have a weight of 1.
+    '''
+    def __init__(self, maxsize=0, lane_key=None, lane_weights=None):
+        self.lane_key = lane_key
+        self.lane_weights = dict(lane_weights or {})
+        for lane, weight in self.lane_weights.items():
+            if weight <= 0:
+                raise ValueError(
+                    "Weight for lane {} must be positive".format(lane)
+                )
+        super().__init__(maxsize)
+
+    def _init(self, maxsize):
+        self._control = deque()
+        # lane -> deque of messages.  Lanes are removed when they're empty.
+        self._lanes = {}
+        # The lanes that have messages, in the order they'll be served.  The
+        # lane at the front is the one currently being served.
+        self._active = deque()
+        # lane -> the number of messages the lane can still send this round.
+        self._deficits = {}
+        self._size = 0
+        self._paused = False
+
+    def _put(self, item):
+        lane = self.lane_key(item) if self.lane_key else None
+        messages = self._lanes.get(lane)
+        if messages is None:
+            messages = self._lanes[lane] = deque()
+            self._active.append(lane)
+            self._deficits[lane] = 0
+        messages.append(item)
+        self._size += 1
+
+    def _get(self):
+        if self._control:
+            return self._control.popleft()
+
+        active = self._active
+        deficits = self._deficits
+        lane = active[0]
+        while deficits[lane] < 1:
+            # Start the lane's turn, or skip it if its weight hasn't added
+            # up to a whole message yet.
+            deficits[lane] += self.lane_weights.get(lane, 1)
+            if deficits[lane] >= 1:
+                break
+            active.rotate(-1)
+            lane = active[0]
+
+        messages = self._lanes[lane]
+        item = messages.popleft()
+        self._size -= 1
+        deficits[lane] -= 1
+        if not messages:
+            active.popleft()
+            del self._lanes[lane]
+            del deficits[lane]
+        elif deficits[lane] < 1:
+            active.rotate(-1)
+        return item
+
+    def qsize(self):
+        return self._size + len(self._control)
+
+    def lane_sizes(self):
+        '''
+        Returns a dict of lane -> the number of messages waiting in it, for
+        the lanes that have any.
+        '''
+        return {
+            lane: len(messages) for lane, messages in self._lanes.items()
+        }
+
+    def empty(self):
+        if self._paused:
+            return not self._control
+        return not (self._control or self._size)
+
+    def full(self):
+        if self.maxsize <= 0:
+            return False
+        return self._size >= self.maxsize
+
+    def put_control_nowait(self, item):
+        '''
+        Puts a control message on the queue.
+
+        This never blocks, regardless of maxsize.
+        '''
+        self._control.append(item)
+        self._unfinished_tasks += 1
+        self._finished.clear()
+        self._wakeup_next(self._getters)
+
+    def rewrite(self, func):
+        '''
+        Replaces each queued non-control message with func(message).
+
+        func must not change which lane a message is in.
+        '''
+        for messages in self._lanes.values():
+            for i, message in enumerate(messages):
+                messages[i] = func(message)
+
+    def pause(self):
+        '''
+        Pauses getting anything other than control messages.
+        '''
+        self._paused = True
+
+    def resume(self):
+        '''
+        Resumes getting all messages.
+        '''
+        self._paused = False
+        if self._size:
+            self._wakeup_next(self._getters)
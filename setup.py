@@ -2,7 +2,7 @@
 
 from setuptools import setup, find_packages
 
-REQUIREMENTS = ['websockets']
+REQUIREMENTS = ['websockets>=10.0']
 LONG_DESCRIPTION = '''
 Chunnel
 -----
@@ -21,14 +21,17 @@ setup(
     long_description=LONG_DESCRIPTION,
     author='Graeme Coupar',
     author_email='grambo@grambo.me.uk',
-    packages=find_packages(exclude=['tests']),
+    packages=find_packages(exclude=['benchmarks', 'benchmarks.*', 'test']),
     install_requires=REQUIREMENTS,
+    python_requires='>=3.7',
+    extras_require={'longpoll': ['aiohttp>=3.3']},
     zip_safe=False,
     include_package_data=True,
     classifiers=[
         'Development Status :: 3 - Alpha',
         'Intended Audience :: Developers',
         'License :: OSI Approved :: MIT License',
-        'Programming Language :: Python :: 3.5'
+        'Programming Language :: Python :: 3.7',
+        'Programming Language :: Python :: 3.8'
     ]
 )
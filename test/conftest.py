@@ -4,6 +4,7 @@ import logging
 
 import pytest
 
+from benchmarks.server import PhoenixServer
 from chunnel.socket import Socket
 
 from .shared import TestTransport
@@ -37,3 +38,14 @@ def event_loop():
 def socket(mocker, event_loop):
     mocker.patch.dict(Socket.TRANSPORTS, {'ws': TestTransport})
     return Socket('ws://localhost', sentinel.connect_params)
+
+
+@pytest.yield_fixture
+def server(event_loop):
+    '''
+    Runs a PhoenixServer from benchmarks.server.
+    '''
+    server = PhoenixServer()
+    event_loop.run_until_complete(server.start())
+    yield server
+    event_loop.run_until_complete(server.stop())
@@ -26,6 +26,12 @@ class TestTransport(BaseTransport):
     async def stop(self):
         self._future.set_result(True)
 
+    def fail(self, exception):
+        '''
+        Makes the transport fail, as if the connection had been lost.
+        '''
+        self._future.set_exception(exception)
+
 
 # TODO: Decide if this class is worth it.
 # Currently just used in one place, and quite easy to do a gather w/
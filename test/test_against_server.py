@@ -0,0 +1,58 @@
+'''
+Runs chunnel end to end against the stand-in server in benchmarks.server.
+'''
+import pytest
+
+from chunnel.socket import Socket
+from chunnel.transports import V1JSONSerializer, V2JSONSerializer
+
+
+@pytest.fixture(params=[V1JSONSerializer, V2JSONSerializer])
+def serializer(request):
+    return request.param()
+
+
+def make_socket(server, serializer):
+    return Socket(
+        server.url + '/socket/websocket', {},
+        transport_options={'serializer': serializer}
+    )
+
+
+@pytest.mark.asyncio
+async def test_join_and_ping(server, serializer):
+    async with make_socket(server, serializer) as socket:
+        channel = socket.channel("room:lobby", {'join': 'params'})
+        assert await channel.join() == {'join': 'params'}
+        ping = await channel.push("ping", {"some": "data"})
+        assert await ping.response() == {"some": "data"}
+
+
+@pytest.mark.asyncio
+async def test_join_and_shout(server, serializer):
+    async with make_socket(server, serializer) as socket1:
+        async with make_socket(server, serializer) as socket2:
+            channel1 = socket1.channel("room:lobby", {})
+            channel2 = socket2.channel("room:lobby", {})
+            await channel1.join()
+            await channel2.join()
+            shout_payload = {"hello": "is anybody there?"}
+            await channel1.push("shout", shout_payload)
+
+            incoming = await channel1.receive()
+            assert incoming.payload == shout_payload
+
+            incoming = await channel2.receive()
+            assert incoming.payload == shout_payload
+
+
+@pytest.mark.asyncio
+async def test_broadcasts(server, serializer):
+    async with make_socket(server, serializer) as socket:
+        channel = socket.channel("room:lobby", {'broadcast_count': 250})
+        await channel.join()
+        payloads = []
+        while len(payloads) < 250:
+            messages = await channel.receive_many(250)
+            payloads.extend(message.payload for message in messages)
+        assert payloads == [{'n': n} for n in range(250)]
@@ -3,9 +3,12 @@ import asyncio
 
 import pytest
 
-from chunnel.channel import ChannelJoinFailure, ChannelLeaveFailure
-from chunnel.messages import ChannelEvents
+from chunnel.channel import (
+    ChannelJoinFailure, ChannelLeaveFailure, ChannelOverflow
+)
+from chunnel.messages import ChannelEvents, IncomingMessage
 from chunnel.transports import TransportMessage
+from chunnel.utils import OverflowPolicy
 
 from .shared import set_reply
 
@@ -146,3 +149,174 @@ async def test_reply_to_received_message(socket, channel):
 
     sent_future.set_result(True)
     assert reply_future
+
+
+@pytest.mark.asyncio
+async def test_push_nowait(socket, channel):
+    sent_message = channel.push_nowait(sentinel.event, sentinel.payload)
+    msg, sent_future = socket.transport.outgoing.get_nowait()
+    assert msg.topic == channel.topic
+    assert msg.event == sentinel.event
+    assert msg.payload == sentinel.payload
+    assert sent_message.sent is sent_future
+
+
+def make_incoming(socket, channel, n):
+    return IncomingMessage(
+        TransportMessage('event', channel.topic, n, None), socket
+    )
+
+
+@pytest.mark.parametrize('policy, expected', [
+    (OverflowPolicy.drop_oldest, [2, 3]),
+    (OverflowPolicy.drop_newest, [1, 2]),
+])
+@pytest.mark.asyncio
+async def test_incoming_overflow_drops(socket, policy, expected):
+    channel = socket.channel(
+        "test:bounded", {}, max_incoming=2, incoming_overflow=policy
+    )
+    for n in [1, 2, 3]:
+        channel._put_incoming_nowait(make_incoming(socket, channel, n))
+
+    assert channel.dropped == 1
+    assert [(await channel.receive()).payload for _ in expected] == expected
+
+
+@pytest.mark.asyncio
+async def test_incoming_overflow_error(socket):
+    channel = socket.channel(
+        "test:bounded", {}, max_incoming=1,
+        incoming_overflow=OverflowPolicy.error
+    )
+    for n in [1, 2]:
+        channel._put_incoming_nowait(make_incoming(socket, channel, n))
+
+    with pytest.raises(ChannelOverflow):
+        await channel.receive()
+    assert (await channel.receive()).payload == 1
+    assert channel.dropped == 1
+
+
+@pytest.mark.asyncio
+async def test_slow_channel_doesnt_block_others(socket):
+    slow = socket.channel(
+        "test:slow", {}, max_incoming=1,
+        incoming_overflow=OverflowPolicy.drop_newest
+    )
+    fast = socket.channel("test:fast", {})
+    for _ in range(3):
+        await socket.transport.incoming.put(
+            TransportMessage('event', 'test:slow', {}, None)
+        )
+    await socket.transport.incoming.put(
+        TransportMessage('event', 'test:fast', sentinel.payload, None)
+    )
+    message = await fast.receive()
+    assert message.payload == sentinel.payload
+    assert slow.dropped == 2
+
+
+@pytest.mark.asyncio
+async def test_receive_many(socket, channel):
+    for n in range(5):
+        channel._incoming_messages.put_nowait(
+            make_incoming(socket, channel, n)
+        )
+    messages = await channel.receive_many(3)
+    assert [message.payload for message in messages] == [0, 1, 2]
+    messages = await channel.receive_many(3)
+    assert [message.payload for message in messages] == [3, 4]
+
+
+@pytest.mark.asyncio
+async def test_receive_many_waits_for_a_message(socket, channel):
+    receive_future = asyncio.ensure_future(channel.receive_many(3))
+    await asyncio.sleep(0)
+    assert not receive_future.done()
+
+    await socket.transport.incoming.put(
+        TransportMessage('event', channel.topic, sentinel.payload, None)
+    )
+    messages = await receive_future
+    assert [message.payload for message in messages] == [sentinel.payload]
+
+
+@pytest.mark.asyncio
+async def test_receive_many_timeout(socket, channel):
+    assert await channel.receive_many(3, timeout=0.01) == []
+
+
+@pytest.mark.asyncio
+async def test_async_iteration(socket, channel):
+    for n in range(3):
+        channel._incoming_messages.put_nowait(
+            make_incoming(socket, channel, n)
+        )
+    payloads = []
+    async for message in channel:
+        payloads.append(message.payload)
+        if len(payloads) == 3:
+            break
+    assert payloads == [0, 1, 2]
+
+
+@pytest.mark.asyncio
+async def test_event_handlers(socket, channel):
+    handled = []
+    channel.on('event', handled.append)
+    for event in ['event', 'other_event', 'event']:
+        await socket.transport.incoming.put(
+            TransportMessage(event, channel.topic, sentinel.payload, None)
+        )
+    while len(handled) < 2:
+        await asyncio.sleep(0)
+
+    assert [message.event for message in handled] == ['event', 'event']
+    assert channel._incoming_messages.empty()
+
+
+@pytest.mark.asyncio
+async def test_coroutine_event_handlers(socket, channel):
+    handled = asyncio.Future()
+
+    async def handler(message):
+        handled.set_result(message.payload)
+
+    channel.on('event', handler)
+    await socket.transport.incoming.put(
+        TransportMessage('event', channel.topic, sentinel.payload, None)
+    )
+    assert await handled == sentinel.payload
+
+
+@pytest.mark.asyncio
+async def test_failing_event_handler(socket, channel):
+    handled = []
+
+    def failing_handler(message):
+        raise Exception("Handler failed")
+
+    channel.on('event', failing_handler)
+    channel.on('event', handled.append)
+    for _ in range(2):
+        await socket.transport.incoming.put(
+            TransportMessage('event', channel.topic, sentinel.payload, None)
+        )
+    while len(handled) < 2:
+        await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_removing_event_handlers(socket, channel):
+    handled = []
+    channel.on('event', handled.append)
+    channel.off('event', handled.append)
+    assert not channel._handlers
+
+    await socket.transport.incoming.put(
+        TransportMessage('event', channel.topic, sentinel.payload, None)
+    )
+    message = await channel.receive()
+    assert message.payload == sentinel.payload
+    assert not handled
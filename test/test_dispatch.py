@@ -0,0 +1,125 @@
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from unittest.mock import sentinel
+import threading
+import time
+
+import pytest
+
+from chunnel.dispatch import ExecutorDispatcher
+from chunnel.messages import ChannelEvents, IncomingMessage
+from chunnel.transports import TransportMessage
+
+
+def double(event, payload):
+    return payload * 2
+
+
+@pytest.yield_fixture
+def executor():
+    executor = ThreadPoolExecutor(4)
+    yield executor
+    executor.shutdown()
+
+
+@pytest.yield_fixture
+def socket(socket, event_loop):
+    event_loop.run_until_complete(socket.connect())
+    yield socket
+    event_loop.run_until_complete(socket.disconnect())
+
+
+def make_message(socket, topic, payload, ref=None):
+    return IncomingMessage(
+        TransportMessage('event', topic, payload, ref), socket
+    )
+
+
+@pytest.mark.asyncio
+async def test_dispatch_preserves_topic_order(socket, executor):
+    dispatcher = ExecutorDispatcher(executor, max_concurrency=4)
+    handled = []
+
+    def handler(event, payload):
+        # Earlier messages take longer, so would finish last if run
+        # concurrently.
+        time.sleep(0.01 * (5 - payload))
+        handled.append(payload)
+
+    for n in range(5):
+        dispatcher.dispatch(handler, make_message(socket, 'test:topic', n))
+    await dispatcher.drain()
+    assert handled == list(range(5))
+    assert not dispatcher._tails
+
+
+@pytest.mark.asyncio
+async def test_dispatch_limits_concurrency(socket, executor):
+    dispatcher = ExecutorDispatcher(executor, max_concurrency=2)
+    lock = threading.Lock()
+    running = [0]
+    max_running = [0]
+
+    def handler(event, payload):
+        with lock:
+            running[0] += 1
+            max_running[0] = max(max_running[0], running[0])
+        time.sleep(0.01)
+        with lock:
+            running[0] -= 1
+
+    for n in range(8):
+        dispatcher.dispatch(
+            handler, make_message(socket, 'test:{}'.format(n), n)
+        )
+    await dispatcher.drain()
+    assert max_running[0] == 2
+
+
+@pytest.mark.asyncio
+async def test_dispatch_replies_with_result(socket, executor):
+    dispatcher = ExecutorDispatcher(executor)
+    task = dispatcher.dispatch(
+        double, make_message(socket, 'test:topic', 2, sentinel.ref)
+    )
+    reply, sent_future = await socket.transport.outgoing.get()
+    assert reply.event == ChannelEvents.reply.value
+    assert reply.ref == sentinel.ref
+    assert reply.payload == {'status': 'ok', 'response': 4}
+    sent_future.set_result(True)
+    assert await task == 4
+
+
+@pytest.mark.asyncio
+async def test_dispatch_failure_doesnt_block_topic(socket, executor):
+    dispatcher = ExecutorDispatcher(executor)
+
+    def failing_handler(event, payload):
+        raise Exception("Handler failed")
+
+    failed = dispatcher.dispatch(
+        failing_handler, make_message(socket, 'test:topic', 1)
+    )
+    succeeded = dispatcher.dispatch(
+        lambda event, payload: None, make_message(socket, 'test:topic', 2)
+    )
+    await dispatcher.drain()
+    assert failed.exception()
+    assert succeeded.result() is None
+
+
+@pytest.mark.asyncio
+async def test_channel_handler_in_process_pool(socket):
+    executor = ProcessPoolExecutor(1)
+    try:
+        dispatcher = ExecutorDispatcher(executor)
+        channel = socket.channel('test:topic', {})
+        channel.on('event', dispatcher.handler(double))
+        await socket.transport.incoming.put(
+            TransportMessage('event', 'test:topic', memoryview(b'ab'), '1')
+        )
+        reply, sent_future = await socket.transport.outgoing.get()
+        assert reply.payload == {'status': 'ok', 'response': b'abab'}
+        sent_future.set_result(True)
+        await dispatcher.drain()
+    finally:
+        executor.shutdown()
@@ -0,0 +1,187 @@
+import asyncio
+import json
+import uuid
+
+import pytest
+
+from chunnel.socket import Socket, ConnectionLost
+from chunnel.transports import (
+    LongPollTransport, LongPollError, OutgoingTransportMessage,
+    TransportMessage, V2JSONSerializer
+)
+
+web = pytest.importorskip('aiohttp.web')
+
+
+class LongPollServer:
+    '''
+    A minimal phoenix long poll endpoint, that replies to every push with
+    its payload.
+    '''
+    WINDOW = 0.5
+
+    def __init__(self):
+        self.sessions = {}
+        self.posts = []
+        self.polls = 0
+        self.status = None
+        # Cleared to hold up POSTs.
+        self.publishing = asyncio.Event()
+        self.publishing.set()
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_route('GET', '/socket/longpoll', self.poll)
+        app.router.add_route('POST', '/socket/longpoll', self.publish)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, 'localhost', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = 'http://localhost:{}/socket/longpoll'.format(port)
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+    async def poll(self, request):
+        self.polls += 1
+        token = request.query.get('token')
+        if token not in self.sessions:
+            token = str(uuid.uuid4())
+            self.sessions[token] = asyncio.Queue()
+            return web.json_response({'status': 410, 'token': token})
+        if self.status:
+            return web.json_response({'status': self.status})
+
+        queue = self.sessions[token]
+        try:
+            messages = [
+                await asyncio.wait_for(queue.get(), self.WINDOW)
+            ]
+        except asyncio.TimeoutError:
+            return web.json_response({'status': 204, 'token': token})
+        while not queue.empty():
+            messages.append(queue.get_nowait())
+        return web.json_response(
+            {'status': 200, 'token': token, 'messages': messages}
+        )
+
+    async def publish(self, request):
+        await self.publishing.wait()
+        queue = self.sessions[request.query['token']]
+        body = await request.text()
+        self.posts.append((request.content_type, body))
+        for line in body.split('\n'):
+            join_ref, ref, topic, event, payload = json.loads(line)
+            queue.put_nowait(json.dumps([
+                join_ref, ref, topic, 'phx_reply',
+                {'status': 'ok', 'response': payload}
+            ]))
+        return web.json_response({'status': 200})
+
+
+@pytest.yield_fixture
+def server(event_loop):
+    server = LongPollServer()
+    event_loop.run_until_complete(server.start())
+    yield server
+    event_loop.run_until_complete(server.stop())
+
+
+def make_transport(server, **kwargs):
+    return LongPollTransport(
+        server.url, {}, asyncio.Queue(), asyncio.Queue(),
+        serializer=V2JSONSerializer(), **kwargs
+    )
+
+
+def make_message(ref):
+    return OutgoingTransportMessage(
+        TransportMessage('event', 'topic', {'ref': ref}, ref),
+        asyncio.Future()
+    )
+
+
+@pytest.mark.asyncio
+async def test_batches_outgoing_messages(server):
+    transport = make_transport(server, send_batch_size=3)
+    messages = [make_message(str(ref)) for ref in range(5)]
+    for message in messages:
+        transport.outgoing.put_nowait(message)
+    task = asyncio.ensure_future(transport.run())
+    await transport.ready
+
+    received = [await transport.incoming.get() for _ in messages]
+    assert [message.ref for message in received] == [
+        str(ref) for ref in range(5)
+    ]
+    assert all(message.sent.result() for message in messages)
+    assert [
+        (content_type, len(body.split('\n')))
+        for content_type, body in server.posts
+    ] == [('application/x-ndjson', 3), ('application/x-ndjson', 2)]
+
+    await transport.stop()
+    await task
+
+
+@pytest.mark.asyncio
+async def test_cancelled_messages_are_not_sent(server):
+    transport = make_transport(server)
+    messages = [make_message(str(ref)) for ref in range(3)]
+    for message in messages:
+        transport.outgoing.put_nowait(message)
+    messages[1].sent.cancel()
+    task = asyncio.ensure_future(transport.run())
+    await transport.ready
+
+    received = [await transport.incoming.get() for _ in range(2)]
+    assert [message.ref for message in received] == ['0', '2']
+    assert messages[0].sent.result() and messages[2].sent.result()
+
+    await transport.stop()
+    await task
+
+
+@pytest.mark.asyncio
+async def test_stopping_fails_unsent_messages(server):
+    server.publishing.clear()
+    transport = make_transport(server)
+    messages = [make_message(str(ref)) for ref in range(2)]
+    task = asyncio.ensure_future(transport.run())
+    await transport.ready
+    for message in messages:
+        transport.outgoing.put_nowait(message)
+    while not server.sessions or transport.outgoing.qsize():
+        await asyncio.sleep(0.01)
+
+    await transport.stop()
+    await task
+    for message in messages:
+        assert isinstance(message.sent.exception(), ConnectionLost)
+    server.publishing.set()
+
+
+@pytest.mark.asyncio
+async def test_failed_poll_fails_transport(server):
+    transport = make_transport(server)
+    task = asyncio.ensure_future(transport.run())
+    await transport.ready
+    server.status = 410
+
+    with pytest.raises(LongPollError):
+        await task
+
+
+@pytest.mark.asyncio
+async def test_socket_over_long_poll(server):
+    socket = Socket(
+        server.url, {}, transport_options={'serializer': V2JSONSerializer()}
+    )
+    async with socket:
+        assert isinstance(socket.transport, LongPollTransport)
+        channel = socket.channel('room:lobby', {'join': 'params'})
+        assert await channel.join() == {'join': 'params'}
+        ping = await channel.push('ping', {'some': 'data'})
+        assert await ping.response() == {'some': 'data'}
+    assert server.posts[0][0] == 'application/json'
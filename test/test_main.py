@@ -0,0 +1,52 @@
+import asyncio
+
+import pytest
+
+from chunnel.main import parse_args, run_load
+
+
+def test_parse_args_defaults():
+    options = parse_args(['ws://localhost/socket'])
+    assert options.url == 'ws://localhost/socket'
+    assert options.topics == ['room:lobby']
+    assert options.payload == {}
+
+
+def test_parse_args_payload_size():
+    options = parse_args([
+        'ws://localhost/socket', '--payload', '{"a": 1}',
+        '--payload-size', '3'
+    ])
+    assert options.payload == {'a': 1, 'data': 'xxx'}
+
+
+@pytest.mark.asyncio
+async def test_run_load(server, capsys):
+    options = parse_args([
+        server.url + '/socket/websocket', '--clients', '3', '--rate', '50',
+        '--duration', '0.5', '--report-interval', '0.2',
+        '--topic', 'room:{client}', '--topic', 'room:lobby'
+    ])
+    stats = await run_load(options)
+
+    assert stats.connected == 0
+    assert stats.connect_failures == 0
+    assert stats.join_failures == 0
+    assert stats.total.pushes > 30
+    assert stats.total.replies > 30
+    assert stats.total.errors == 0
+    assert stats.total.timeouts == 0
+    assert 'clients 3/3' in capsys.readouterr().out
+
+
+@pytest.mark.asyncio
+async def test_run_load_counts_connect_failures():
+    options = parse_args(['ws://localhost:1/socket', '--clients', '2'])
+    stopping = asyncio.Future()
+    load = asyncio.ensure_future(run_load(options, stopping))
+    await asyncio.sleep(0.2)
+    stopping.set_result(True)
+    stats = await load
+
+    assert stats.connect_failures == 2
+    assert stats.total.pushes == 0
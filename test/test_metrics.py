@@ -0,0 +1,156 @@
+from unittest.mock import sentinel
+import asyncio
+import json
+
+import pytest
+
+from chunnel.metrics import Histogram, InMemoryMetrics, Metrics
+from chunnel.socket import Socket
+from chunnel.transports import TransportMessage
+
+from .shared import TestTransport
+from .test_websocket import FakeWebsocket, make_message, make_transport
+
+
+@pytest.fixture
+def metrics():
+    return InMemoryMetrics()
+
+
+@pytest.fixture
+def socket(mocker, event_loop, metrics):
+    mocker.patch.dict(Socket.TRANSPORTS, {'ws': TestTransport})
+    return Socket('ws://localhost', sentinel.params, metrics=metrics)
+
+
+def test_histogram():
+    histogram = Histogram([1, 2, 3])
+    for value in [0.5, 1, 1.5, 2.5, 10]:
+        histogram.observe(value)
+
+    assert histogram.count == 5
+    assert histogram.sum == 15.5
+    assert histogram.counts == [2, 1, 1, 1]
+    assert histogram.percentile(40) == 1
+    assert histogram.percentile(50) == 2
+    assert histogram.percentile(100) == float('inf')
+    assert Histogram().percentile(50) is None
+
+
+def test_socket_defaults_to_noop_metrics(mocker):
+    socket = Socket('ws://localhost', sentinel.params)
+    assert type(socket.metrics) is Metrics
+    assert not socket._time_replies
+
+
+@pytest.mark.asyncio
+async def test_reply_latency_recorded(socket, metrics):
+    async with socket:
+        socket._send_message_nowait('topic', 'event', {})
+        message, sent_future = socket.transport.outgoing.get_nowait()
+        sent_future.set_result(True)
+        assert metrics.snapshot()['gauges']['outstanding_replies'] == 1
+
+        await socket.transport.incoming.put(TransportMessage(
+            'phx_reply', 'topic', {'status': 'ok', 'response': {}},
+            message.ref
+        ))
+        await asyncio.sleep(0.01)
+
+    snapshot = metrics.snapshot()
+    latency = snapshot['reply_latency'][('topic', 'event')]
+    assert latency['count'] == 1
+    assert snapshot['gauges']['outstanding_replies'] == 0
+
+
+@pytest.mark.asyncio
+async def test_reply_latency_includes_blocked_time(mocker, event_loop,
+                                                   metrics):
+    mocker.patch.dict(Socket.TRANSPORTS, {'ws': TestTransport})
+    socket = Socket(
+        'ws://localhost', sentinel.params, metrics=metrics, max_outgoing=1
+    )
+    async with socket:
+        socket._send_message_nowait('topic', 'first', {}, timeout=None)
+        push = asyncio.ensure_future(
+            socket._send_message('topic', 'event', {})
+        )
+        # The push is blocked on the full outgoing queue for a while.
+        await asyncio.sleep(0.05)
+        socket.transport.outgoing.get_nowait().sent.set_result(True)
+        message, sent_future = await socket.transport.outgoing.get()
+        sent_future.set_result(True)
+        await socket.transport.incoming.put(TransportMessage(
+            'phx_reply', 'topic', {'status': 'ok', 'response': {}},
+            message.ref
+        ))
+        await (await push).response()
+
+    latency = metrics.snapshot()['reply_latency'][('topic', 'event')]
+    assert latency['sum'] >= 0.05
+
+
+@pytest.mark.asyncio
+async def test_reply_timeout_not_recorded(socket, metrics):
+    async with socket:
+        sent_message = socket._send_message_nowait(
+            'topic', 'event', {}, timeout=0
+        )
+        with pytest.raises(asyncio.TimeoutError):
+            await sent_message.response()
+        await asyncio.sleep(0)
+
+    assert metrics.snapshot()['reply_latency'] == {}
+
+
+@pytest.mark.asyncio
+async def test_queue_depth_gauges(socket, metrics):
+    async with socket:
+        channel = socket.channel('topic', {})
+        socket._send_message_nowait('topic', 'event', {})
+        channel._incoming_messages.put_nowait(sentinel.message)
+
+        gauges = metrics.snapshot()['gauges']
+        assert gauges['outgoing_queue_depth'] == 1
+        assert gauges['incoming_queue_depth'] == 1
+
+
+def test_shared_metrics_sum_gauges(mocker, metrics):
+    sockets = [
+        Socket('ws://localhost', sentinel.params, metrics=metrics)
+        for _ in range(2)
+    ]
+    for socket in sockets:
+        socket._send_message_nowait('topic', 'event', {})
+
+    assert metrics.snapshot()['gauges']['outgoing_queue_depth'] == 2
+
+
+@pytest.mark.asyncio
+async def test_websocket_transport_counts_messages(metrics):
+    transport = make_transport()
+    transport.metrics = metrics
+    message = make_message(1)
+    transport.outgoing.put_nowait(message)
+    task = asyncio.ensure_future(transport._send_loop(FakeWebsocket()))
+    await message.sent
+    task.cancel()
+
+    data = json.dumps(
+        {'event': 'in', 'topic': 'topic', 'payload': {}, 'ref': None}
+    )
+    transport.serializer.decode = lambda _: TransportMessage(
+        'in', 'topic', {}, None
+    )
+    websocket = asyncio.Queue()
+    websocket.put_nowait(data)
+    websocket.recv = websocket.get
+    recv_task = asyncio.ensure_future(transport._recv_loop(websocket))
+    await transport.incoming.get()
+    recv_task.cancel()
+
+    snapshot = metrics.snapshot()
+    assert snapshot['messages_sent'] == {('topic', 'event'): 1}
+    assert snapshot['bytes_sent'][('topic', 'event')] > 0
+    assert snapshot['messages_received'] == {('topic', 'in'): 1}
+    assert snapshot['bytes_received'] == {('topic', 'in'): len(data)}
@@ -0,0 +1,74 @@
+from collections import Counter
+from unittest.mock import sentinel
+
+import pytest
+
+from chunnel.pool import SocketPool, HashRing
+from chunnel.socket import Socket
+
+from .shared import TestTransport
+
+
+@pytest.fixture
+def pool(mocker, event_loop):
+    mocker.patch.dict(Socket.TRANSPORTS, {'ws': TestTransport})
+    return SocketPool('ws://localhost', sentinel.connect_params, size=4)
+
+
+def test_hash_ring_lookup_is_stable():
+    ring = HashRing(range(4))
+    other_ring = HashRing(range(4))
+    for n in range(100):
+        topic = 'room:{}'.format(n)
+        assert ring.lookup(topic) == other_ring.lookup(topic)
+
+
+def test_hash_ring_spreads_keys():
+    ring = HashRing(range(4))
+    counts = Counter(ring.lookup('room:{}'.format(n)) for n in range(4000))
+    assert set(counts) == {0, 1, 2, 3}
+    assert min(counts.values()) > 500
+
+
+def test_hash_ring_only_moves_keys_of_removed_node():
+    ring = HashRing(range(4))
+    topics = ['room:{}'.format(n) for n in range(1000)]
+    before = {topic: ring.lookup(topic) for topic in topics}
+    ring.remove(3)
+    for topic in topics:
+        if before[topic] != 3:
+            assert ring.lookup(topic) == before[topic]
+        else:
+            assert ring.lookup(topic) != 3
+
+
+def test_hash_ring_empty():
+    with pytest.raises(LookupError):
+        HashRing([]).lookup('room:lobby')
+
+
+@pytest.mark.asyncio
+async def test_pool_connect_and_disconnect(pool):
+    async with pool:
+        assert pool.connected
+        assert len(pool.sockets) == 4
+        assert all(
+            socket.transport.params == sentinel.connect_params
+            for socket in pool.sockets
+        )
+    assert not any(socket.connected for socket in pool.sockets)
+
+
+@pytest.mark.asyncio
+async def test_pool_channels(pool):
+    async with pool:
+        channels = [
+            pool.channel('room:{}'.format(n), sentinel.params)
+            for n in range(20)
+        ]
+        for channel in channels:
+            socket = pool.socket_for(channel.topic)
+            assert channel.socket is socket
+            assert socket.channels[channel.topic] is channel
+        assert len(pool.channels) == 20
+        assert len({channel.socket for channel in channels}) > 1
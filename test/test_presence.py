@@ -0,0 +1,182 @@
+from unittest.mock import sentinel
+import asyncio
+
+import pytest
+
+from chunnel.presence import Presence
+from chunnel.transports import TransportMessage
+
+from .shared import set_reply
+
+
+@pytest.yield_fixture
+def socket(socket, event_loop):
+    event_loop.run_until_complete(socket.connect())
+    yield socket
+    event_loop.run_until_complete(socket.disconnect())
+
+
+@pytest.fixture
+def channel(socket):
+    return socket.channel("room:lobby", {})
+
+
+@pytest.fixture
+def presence(channel):
+    return Presence(channel)
+
+
+@pytest.fixture
+def events(presence):
+    events = []
+    presence.on_join(
+        lambda key, current, joined: events.append(
+            ('join', key, current and _refs(current), _refs(joined))
+        )
+    )
+    presence.on_leave(
+        lambda key, current, left: events.append(
+            ('leave', key, _refs(current), _refs(left))
+        )
+    )
+    presence.on_sync(lambda: events.append('sync'))
+    return events
+
+
+def _refs(presence):
+    return [meta['phx_ref'] for meta in presence['metas']]
+
+
+def metas(*refs):
+    return {'metas': [{'phx_ref': ref} for ref in refs]}
+
+
+async def join(socket, channel):
+    await asyncio.gather(
+        channel.join(),
+        set_reply(socket, None, {'status': 'ok', 'response': {}})
+    )
+
+
+async def receive(socket, channel, event, payload):
+    await socket.transport.incoming.put(
+        TransportMessage(event, channel.topic, payload, None)
+    )
+    while not socket.transport.incoming.empty():
+        await asyncio.sleep(0)
+    await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_state_then_diffs(socket, channel, presence, events):
+    await join(socket, channel)
+    await receive(socket, channel, 'presence_state', {
+        'alice': metas('1'), 'bob': metas('2', '3')
+    })
+    assert len(presence) == 2
+    assert presence.metas('bob') == [{'phx_ref': '2'}, {'phx_ref': '3'}]
+    assert events == [
+        ('join', 'alice', None, ['1']), ('join', 'bob', None, ['2', '3']),
+        'sync'
+    ]
+
+    del events[:]
+    await receive(socket, channel, 'presence_diff', {
+        'joins': {'alice': metas('4'), 'carol': metas('5')},
+        'leaves': {'bob': metas('2', '3')}
+    })
+    assert sorted(presence) == ['alice', 'carol']
+    assert 'bob' not in presence
+    assert presence.metas('alice') == [{'phx_ref': '1'}, {'phx_ref': '4'}]
+    assert presence.metas('bob') == []
+    assert events == [
+        ('join', 'alice', ['1'], ['4']), ('join', 'carol', None, ['5']),
+        ('leave', 'bob', [], ['2', '3']), 'sync'
+    ]
+
+
+@pytest.mark.asyncio
+async def test_diffs_before_state_are_held_back(socket, channel, presence,
+                                                events):
+    await join(socket, channel)
+    await receive(socket, channel, 'presence_diff', {
+        'joins': {'bob': metas('2')}, 'leaves': {'alice': metas('1')}
+    })
+    assert len(presence) == 0
+    assert events == []
+
+    await receive(socket, channel, 'presence_state', {'alice': metas('1')})
+    assert list(presence) == ['bob']
+    assert events == [
+        ('join', 'alice', None, ['1']), ('join', 'bob', None, ['2']),
+        ('leave', 'alice', [], ['1']), 'sync'
+    ]
+
+
+@pytest.mark.asyncio
+async def test_rejoin_state_only_applies_changes(socket, channel, presence,
+                                                 events):
+    await join(socket, channel)
+    await receive(socket, channel, 'presence_state', {
+        'alice': metas('1'), 'bob': metas('2', '3')
+    })
+    alice = presence.get('alice')
+
+    await join(socket, channel)
+    del events[:]
+    await receive(socket, channel, 'presence_state', {
+        'alice': metas('1'), 'bob': metas('3', '4'), 'carol': metas('5')
+    })
+
+    assert presence.get('alice') is alice
+    assert presence.metas('bob') == [{'phx_ref': '3'}, {'phx_ref': '4'}]
+    assert events == [
+        ('join', 'bob', ['2', '3'], ['4']), ('join', 'carol', None, ['5']),
+        ('leave', 'bob', ['3', '4'], ['2']), 'sync'
+    ]
+
+
+@pytest.mark.asyncio
+async def test_rejoin_state_leaves_missing_keys(socket, channel, presence,
+                                                events):
+    await join(socket, channel)
+    await receive(socket, channel, 'presence_state', {
+        'alice': metas('1'), 'bob': metas('2', '3')
+    })
+
+    await join(socket, channel)
+    del events[:]
+    await receive(socket, channel, 'presence_state', {'alice': metas('1')})
+
+    assert list(presence) == ['alice']
+    assert events == [('leave', 'bob', [], ['2', '3']), 'sync']
+
+
+@pytest.mark.asyncio
+async def test_presence_events_not_queued(socket, channel, presence):
+    await join(socket, channel)
+    await receive(socket, channel, 'presence_state', {'alice': metas('1')})
+    await receive(socket, channel, 'event', sentinel.payload)
+
+    message = await channel.receive()
+    assert message.event == 'event'
+    assert channel._incoming_messages.empty()
+
+
+@pytest.mark.asyncio
+async def test_handlers_called_for_presence_events(socket, channel, presence):
+    handled = []
+    channel.on('presence_state', handled.append)
+    await join(socket, channel)
+    await receive(socket, channel, 'presence_state', {'alice': metas('1')})
+
+    assert 'alice' in presence
+    assert [message.payload for message in handled] == [
+        {'alice': metas('1')}
+    ]
+
+
+def test_list(channel, presence):
+    presence._sync_diff({'joins': {'alice': metas('1'), 'bob': metas('2')}})
+    assert presence.list() == [metas('1'), metas('2')]
+    assert presence.list(lambda key, _: key) == ['alice', 'bob']
@@ -0,0 +1,112 @@
+import pytest
+
+from chunnel.ratelimit import TokenBucket, RateLimit, RateLimiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def test_bucket_allows_bursts_up_to_capacity():
+    clock = FakeClock()
+    bucket = TokenBucket(10, 5, clock)
+    assert [bucket.take() for _ in range(5)] == [0] * 5
+    assert bucket.take() == pytest.approx(0.1)
+    assert bucket.take() == pytest.approx(0.2)
+
+
+def test_bucket_refills_over_time():
+    clock = FakeClock()
+    bucket = TokenBucket(10, 5, clock)
+    for _ in range(6):
+        bucket.take()
+    assert bucket.delay() == pytest.approx(0.1)
+
+    clock.now = 0.1
+    assert bucket.delay() == 0
+    clock.now = 10
+    bucket.take(0)
+    assert bucket.tokens == 5
+
+
+def test_bucket_allows_amounts_over_capacity():
+    clock = FakeClock()
+    bucket = TokenBucket(100, 50, clock)
+    assert bucket.take(250) == pytest.approx(2)
+
+
+def test_socket_limit():
+    clock = FakeClock()
+    limiter = RateLimiter(
+        RateLimit(messages_per_second=2, bytes_per_second=100), clock=clock
+    )
+    assert limiter.send_delay('a', 'event', 10) == 0
+    assert limiter.send_delay('b', 'event', 10) == 0
+    assert limiter.send_delay('a', 'event', 10) == pytest.approx(0.5)
+    # The byte limit is the tighter one here.
+    assert limiter.send_delay('a', 'event', 170) == pytest.approx(1)
+    assert limiter.stats.messages == 4
+
+
+def test_control_messages_are_not_delayed():
+    clock = FakeClock()
+    limiter = RateLimiter(
+        RateLimit(messages_per_second=1, bytes_per_second=100), clock=clock
+    )
+    assert limiter.send_delay('a', 'event', 10) == 0
+    assert limiter.send_delay('phoenix', 'heartbeat', 10) == 0
+    assert limiter.send_delay('a', 'phx_reply', 10) == 0
+    # But they still count towards the limit.
+    assert limiter.send_delay('a', 'event', 10) == pytest.approx(3)
+
+
+def test_topic_limit_is_per_topic():
+    clock = FakeClock()
+    limiter = RateLimiter(
+        topic_limit=RateLimit(messages_per_second=1), clock=clock
+    )
+    assert limiter.topic_delay('a') == 0
+    assert limiter.topic_delay('a') == pytest.approx(1)
+    assert limiter.topic_delay('b') == 0
+    # Without a socket wide limit, sending is never delayed.
+    assert limiter.send_delay('a', 'event', 1000) == 0
+
+
+def test_topic_byte_limit_delays_next_push():
+    clock = FakeClock()
+    limiter = RateLimiter(
+        topic_limit=RateLimit(bytes_per_second=100), clock=clock
+    )
+    assert limiter.topic_delay('a') == 0
+    limiter.send_delay('a', 'event', 300)
+    assert limiter.topic_delay('a') == pytest.approx(2)
+    assert limiter.topic_delay('b') == 0
+
+
+def test_idle_topic_buckets_are_removed():
+    clock = FakeClock()
+    limiter = RateLimiter(
+        topic_limit=RateLimit(messages_per_second=1), clock=clock
+    )
+    for n in range(1000):
+        limiter.topic_delay('busy')
+        limiter.topic_delay('topic:{}'.format(n))
+        clock.now += 0.01
+    assert len(limiter._topic_buckets) <= 2 * 100
+    # Buckets that are still refilling are kept.
+    assert limiter.topic_delay('busy') > 0
+
+
+@pytest.mark.asyncio
+async def test_wait_records_stats():
+    limiter = RateLimiter(RateLimit(messages_per_second=100))
+    await limiter.wait(0.01)
+    await limiter.wait(0.02)
+    assert limiter.stats.delayed == 2
+    assert limiter.stats.wait_time == pytest.approx(0.03)
+    assert limiter.stats.max_wait == 0.02
+    assert limiter.stats.waits.count == 2
@@ -0,0 +1,158 @@
+import json
+
+import pytest
+
+from chunnel.transports import (
+    TransportMessage, V1JSONSerializer, V2JSONSerializer, LazyPayload
+)
+
+
+class BytesJSON:
+    '''
+    A JSON codec that returns bytes from dumps, like orjson.
+    '''
+    @staticmethod
+    def dumps(obj):
+        return json.dumps(obj).encode('utf-8')
+
+    loads = staticmethod(json.loads)
+
+
+def test_v1_encode():
+    message = TransportMessage('event', 'room:lobby', {'a': 1}, 2, 1)
+    assert json.loads(V1JSONSerializer().encode(message)) == {
+        'event': 'event', 'topic': 'room:lobby', 'payload': {'a': 1}, 'ref': 2
+    }
+
+
+def test_v1_decode():
+    data = json.dumps({
+        'event': 'event', 'topic': 'room:lobby', 'payload': {'a': 1},
+        'ref': None
+    })
+    assert V1JSONSerializer().decode(data) == TransportMessage(
+        'event', 'room:lobby', {'a': 1}, None
+    )
+
+
+def test_v2_encode():
+    message = TransportMessage('event', 'room:lobby', {'a': 1}, 2, 1)
+    assert json.loads(V2JSONSerializer().encode(message)) == [
+        1, 2, 'room:lobby', 'event', {'a': 1}
+    ]
+
+
+def test_v2_decode():
+    data = '["1", "2", "room:lobby", "event", {"a": 1}]'
+    assert V2JSONSerializer().decode(data) == TransportMessage(
+        'event', 'room:lobby', {'a': 1}, '2', '1'
+    )
+
+
+@pytest.mark.parametrize('serializer_class', [
+    V1JSONSerializer, V2JSONSerializer
+])
+def test_bytes_json_codec_produces_text(serializer_class):
+    serializer = serializer_class(json_codec=BytesJSON)
+    message = TransportMessage('event', 'room:lobby', {'a': 1}, 2, 1)
+    data = serializer.encode(message)
+    assert isinstance(data, str)
+    assert serializer.decode(data).payload == {'a': 1}
+
+
+def test_v2_encode_binary():
+    message = TransportMessage('event', 'room:lobby', b'\x00\x01', '12', '1')
+    data = V2JSONSerializer().encode(message)
+    assert data == (
+        b'\x00\x01\x02\x0a\x05' + b'112room:lobbyevent' + b'\x00\x01'
+    )
+
+
+@pytest.mark.parametrize('payload', [
+    b'\x00\x01', bytearray(b'\x00\x01'), memoryview(b'\x00\x01')
+])
+def test_v2_encode_binary_types(payload):
+    message = TransportMessage('event', 'room:lobby', payload, '12', '1')
+    data = V2JSONSerializer().encode(message)
+    assert data.endswith(b'\x00\x01')
+
+
+def test_v2_encode_binary_field_too_long():
+    message = TransportMessage('event', 'a' * 256, b'', '12', '1')
+    with pytest.raises(ValueError):
+        V2JSONSerializer().encode(message)
+
+
+def test_v2_decode_binary_push():
+    data = b'\x00\x01\x0a\x05' + b'1room:lobbyevent' + b'\x00\x01'
+    message = V2JSONSerializer().decode(data)
+    assert message.event == 'event'
+    assert message.topic == 'room:lobby'
+    assert message.join_ref == '1'
+    assert message.ref is None
+    assert isinstance(message.payload, memoryview)
+    assert message.payload == b'\x00\x01'
+
+
+def test_v2_decode_binary_reply():
+    data = b'\x01\x01\x02\x0a\x02' + b'112room:lobbyok' + b'\x00\x01'
+    message = V2JSONSerializer().decode(data)
+    assert message.event == 'phx_reply'
+    assert message.topic == 'room:lobby'
+    assert message.ref == '12'
+    assert message.join_ref == '1'
+    assert message.payload['status'] == 'ok'
+    assert message.payload['response'] == b'\x00\x01'
+
+
+def test_v2_decode_binary_broadcast():
+    data = bytearray(b'\x02\x0a\x05' + b'room:lobbyevent' + b'\x00\x01')
+    message = V2JSONSerializer().decode(data)
+    assert message.event == 'event'
+    assert message.topic == 'room:lobby'
+    assert message.ref is None
+    assert message.payload == b'\x00\x01'
+
+    # The payload is a view over the received data, not a copy.
+    data[-1] = 2
+    assert message.payload == b'\x00\x02'
+
+
+def test_v2_decode_binary_unknown_kind():
+    with pytest.raises(ValueError):
+        V2JSONSerializer().decode(b'\x07')
+
+
+@pytest.mark.parametrize('data', [
+    '["1","2","room:lobby","event",{"a":[1,2]}]',
+    ' [ null , 2 ,\n"room:lobby", "event" , {"a": [1, 2]} ] ',
+])
+def test_v2_decode_lazy(data):
+    message = V2JSONSerializer(lazy=True).decode(data)
+    assert message.topic == 'room:lobby'
+    assert message.event == 'event'
+    assert isinstance(message.payload, LazyPayload)
+    assert message.payload.load() == {'a': [1, 2]}
+
+
+def test_v2_decode_lazy_doesnt_decode_payload(mocker):
+    loads = mocker.Mock()
+    codec = mocker.Mock(dumps=json.dumps, loads=loads)
+    message = V2JSONSerializer(json_codec=codec, lazy=True).decode(
+        '["1","2","room:lobby","event",{"a":1}]'
+    )
+    assert message.ref == '2'
+    assert message.join_ref == '1'
+    assert not loads.called
+
+    message.payload.load()
+    loads.assert_called_once_with('{"a":1}')
+
+
+@pytest.mark.parametrize('data', [
+    '{"topic": "room:lobby"}',
+    '["1","2","room:lobby"]',
+])
+def test_v2_decode_lazy_invalid(data):
+    with pytest.raises(ValueError):
+        V2JSONSerializer(lazy=True).decode(data)
@@ -1,11 +1,18 @@
 from unittest.mock import sentinel
 import asyncio
+import json
 
 import pytest
 
-from chunnel.transports import TransportMessage
+from chunnel.messages import ChannelEvents, ReplyTimeout
+from chunnel.ratelimit import RateLimit
+from chunnel.socket import (
+    Socket, OutgoingQueueFull, HeartbeatTimeout, ConnectionLost
+)
+from chunnel.transports import TransportMessage, LazyPayload
+from chunnel.utils import OverflowPolicy
 
-from .shared import TestTransport, TestSender
+from .shared import TestTransport, TestSender, set_reply
 
 
 @pytest.mark.asyncio
@@ -92,3 +99,408 @@ async def test_channel_messages_routed_correctly(socket):
         message = await channel.receive()
         assert message.event == sentinel.event
         assert message.payload == sentinel.payload
+
+
+@pytest.mark.asyncio
+async def test_send_message_nowait(socket):
+    async with socket:
+        sent_message = socket._send_message_nowait(
+            sentinel.topic, sentinel.event, sentinel.payload
+        )
+        assert socket.transport.outgoing.qsize() == 1
+        assert not sent_message.sent.done()
+
+        message, sent_future = socket.transport.outgoing.get_nowait()
+        assert message.event == sentinel.event
+        sent_future.set_result(True)
+        assert await sent_message.sent
+
+
+@pytest.mark.asyncio
+async def test_send_message_nowait_when_full(mocker, event_loop):
+    mocker.patch.dict(Socket.TRANSPORTS, {'ws': TestTransport})
+    socket = Socket('ws://localhost', sentinel.params, max_outgoing=1)
+    async with socket:
+        socket._send_message_nowait(sentinel.topic, sentinel.event, {})
+        with pytest.raises(OutgoingQueueFull):
+            socket._send_message_nowait(sentinel.topic, sentinel.event, {})
+        assert len(socket._response_futures) == 1
+
+
+@pytest.mark.asyncio
+async def test_send_message_when_full_errors(mocker, event_loop):
+    mocker.patch.dict(Socket.TRANSPORTS, {'ws': TestTransport})
+    socket = Socket(
+        'ws://localhost', sentinel.params, max_outgoing=1,
+        outgoing_overflow=OverflowPolicy.error
+    )
+    async with socket:
+        socket._send_message_nowait(sentinel.topic, sentinel.event, {})
+        with pytest.raises(OutgoingQueueFull):
+            await socket._send_message(sentinel.topic, sentinel.event, {})
+
+
+@pytest.mark.asyncio
+async def test_send_message_when_full_blocks(mocker, event_loop):
+    mocker.patch.dict(Socket.TRANSPORTS, {'ws': TestTransport})
+    socket = Socket('ws://localhost', sentinel.params, max_outgoing=1)
+    async with socket:
+        socket._send_message_nowait(sentinel.topic, sentinel.event, {})
+        send_future = asyncio.ensure_future(
+            socket._send_message(sentinel.topic, sentinel.event, {})
+        )
+        await asyncio.sleep(0)
+        assert socket.transport.outgoing.qsize() == 1
+
+        _, sent_future = socket.transport.outgoing.get_nowait()
+        sent_future.set_result(True)
+        await asyncio.sleep(0)
+        assert socket.transport.outgoing.qsize() == 1
+        assert not send_future.done()
+
+        _, sent_future = socket.transport.outgoing.get_nowait()
+        sent_future.set_result(True)
+        await send_future
+
+
+@pytest.mark.asyncio
+async def test_reply_timeout(socket):
+    async with socket:
+        sent_message = socket._send_message_nowait(
+            sentinel.topic, sentinel.event, {}, timeout=0.01
+        )
+        assert socket.outstanding_replies == 1
+        with pytest.raises(ReplyTimeout):
+            await sent_message.response()
+        assert socket.outstanding_replies == 0
+        assert not socket._reply_deadlines
+
+
+@pytest.mark.asyncio
+async def test_replies_remove_outstanding(socket):
+    async with socket:
+        sender = TestSender(sentinel.topic, sentinel.event, sentinel.payload)
+        sender.set_reply({'status': 'ok', 'response': sentinel.response})
+        sent_message = await sender.send(socket)
+        assert await sent_message.response() == sentinel.response
+        assert socket.outstanding_replies == 0
+
+
+@pytest.mark.asyncio
+async def test_cancelled_response_removes_outstanding(socket):
+    async with socket:
+        sent_message = socket._send_message_nowait(
+            sentinel.topic, sentinel.event, {}
+        )
+        assert socket.outstanding_replies == 1
+        sent_message._response_future.cancel()
+        await asyncio.sleep(0)
+        assert socket.outstanding_replies == 0
+
+
+@pytest.mark.asyncio
+async def test_sending_reply_does_not_expect_reply(socket):
+    async with socket:
+        socket._send_message_nowait(
+            sentinel.topic, ChannelEvents.reply.value, {}, ref=sentinel.ref
+        )
+        assert socket.outstanding_replies == 0
+
+
+@pytest.mark.asyncio
+async def test_reply_deadlines_are_compacted(socket):
+    async with socket:
+        for _ in range(200):
+            sent_message = socket._send_message_nowait(
+                sentinel.topic, sentinel.event, {}
+            )
+            sent_message._response_future.cancel()
+            await asyncio.sleep(0)
+        assert socket.outstanding_replies == 0
+        assert len(socket._reply_deadlines) <= 65
+
+
+@pytest.mark.asyncio
+async def test_lazy_payloads(socket):
+    async with socket:
+        channel = socket.channel("test:topic", sentinel.channel_params)
+        await socket.transport.incoming.put(TransportMessage(
+            sentinel.event, "test:other_topic",
+            LazyPayload('{"unrouted": 1}', pytest.fail), sentinel.ref
+        ))
+        await socket.transport.incoming.put(TransportMessage(
+            sentinel.event, "test:topic",
+            LazyPayload('{"routed": 1}', json.loads), sentinel.ref
+        ))
+        message = await channel.receive()
+        assert message.payload == {'routed': 1}
+
+
+@pytest.mark.asyncio
+async def test_lazy_reply_payloads(socket):
+    async with socket:
+        sent_message = socket._send_message_nowait(
+            sentinel.topic, sentinel.event, {}
+        )
+        msg, _ = socket.transport.outgoing.get_nowait()
+        await socket.transport.incoming.put(TransportMessage(
+            'phx_reply', sentinel.topic,
+            LazyPayload('{"status": "ok", "response": 1}', json.loads),
+            msg.ref
+        ))
+        assert await sent_message.response() == 1
+
+
+@pytest.mark.asyncio
+async def test_heartbeats(mocker, event_loop):
+    mocker.patch.dict(Socket.TRANSPORTS, {'ws': TestTransport})
+    socket = Socket('ws://localhost', sentinel.params, heartbeat_interval=0.01)
+    async with socket:
+        assert socket.heartbeat_rtt is None
+        await set_reply(socket, 'phoenix', {'status': 'ok', 'response': {}})
+        await asyncio.sleep(0.001)
+        assert socket.heartbeat_rtt is not None
+        assert len(socket.heartbeat_rtts) == 1
+
+
+@pytest.mark.asyncio
+async def test_heartbeat_message(mocker, event_loop):
+    mocker.patch.dict(Socket.TRANSPORTS, {'ws': TestTransport})
+    socket = Socket('ws://localhost', sentinel.params, heartbeat_interval=0.01)
+    async with socket:
+        message, _ = await socket.transport.outgoing.get()
+        assert message.topic == 'phoenix'
+        assert message.event == 'heartbeat'
+        assert message.payload == {}
+
+
+@pytest.mark.asyncio
+async def test_missed_heartbeat(mocker, event_loop):
+    mocker.patch.dict(Socket.TRANSPORTS, {'ws': TestTransport})
+    socket = Socket(
+        'ws://localhost', sentinel.params, heartbeat_interval=0.01,
+        reconnect=False
+    )
+    async with socket:
+        sent_message = socket._send_message_nowait(
+            sentinel.topic, sentinel.event, {}
+        )
+        await asyncio.sleep(0.05)
+        assert socket._transport_task.cancelled()
+        with pytest.raises(HeartbeatTimeout):
+            await socket._check_transport()
+        with pytest.raises(HeartbeatTimeout):
+            await sent_message.response()
+
+
+async def wait_for_new_transport(socket, old_transport):
+    while socket.transport is old_transport or not socket._transport_task:
+        await asyncio.sleep(0)
+    await socket.transport.ready
+
+
+@pytest.mark.asyncio
+async def test_reconnect_rejoins_and_flushes(mocker, event_loop):
+    mocker.patch.dict(Socket.TRANSPORTS, {'ws': TestTransport})
+    socket = Socket('ws://localhost', sentinel.params, reconnect_delay=0)
+    async with socket:
+        channel = socket.channel("test:lobby", sentinel.channel_params)
+        await asyncio.gather(
+            channel.join(),
+            set_reply(socket, None, {'status': 'ok', 'response': {}})
+        )
+        old_transport = socket.transport
+        old_transport.fail(Exception("Connection lost"))
+        push_future = asyncio.ensure_future(
+            channel.push(sentinel.event, sentinel.payload)
+        )
+
+        await wait_for_new_transport(socket, old_transport)
+        assert socket.reconnects == 1
+
+        # The rejoin should be sent before the buffered push.
+        message, sent_future = await socket.transport.outgoing.get()
+        assert message.event == ChannelEvents.join.value
+        assert message.payload == sentinel.channel_params
+        assert socket.transport.outgoing.empty()
+        sent_future.set_result(True)
+        await socket.transport.incoming.put(TransportMessage(
+            'phx_reply', "test:lobby", {'status': 'ok', 'response': {}},
+            message.ref
+        ))
+
+        message, sent_future = await socket.transport.outgoing.get()
+        assert message.event == sentinel.event
+        # The buffered push is sent with the new join's ref.
+        assert message.join_ref == channel._join_ref
+        sent_future.set_result(True)
+        await push_future
+
+
+@pytest.mark.asyncio
+async def test_lost_connection_fails_outstanding_replies(mocker, event_loop):
+    mocker.patch.dict(Socket.TRANSPORTS, {'ws': TestTransport})
+    socket = Socket('ws://localhost', sentinel.params, reconnect=False)
+    async with socket:
+        sent_message = socket._send_message_nowait(
+            sentinel.topic, sentinel.event, {}
+        )
+        socket.transport.fail(Exception("Connection lost"))
+        with pytest.raises(ConnectionLost):
+            await sent_message.response()
+
+
+@pytest.mark.asyncio
+async def test_lost_connection_keeps_unsent_replies(mocker, event_loop):
+    mocker.patch.dict(Socket.TRANSPORTS, {'ws': TestTransport})
+    socket = Socket('ws://localhost', sentinel.params, reconnect_delay=0)
+    async with socket:
+        sent_message = socket._send_message_nowait('topic', 'sent', {})
+        unsent_message = socket._send_message_nowait('topic', 'unsent', {})
+        _, sent_future = socket.transport.outgoing.get_nowait()
+        sent_future.set_result(True)
+
+        old_transport = socket.transport
+        old_transport.fail(Exception("Connection lost"))
+        with pytest.raises(ConnectionLost):
+            await sent_message.response()
+        await wait_for_new_transport(socket, old_transport)
+        assert socket.outstanding_replies == 1
+
+        # The unsent push is flushed on the new connection & replied to.
+        await set_reply(socket, 'topic', {'status': 'ok', 'response': 1})
+        assert await unsent_message.response() == 1
+
+
+@pytest.mark.asyncio
+async def test_lost_connection_during_heartbeat(mocker, event_loop):
+    mocker.patch.dict(Socket.TRANSPORTS, {'ws': TestTransport})
+    socket = Socket(
+        'ws://localhost', sentinel.params, heartbeat_interval=0.01,
+        reconnect=False
+    )
+    await socket.connect()
+    message, sent_future = await socket.transport.outgoing.get()
+    assert message.event == 'heartbeat'
+    sent_future.set_result(True)
+    socket.transport.fail(Exception("Connection lost"))
+    await asyncio.sleep(0.001)
+    assert socket._heartbeat_task is None
+    await socket.disconnect()
+
+
+@pytest.mark.asyncio
+async def test_subscriptions(socket):
+    async with socket:
+        channel = socket.channel('room:lobby', {})
+        rooms = socket.subscribe('room:*')
+        lobbies = socket.subscribe('room:*:lobby')
+        for topic in ['room:lobby', 'room:eu:lobby', 'prices:AAPL']:
+            await socket.transport.incoming.put(
+                TransportMessage('event', topic, {'topic': topic}, None)
+            )
+
+        assert [m.topic for m in await rooms.receive_many(10)] == [
+            'room:lobby', 'room:eu:lobby'
+        ]
+        assert [m.topic for m in await lobbies.receive_many(10)] == [
+            'room:eu:lobby'
+        ]
+        assert [m.topic for m in await channel.receive_many(10)] == [
+            'room:lobby'
+        ]
+
+        rooms.unsubscribe()
+        await socket.transport.incoming.put(
+            TransportMessage('event', 'room:lobby', {}, None)
+        )
+        await channel.receive()
+        assert rooms._incoming_messages.empty()
+
+
+@pytest.mark.asyncio
+async def test_join_many(socket):
+    async with socket:
+        topics = [('room:{}'.format(n), {'n': n}) for n in range(10)]
+        join_many = asyncio.ensure_future(
+            socket.join_many(topics, max_in_flight=3)
+        )
+
+        max_outstanding = 0
+        for _ in topics:
+            message, sent_future = await socket.transport.outgoing.get()
+            await asyncio.sleep(0)
+            max_outstanding = max(
+                max_outstanding, 1 + socket.transport.outgoing.qsize()
+            )
+            assert message.event == ChannelEvents.join.value
+            sent_future.set_result(True)
+            status = 'error' if message.topic == 'room:5' else 'ok'
+            await socket.transport.incoming.put(TransportMessage(
+                'phx_reply', message.topic,
+                {'status': status, 'response': message.payload}, message.ref
+            ))
+
+        results = await join_many
+        assert max_outstanding == 3
+        assert sorted(results.channels) == sorted(
+            topic for topic, _ in topics if topic != 'room:5'
+        )
+        assert results.channels['room:1'].joined
+        assert results.responses['room:1'] == {'n': 1}
+        assert list(results.failures) == ['room:5']
+
+
+@pytest.mark.asyncio
+async def test_topic_rate_limit(mocker, event_loop):
+    mocker.patch.dict(Socket.TRANSPORTS, {'ws': TestTransport})
+    socket = Socket(
+        'ws://localhost', sentinel.params,
+        topic_rate_limit=RateLimit(messages_per_second=20, burst=0)
+    )
+    async with socket:
+        assert socket.transport.rate_limiter is socket.rate_limiter
+        pushes = [
+            asyncio.ensure_future(socket._send_message(topic, 'event', {}))
+            for topic in ('a', 'a', 'b')
+        ]
+        await asyncio.sleep(0.01)
+        # The second push to a has to wait, but b isn't held up by it.
+        queued = socket.transport.outgoing
+        assert [queued.get_nowait()[0].topic for _ in range(2)] == ['a', 'b']
+        assert queued.empty()
+
+        message, sent_future = await queued.get()
+        assert message.topic == 'a'
+        assert socket.rate_limiter.stats.delayed == 1
+        for push in pushes:
+            push.cancel()
+        await asyncio.wait(pushes)
+
+
+@pytest.mark.asyncio
+async def test_outgoing_lanes(mocker, event_loop):
+    mocker.patch.dict(Socket.TRANSPORTS, {'ws': TestTransport})
+    socket = Socket(
+        'ws://localhost', sentinel.params, lane_weights={'bulk': 2}
+    )
+    async with socket:
+        bulk = socket.channel('bulk:1', {}, lane='bulk')
+        socket.channel('bulk:2', {}, lane='bulk')
+        chat = socket.channel('chat', {})
+        assert chat.lane == 'chat'
+
+        for n in range(3):
+            bulk.push_nowait('event', {})
+            socket._send_message_nowait('bulk:2', 'event', {})
+        chat.push_nowait('event', {})
+        socket._send_message_nowait(
+            'chat', ChannelEvents.reply.value, {}, ref='1'
+        )
+
+        queue = socket.transport.outgoing
+        assert queue.lane_sizes() == {'bulk': 6, 'chat': 1}
+        topics = [queue.get_nowait()[0].topic for _ in range(4)]
+        # The reply goes first, then chat gets its turn after 2 bulk
+        # messages.
+        assert topics == ['chat', 'bulk:1', 'bulk:2', 'chat']
@@ -0,0 +1,71 @@
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import threading
+
+import pytest
+
+from benchmarks.server import PhoenixServer
+from chunnel.sync import SyncSocket
+
+
+@pytest.yield_fixture
+def thread_server():
+    '''
+    Runs a PhoenixServer on its own thread, as the sync API blocks the
+    calling thread.
+    '''
+    loop = asyncio.new_event_loop()
+    server = PhoenixServer()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    asyncio.run_coroutine_threadsafe(server.start(), loop).result()
+    yield server
+    asyncio.run_coroutine_threadsafe(server.stop(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
+
+
+@pytest.yield_fixture
+def socket(thread_server):
+    socket = SyncSocket(thread_server.url + '/socket/websocket', {})
+    with socket:
+        yield socket
+    assert not socket.connected
+
+
+def test_join_and_push_from_threads(socket):
+    channel = socket.channel('room:lobby', {'join': 'params'})
+    assert channel.join() == {'join': 'params'}
+
+    def push(n):
+        return channel.push('ping', {'n': n}).result(timeout=2)
+
+    with ThreadPoolExecutor(8) as executor:
+        responses = list(executor.map(push, range(200)))
+    assert responses == [{'n': n} for n in range(200)]
+
+
+def test_receive_many(socket):
+    channel = socket.channel('room:lobby', {'broadcast_count': 250})
+    channel.join()
+    payloads = []
+    while len(payloads) < 250:
+        messages = channel.receive_many(100, timeout=2)
+        assert 0 < len(messages) <= 100
+        payloads.extend(message.payload for message in messages)
+    assert payloads == [{'n': n} for n in range(250)]
+    assert channel.receive(timeout=0.01) is None
+
+
+def test_buffer_limit(socket):
+    channel = socket.channel(
+        'room:lobby', {'broadcast_count': 100}, max_buffered=10
+    )
+    channel.join()
+    payloads = []
+    while len(payloads) < 100:
+        messages = channel.receive_many(100, timeout=2)
+        assert 0 < len(messages) <= 10
+        payloads.extend(message.payload for message in messages)
+    assert payloads == [{'n': n} for n in range(100)]
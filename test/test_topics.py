@@ -0,0 +1,54 @@
+import pytest
+
+from chunnel.topics import TopicTrie
+
+
+@pytest.fixture
+def trie():
+    trie = TopicTrie()
+    for pattern in ['room:*', 'room:eu:*', 'room:*:lobby', 'room:lobby',
+                    'prices:*', '*']:
+        trie.add(pattern, pattern)
+    return trie
+
+
+@pytest.mark.parametrize('topic,expected', [
+    ('room:lobby', ['*', 'room:*', 'room:lobby']),
+    ('room:eu:lobby', ['*', 'room:*', 'room:eu:*', 'room:*:lobby']),
+    ('room:eu:other', ['*', 'room:*', 'room:eu:*']),
+    ('room', ['*']),
+    ('prices:AAPL', ['*', 'prices:*']),
+    ('other:topic', ['*']),
+])
+def test_match(trie, topic, expected):
+    assert sorted(trie.match(topic)) == sorted(expected)
+
+
+def test_remove(trie):
+    trie.remove('room:*:lobby', 'room:*:lobby')
+    trie.remove('*', '*')
+    assert sorted(trie.match('room:eu:lobby')) == ['room:*', 'room:eu:*']
+    assert len(trie) == 4
+
+    with pytest.raises(KeyError):
+        trie.remove('room:*:lobby', 'room:*:lobby')
+    with pytest.raises(KeyError):
+        trie.remove('unknown:*', 'unknown:*')
+
+
+def test_remove_prunes_nodes():
+    trie = TopicTrie()
+    trie.add('a:b:c', 1)
+    trie.add('a:*', 2)
+    trie.remove('a:b:c', 1)
+    assert list(trie._root.children['a'].children) == []
+    trie.remove('a:*', 2)
+    assert trie._root.children == {}
+
+
+def test_multiple_values_for_pattern():
+    trie = TopicTrie()
+    trie.add('room:*', 1)
+    trie.add('room:*', 2)
+    assert trie.match('room:lobby') == [1, 2]
+    assert sorted(trie) == [1, 2]
@@ -2,31 +2,105 @@ import asyncio
 
 import pytest
 
-from chunnel.utils import get_unless_done, DONE
+from chunnel.utils import OutgoingQueue
 
 
 @pytest.mark.asyncio
-async def test_get_unless_done_getting():
-    queue = asyncio.Queue()
-    await queue.put(1)
-    await queue.put(2)
-    future = asyncio.Future()
-    assert await get_unless_done(queue.get(), future) == 1
-    assert await get_unless_done(queue.get(), future) == 2
+async def test_outgoing_queue_control_messages_first():
+    queue = OutgoingQueue()
+    queue.put_nowait(1)
+    queue.put_control_nowait(2)
+    queue.put_nowait(3)
+    assert queue.qsize() == 3
+    assert [await queue.get() for _ in range(3)] == [2, 1, 3]
 
 
 @pytest.mark.asyncio
-async def test_get_unless_done_when_done():
-    queue = asyncio.Queue()
-    future = asyncio.Future()
-    future.set_result(True)
-    assert await get_unless_done(queue.get(), future) is DONE
+async def test_outgoing_queue_control_messages_ignore_maxsize():
+    queue = OutgoingQueue(1)
+    queue.put_nowait(1)
+    assert queue.full()
+    queue.put_control_nowait(2)
+    with pytest.raises(asyncio.QueueFull):
+        queue.put_nowait(3)
 
 
 @pytest.mark.asyncio
-async def test_get_unless_done_when_done_and_queue():
-    queue = asyncio.Queue()
-    future = asyncio.Future()
-    future.set_result(True)
-    await queue.put(1)
-    assert await get_unless_done(queue.get(), future) is DONE
+async def test_outgoing_queue_pause():
+    queue = OutgoingQueue()
+    queue.pause()
+    queue.put_nowait(1)
+    assert queue.empty()
+
+    getter = asyncio.ensure_future(queue.get())
+    await asyncio.sleep(0)
+    assert not getter.done()
+
+    queue.put_control_nowait(2)
+    assert await getter == 2
+
+    getter = asyncio.ensure_future(queue.get())
+    await asyncio.sleep(0)
+    assert not getter.done()
+    queue.resume()
+    assert await getter == 1
+
+
+def lane_queue(**kwargs):
+    return OutgoingQueue(lane_key=lambda item: item[0], **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_outgoing_queue_lanes_take_turns():
+    queue = lane_queue()
+    for n in range(3):
+        queue.put_nowait(('a', n))
+    queue.put_nowait(('b', 0))
+    queue.put_nowait(('b', 1))
+    queue.put_control_nowait(('control', 0))
+    assert queue.lane_sizes() == {'a': 3, 'b': 2}
+
+    assert [await queue.get() for _ in range(6)] == [
+        ('control', 0), ('a', 0), ('b', 0), ('a', 1), ('b', 1), ('a', 2)
+    ]
+    assert queue.empty()
+    assert queue.lane_sizes() == {}
+
+
+@pytest.mark.asyncio
+async def test_outgoing_queue_lane_weights():
+    queue = lane_queue(lane_weights={'a': 2, 'c': 0.5})
+    for lane in 'abc':
+        for n in range(4):
+            queue.put_nowait((lane, n))
+
+    got = [(await queue.get())[0] for _ in range(12)]
+    # c only gets a turn every other round, until the other lanes are empty.
+    assert ''.join(got) == 'aab' 'aabc' 'bbccc'
+
+
+def test_outgoing_queue_lane_weights_must_be_positive():
+    with pytest.raises(ValueError):
+        lane_queue(lane_weights={'a': 0})
+
+
+@pytest.mark.asyncio
+async def test_outgoing_queue_maxsize_covers_all_lanes():
+    queue = lane_queue(maxsize=2)
+    queue.put_nowait(('a', 0))
+    queue.put_nowait(('b', 0))
+    assert queue.full()
+    with pytest.raises(asyncio.QueueFull):
+        queue.put_nowait(('c', 0))
+
+
+@pytest.mark.asyncio
+async def test_outgoing_queue_rewrite():
+    queue = lane_queue()
+    queue.put_nowait(('a', 0))
+    queue.put_nowait(('b', 0))
+    queue.put_control_nowait(('control', 0))
+    queue.rewrite(lambda item: (item[0], item[1] + 1))
+    assert [await queue.get() for _ in range(3)] == [
+        ('control', 0), ('a', 1), ('b', 1)
+    ]
@@ -0,0 +1,211 @@
+import asyncio
+import json
+
+import pytest
+import websockets
+
+from chunnel.ratelimit import RateLimit, RateLimiter
+from chunnel.socket import ConnectionLost
+from chunnel.transports import (
+    WebsocketTransport, TransportMessage, OutgoingTransportMessage,
+    V2JSONSerializer, DeflateCompression
+)
+
+
+class FakeWebsocket:
+    '''
+    Stands in for a websockets connection, recording everything sent.
+    '''
+    def __init__(self, fail_after=None):
+        self.sent = []
+        self.fail_after = fail_after
+
+    async def send(self, data):
+        if self.fail_after is not None and len(self.sent) >= self.fail_after:
+            raise Exception("Send failed")
+        self.sent.append(data)
+
+
+def make_transport(**kwargs):
+    return WebsocketTransport(
+        'ws://localhost', {}, asyncio.Queue(), asyncio.Queue(), **kwargs
+    )
+
+
+def make_message(ref):
+    return OutgoingTransportMessage(
+        TransportMessage('event', 'topic', {'ref': ref}, ref),
+        asyncio.Future()
+    )
+
+
+async def run_send_loop(transport, websocket, messages):
+    for message in messages:
+        transport.outgoing.put_nowait(message)
+    task = asyncio.ensure_future(transport._send_loop(websocket))
+    await asyncio.wait([m.sent for m in messages])
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+
+@pytest.mark.asyncio
+async def test_send_loop_sends_messages_in_order():
+    transport = make_transport(send_batch_size=4)
+    websocket = FakeWebsocket()
+    messages = [make_message(ref) for ref in range(10)]
+
+    await run_send_loop(transport, websocket, messages)
+
+    assert [json.loads(data)['ref'] for data in websocket.sent] == list(
+        range(10)
+    )
+    assert all(message.sent.result() for message in messages)
+
+
+@pytest.mark.asyncio
+async def test_send_batch_respects_size_limit():
+    transport = make_transport(send_batch_size=3)
+    for ref in range(1, 5):
+        transport.outgoing.put_nowait(make_message(ref))
+
+    batch = transport._fill_batch(make_message(0))
+    assert [message.message.ref for message, _ in batch] == [0, 1, 2]
+    assert transport.outgoing.qsize() == 2
+
+
+@pytest.mark.asyncio
+async def test_send_batch_respects_byte_limit():
+    transport = make_transport(send_batch_size=100, send_batch_bytes=1)
+    transport.outgoing.put_nowait(make_message(1))
+
+    batch = transport._fill_batch(make_message(0))
+    assert len(batch) == 1
+    assert transport.outgoing.qsize() == 1
+
+
+@pytest.mark.asyncio
+async def test_send_failure_fails_rest_of_batch():
+    transport = make_transport(send_batch_size=4)
+    websocket = FakeWebsocket(fail_after=2)
+    messages = [make_message(ref) for ref in range(4)]
+
+    await run_send_loop(transport, websocket, messages)
+
+    assert [m.sent.exception() is None for m in messages] == [
+        True, True, False, False
+    ]
+
+
+@pytest.mark.asyncio
+async def test_send_loop_applies_rate_limit():
+    transport = make_transport(send_batch_size=4)
+    transport.rate_limiter = RateLimiter(
+        RateLimit(messages_per_second=100, burst=0.02)
+    )
+    websocket = FakeWebsocket()
+    messages = [make_message(ref) for ref in range(4)]
+
+    await run_send_loop(transport, websocket, messages)
+
+    assert len(websocket.sent) == 4
+    stats = transport.rate_limiter.stats
+    assert stats.messages == 4
+    assert stats.delayed == 2
+    assert stats.wait_time == pytest.approx(0.02, abs=0.005)
+
+
+@pytest.mark.asyncio
+async def test_send_loop_skips_cancelled_messages():
+    transport = make_transport(send_batch_size=4)
+    websocket = FakeWebsocket()
+    messages = [make_message(ref) for ref in range(3)]
+    messages[1].sent.cancel()
+
+    await run_send_loop(transport, websocket, messages)
+
+    assert [json.loads(data)['ref'] for data in websocket.sent] == [0, 2]
+    assert messages[0].sent.result() and messages[2].sent.result()
+
+
+class BlockingWebsocket(FakeWebsocket):
+    '''
+    A websocket where sends never complete.
+    '''
+    async def send(self, data):
+        await asyncio.Future()
+
+
+@pytest.mark.asyncio
+async def test_cancelling_send_loop_fails_unsent_messages():
+    transport = make_transport(send_batch_size=4)
+    messages = [make_message(ref) for ref in range(2)]
+    for message in messages:
+        transport.outgoing.put_nowait(message)
+
+    task = asyncio.ensure_future(transport._send_loop(BlockingWebsocket()))
+    await asyncio.sleep(0)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    for message in messages:
+        assert isinstance(message.sent.exception(), ConnectionLost)
+
+
+def test_url_includes_serializer_vsn():
+    transport = make_transport(serializer=V2JSONSerializer())
+    assert 'vsn=2.0.0' in transport.url
+
+    transport = make_transport()
+    assert 'vsn=1.0.0' in transport.url
+
+
+async def echo(websocket, *args):
+    async for message in websocket:
+        await websocket.send(message)
+
+
+@pytest.mark.asyncio
+async def test_compression():
+    server = await websockets.serve(echo, 'localhost', 0)
+    port = next(iter(server.sockets)).getsockname()[1]
+    compression = DeflateCompression(min_size=100)
+    transport = WebsocketTransport(
+        'ws://localhost:{}'.format(port), {}, asyncio.Queue(),
+        asyncio.Queue(), compression=compression
+    )
+    task = asyncio.ensure_future(transport.run())
+    try:
+        await transport.ready
+        messages = [
+            make_message('small'),
+            OutgoingTransportMessage(
+                TransportMessage('event', 'topic', {'x': 'y' * 1000}, 'big'),
+                asyncio.Future()
+            )
+        ]
+        for message in messages:
+            transport.outgoing.put_nowait(message)
+        received = [await transport.incoming.get() for _ in messages]
+        assert [message.ref for message in received] == ['small', 'big']
+        assert received[1].payload == {'x': 'y' * 1000}
+    finally:
+        await transport.stop()
+        await task
+        server.close()
+        await server.wait_closed()
+
+    stats = compression.stats
+    assert stats.messages_sent == 2
+    assert stats.messages_sent_uncompressed == 1
+    assert stats.messages_received == 2
+    assert stats.sent_ratio < 0.2
+    assert stats.received_ratio < 0.2
+    assert stats.bytes_sent_before == stats.bytes_received_before
+
+
+def test_compression_not_negotiated_by_default(mocker):
+    connect = mocker.patch('websockets.connect')
+    make_transport()._connect()
+    assert connect.call_args[1] == {'compression': None}